@@ -0,0 +1,331 @@
+"""
+推薦 JSON API（asyncio，僅使用標準函式庫）：供輔導系統、LINE bot 等程式呼叫，不經過 Streamlit。
+資料集常駐於行程內（CatalogStore，programs.csv 變動時自動重新載入），並共用推薦結果快取。
+設定 RECOMMENDER_DEMAND_ANALYTICS=1 時，每次推薦也計入需求統計（demand.py）。
+
+端點：
+  • GET  /health               → {"status": "ok", "catalog_version", "programs"}
+  • POST /recommend            → 單一學生的推薦（請求本文為 user_input，格式與網頁介面相同）
+  • POST /recommend/batch      → {"students": [user_input, ...]} → {"results": [...]}（同序）
+  • POST /reasons              → {"user_input": ..., "program_ids": [...]} → {"reasons": [...]}
+  • POST /search               → {"query": "台灣大學 外國", "user_input": ...（可省略）} → {"results": [...]}（含分類）
+
+user_input 範例：
+  {"scores": {"國文": 13, "英文": 12}, "interests": ["資訊"], "school": "全部學校",
+   "strategy_allocation": {"保守型": 2, "務實型": 2, "夢幻型": 2}, "optimize": false}
+級分為 0–15 的整數；school 需為資料集中的學校或「全部學校」；志願分配總和需為 6（與網頁介面相同，
+未指定的類型為 2 個）。
+
+推薦計算在工作執行緒中執行（最多 API_WORKERS 個同時進行），事件迴圈只處理連線，
+大批次請求不會延遲 /health 等其他請求；批次端點每次最多 MAX_BATCH_SIZE（1000）位學生。
+
+用法：
+  python api_server.py --port 8600
+"""
+import os
+import json
+import asyncio
+import logging
+import argparse
+from http import HTTPStatus
+from concurrent.futures import ThreadPoolExecutor
+
+import demand
+import recommender
+
+logger = logging.getLogger(__name__)
+
+API_HOST = os.environ.get("RECOMMENDER_API_HOST", "127.0.0.1")
+API_PORT = int(os.environ.get("RECOMMENDER_API_PORT", 8600))
+
+# 單次請求本文上限與批次學生數上限
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_BATCH_SIZE = 1000
+
+# 執行推薦計算的工作執行緒數
+API_WORKERS = int(os.environ.get("RECOMMENDER_API_WORKERS", min(4, os.cpu_count() or 1)))
+
+# 志願總數（與網頁介面相同）
+TOTAL_ASPIRATIONS = 6
+
+# 推薦結果快取筆數上限（與網頁介面相同）
+RECOMMENDATION_CACHE_SIZE = 1024
+
+DEFAULT_ALLOCATION = {"保守型": 2, "務實型": 2, "夢幻型": 2}
+
+class BadRequest(Exception):
+    """請求內容錯誤（回應 400）"""
+
+def parse_user_input(payload, catalog):
+    """驗證並正規化 user_input；科目可用全名（國文）或簡稱（國），學校需存在於 catalog"""
+    if not isinstance(payload, dict):
+        raise BadRequest("user_input 必須是 JSON 物件")
+    raw_scores = payload.get("scores") or {}
+    if not isinstance(raw_scores, dict):
+        raise BadRequest("scores 必須是 {科目: 級分} 物件")
+    scores = {}
+    for subject, value in raw_scores.items():
+        subject = recommender.SUBJECT_MAPPING.get(subject, subject)
+        if subject not in recommender.SUBJECT_INDEX:
+            raise BadRequest(f"未知的科目：{subject}")
+        if (
+            not isinstance(value, (int, float)) or isinstance(value, bool)
+            or not float(value).is_integer() or not 0 <= value <= 15
+        ):
+            raise BadRequest(f"{subject} 的級分必須是 0–15 的整數")
+        scores[subject] = int(value)
+
+    interests = payload.get("interests") or []
+    if not isinstance(interests, list) or not all(isinstance(g, str) for g in interests):
+        raise BadRequest("interests 必須是字串陣列")
+
+    school = payload.get("school") or "全部學校"
+    if not isinstance(school, str) or school not in catalog["school_list"]:
+        raise BadRequest(f"未知的學校：{school}")
+
+    raw_allocation = payload.get("strategy_allocation") or {}
+    if not isinstance(raw_allocation, dict):
+        raise BadRequest("strategy_allocation 必須是 {志願類型: 志願數} 物件")
+    allocation = dict(DEFAULT_ALLOCATION)
+    for stype, count in raw_allocation.items():
+        if stype not in allocation:
+            raise BadRequest(f"未知的志願類型：{stype}")
+        if not isinstance(count, int) or isinstance(count, bool) or not 0 <= count <= TOTAL_ASPIRATIONS:
+            raise BadRequest(f"{stype} 的志願數必須是 0–{TOTAL_ASPIRATIONS} 的整數")
+        allocation[stype] = count
+    if sum(allocation.values()) != TOTAL_ASPIRATIONS:
+        raise BadRequest(f"志願分配總和必須為 {TOTAL_ASPIRATIONS}（目前為 {sum(allocation.values())}）")
+
+    return {
+        "scores": scores,
+        "selected_subjects": list(scores),
+        "interests": interests,
+        "school": school,
+        "strategy_allocation": allocation,
+        "optimize": bool(payload.get("optimize", False)),
+    }
+
+class RecommendationService:
+    """HTTP 之外的推薦邏輯：資料集、快取與 JSON 結果組裝"""
+
+    def __init__(self, store, cache_size=RECOMMENDATION_CACHE_SIZE, demand_counters=None):
+        self.store = store
+        self.cache = recommender.RecommendationCache(maxsize=cache_size)
+        self.demand_counters = demand_counters
+
+    def health(self):
+        catalog = self.store.current()
+        return {"status": "ok", "catalog_version": catalog["version"], "programs": len(catalog["programs"])}
+
+    def recommend(self, payload):
+        catalog = self.store.current()
+        return self._recommend(catalog, parse_user_input(payload, catalog))
+
+    def recommend_batch(self, payload):
+        students = payload.get("students") if isinstance(payload, dict) else None
+        if not isinstance(students, list):
+            raise BadRequest("請求本文必須是 {\"students\": [...]}")
+        if len(students) > MAX_BATCH_SIZE:
+            raise BadRequest(f"單次最多 {MAX_BATCH_SIZE} 位學生")
+        # 整批使用同一版本的資料集
+        catalog = self.store.current()
+        results = []
+        for student in students:
+            try:
+                results.append(self._recommend(catalog, parse_user_input(student, catalog)))
+            except BadRequest as e:
+                results.append({"error": str(e)})
+        return {"catalog_version": catalog["version"], "results": results}
+
+    def reasons(self, payload):
+        if not isinstance(payload, dict):
+            raise BadRequest("請求本文必須是 JSON 物件")
+        catalog = self.store.current()
+        user_input = parse_user_input(payload.get("user_input"), catalog)
+        program_ids = payload.get("program_ids")
+        if not isinstance(program_ids, list) or not all(
+            isinstance(pid, int) and not isinstance(pid, bool) and 0 <= pid < len(catalog["programs"])
+            for pid in program_ids
+        ):
+            raise BadRequest("program_ids 必須是有效科系 id 的陣列")
+        reasons = recommender.generate_reasons(catalog, program_ids, user_input)
+        return {
+            "catalog_version": catalog["version"],
+            "reasons": [{"id": pid, **reason} for pid, reason in zip(program_ids, reasons)],
+        }
+
+    def search(self, payload):
+        if not isinstance(payload, dict) or not isinstance(payload.get("query"), str):
+            raise BadRequest("請求本文必須是 {\"query\": \"...\"}")
+        catalog = self.store.current()
+        program_ids = recommender.search_programs(catalog, payload["query"])
+        user_input = parse_user_input(payload["user_input"], catalog) if payload.get("user_input") else None
+        labels = recommender.classify_programs(catalog, program_ids, user_input["scores"]) if user_input else None
+        programs = catalog["programs"]
+        results = []
+        for row, pid in enumerate(program_ids):
+            program = programs[pid]
+            entry = {
+                "id": pid,
+                "program_name": program.program_name,
+                "school": program.school,
+                "dept": program.dept,
+                "group": program.group,
+            }
+            if labels is not None:
+                entry["classification"] = labels[row]
+            results.append(entry)
+        return {"catalog_version": catalog["version"], "results": results}
+
+    def _recommend(self, catalog, user_input):
+        result = self.cache.get_or_compute(catalog, user_input)
+        if self.demand_counters is not None:
+            self.demand_counters.record(catalog, result)
+        programs = catalog["programs"]
+        recommendations = {}
+        for stype, items in result["recommendations"].items():
+            recommendations[stype] = []
+            for item in items:
+                program = programs[item["id"]]
+                entry = {
+                    "id": item["id"],
+                    "program_name": program.program_name,
+                    "school": program.school,
+                    "dept": program.dept,
+                    "group": program.group,
+                    "summary": item["reason"]["summary"],
+                    "details": item["reason"]["details"],
+                }
+                if "probability" in item:
+                    entry["probability"] = item["probability"]
+                recommendations[stype].append(entry)
+        return {
+            "catalog_version": catalog["version"],
+            "recommendations": recommendations,
+            "pool_sizes": {stype: pool["size"] for stype, pool in result["pools"].items()},
+            "warnings": result["warnings"],
+            "missing_subjects": result["missing_subjects_log"],
+        }
+
+class ApiServer:
+    """
+    極簡 HTTP/1.1 伺服器（支援 keep-alive）；/health 直接在事件迴圈中回應，
+    其餘端點在工作執行緒中計算，批次請求不會阻擋其他連線
+    """
+
+    def __init__(self, service, workers=API_WORKERS):
+        self.service = service
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api-worker")
+        self.inline_routes = {("GET", "/health")}
+        self.routes = {
+            ("GET", "/health"): lambda payload: service.health(),
+            ("POST", "/recommend"): service.recommend,
+            ("POST", "/recommend/batch"): service.recommend_batch,
+            ("POST", "/reasons"): service.reasons,
+            ("POST", "/search"): service.search,
+        }
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "無效的請求"}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length_header = headers.get("content-length") or "0"
+                if not (length_header.isascii() and length_header.isdigit()):
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {"error": "無效的 Content-Length"}, keep_alive=False)
+                    break
+                length = int(length_header)
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "請求本文過大"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                keep_alive = (headers.get("connection", "").lower() != "close") and version == "HTTP/1.1"
+
+                path = path.split("?", 1)[0]
+                if (method, path) in self.inline_routes:
+                    status, response = self.dispatch(method, path, body)
+                else:
+                    loop = asyncio.get_running_loop()
+                    status, response = await loop.run_in_executor(self.executor, self.dispatch, method, path, body)
+                await self._respond(writer, status, response, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def dispatch(self, method, path, body):
+        """路由並執行，回傳 (狀態碼, JSON 物件)"""
+        handler = self.routes.get((method, path))
+        if handler is None:
+            known_path = any(route_path == path for _, route_path in self.routes)
+            status = HTTPStatus.METHOD_NOT_ALLOWED if known_path else HTTPStatus.NOT_FOUND
+            return status, {"error": f"{method} {path} 不存在"}
+        try:
+            payload = json.loads(body) if body else None
+            return HTTPStatus.OK, handler(payload)
+        except json.JSONDecodeError as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"JSON 格式錯誤：{str(e)}"}
+        except BadRequest as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        except Exception as e:
+            logger.exception(f"處理 {method} {path} 時出錯")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"伺服器錯誤：{str(e)}"}
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+async def serve(host=API_HOST, port=API_PORT, catalog_path=recommender.PROGRAMS_CSV_PATH):
+    store = recommender.CatalogStore(catalog_path)
+    store.start_watching()
+    demand_counters = None
+    if demand.DEMAND_ANALYTICS:
+        demand_counters = demand.DemandCounters()
+        demand_counters.start_flushing()
+    api = ApiServer(RecommendationService(store, demand_counters=demand_counters))
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    logger.info(f"推薦 API 已啟動：http://{host}:{port}（{len(store.current()['programs'])} 個科系）")
+    async with server:
+        await server.serve_forever()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="學測志願推薦 JSON API")
+    parser.add_argument("--host", default=API_HOST, help="綁定位址（預設僅本機）")
+    parser.add_argument("--port", type=int, default=API_PORT, help="埠號")
+    parser.add_argument("--catalog", default=recommender.PROGRAMS_CSV_PATH, help="校系資料 CSV")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # 引擎的逐筆請求日誌（候選池大小等）在 API 模式下過於冗長
+    logging.getLogger("recommender").setLevel(logging.ERROR)
+    try:
+        asyncio.run(serve(args.host, args.port, args.catalog))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
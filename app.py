@@ -1,151 +1,29 @@
 import streamlit as st
-import pandas as pd
-import ast
+import os
 import uuid
-import copy
+import hashlib
 import logging
+import numpy as np
+import recommender
+import history
+import warmup
+import session_metrics
+import session_store
+from instrumentation import METRICS, should_log_payload
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 科目名稱映射表
-SUBJECT_MAPPING = {
-    '國': '國文',
-    '英': '英文',
-    '數A': '數學 A',
-    '數B': '數學 B',
-    '社': '社會',
-    '自': '自然'
-}
-
 # 在檔案最上面或 load config 時定義
 SHOW_DEBUG_WARNINGS = False
 
-# 推薦理由範本庫（量化描述）
-REASON_TEMPLATES = {
-    "工程": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強數理或面試準備。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
-    },
-    "管理": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議準備校系特色項目。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他管理科系。"
-    },
-    "文史哲": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強背景知識準備。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議探索其他相關科系。"
-    },
-    "醫藥衛生": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議強化專業科目。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
-    },
-    "資訊": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議提前準備程式基礎。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他資訊科系。"
-    },
-    "生物資源": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議準備相關實務能力。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
-    },
-    "外語": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強語言能力準備。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他外語科系。"
-    },
-    "default": {
-        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
-        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強準備校系特色。",
-        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
-    }
-}
-
-# 內建測試資料（包含 school 和 dept）
-DEFAULT_PROGRAMS = [
-    {
-        "program_name": "世新大學 企業管理學系",
-        "expanded_score_dict": "{'國': 12, '社': 12}",
-        "group": "管理",
-        "school": "世新大學",
-        "dept": "企業管理學系"
-    },
-    {
-        "program_name": "世新大學 傳播管理學系",
-        "expanded_score_dict": "{'國': 11}",
-        "group": "管理",
-        "school": "世新大學",
-        "dept": "傳播管理學系"
-    },
-    {
-        "program_name": "世新大學 行政管理學系",
-        "expanded_score_dict": "{'英': 10, '社': 10}",
-        "group": "管理",
-        "school": "世新大學",
-        "dept": "行政管理學系"
-    },
-    {
-        "program_name": "世新大學 財務金融學系",
-        "expanded_score_dict": "{'數B': 10, '社': 10}",
-        "group": "管理",
-        "school": "世新大學",
-        "dept": "財務金融學系"
-    },
-    {
-        "program_name": "銘傳大學 應用中文與華語文教",
-        "expanded_score_dict": "{'國': 10, '英': 10}",
-        "group": "文史哲",
-        "school": "銘傳大學",
-        "dept": "應用中文與華語文教"
-    },
-    {
-        "program_name": "世新大學 數位多媒體設計學系",
-        "expanded_score_dict": "{'國': 11}",
-        "group": "藝術",
-        "school": "世新大學",
-        "dept": "數位多媒體設計學系"
-    },
-    {
-        "program_name": "某大學 醫學系",
-        "expanded_score_dict": "{'國': 14, '英': 14, '數A': 14, '自': 14}",
-        "group": "醫藥衛生",
-        "school": "某大學",
-        "dept": "醫學系"
-    },
-    {
-        "program_name": "某大學 護理學系",
-        "expanded_score_dict": "{'英': 13, '自': 13}",
-        "group": "醫藥衛生",
-        "school": "某大學",
-        "dept": "護理學系"
-    },
-    {
-        "program_name": "某大學 資訊工程學系",
-        "expanded_score_dict": "{'數A': 12, '自': 12}",
-        "group": "資訊",
-        "school": "某大學",
-        "dept": "資訊工程學系"
-    },
-    {
-        "program_name": "某大學 生物資源學系",
-        "expanded_score_dict": "{'自': 11, '數A': 11}",
-        "group": "生物資源",
-        "school": "某大學",
-        "dept": "生物資源學系"
-    },
-    {
-        "program_name": "國立臺灣大學 外國語文學系",
-        "expanded_score_dict": "{'國': 13, '英': 13}",
-        "group": "外語",
-        "school": "國立臺灣大學",
-        "dept": "外國語文學系"
-    }
-]
+# 學測科目（輸入表單的勾選順序）
+SUBJECT_OPTIONS = ["國文", "英文", "數學 A", "數學 B", "社會", "自然"]
+
+# 靜態樣式檔（需在 .streamlit/config.toml 啟用 server.enableStaticServing）
+STYLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "style.css")
 
 # 設定頁面配置
 st.set_page_config(
@@ -154,212 +32,40 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# CSS 樣式（支援自動換行）
+@st.cache_resource
+def get_style_version():
+    """樣式檔內容雜湊，作為 URL 版本參數，樣式更新時讓瀏覽器快取失效"""
+    with open(STYLE_PATH, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+# CSS 樣式（支援自動換行）：由 static/style.css 提供，每次 rerun 只送出一行 <link>，
+# 樣式與字型由瀏覽器快取，不再重送整段 <style>，也不依賴 Google Fonts
 st.markdown(
-    """
-    <style>
-    @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+TC:wght@400;700&display=swap');
-    html, body, [class*="st-"] {
-        font-family: 'Noto Sans TC', sans-serif !important;
-        background-color: #ecf0f1 !important;
-        color: #2c3e50 !important;
-    }
-    div[data-testid="stForm"] {
-        background: transparent !important;
-        border: none !important;
-        box-shadow: none !important;
-        padding: 0 !important;
-        margin: 0 !important;
-    }
-    div[data-testid="stSidebar"] form[data-testid="stForm"] {
-        background: transparent !important;
-        border: none !important;
-        box-shadow: none !important;
-        padding: 0 !important;
-        margin: 0 !important;
-    }
-    .stCheckbox input[type="checkbox"] {
-        appearance: auto !important;
-        -webkit-appearance: checkbox !important;
-        accent-color: #2c3e50 !important;
-        width: 18px !important;
-        height: 18px !important;
-    }
-    .stCheckbox > label {
-        padding-left: 8px !important;
-    }
-    .stNumberInput > div > div > input {
-        border: 1px solid #2c3e50 !important;
-        border-radius: 5px !important;
-        padding: 5px !important;
-    }
-    .stSelectbox > div > div > select {
-        border: 1px solid #2c3e50 !important;
-        border-radius: 5px !important;
-        padding: 5px !important;
-    }
-    .stMultiSelect > div > div {
-        border: 1px solid #2c3e50 !important;
-        border-radius: 5px !important;
-        padding: 5px !important;
-    }
-    .stButton>button, .stFormSubmitButton>button {
-        border-radius: 5px;
-        border: 1px solid #2c3e50;
-        padding: 8px 16px;
-        font-weight: 500;
-        transition: all 0.3s ease;
-        min-width: 100px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-    }
-    .stButton>button:hover, .stFormSubmitButton>button:hover {
-        background-color: #3498db;
-        color: white;
-        border-color: #3498db;
-        transform: scale(1.05);
-    }
-    button[title="移除"] {
-        background-color: #e74c3c;
-        color: white;
-        border: 1px solid #e74c3c;
-        padding: 5px 10px;
-    }
-    button[title="移除"]:hover {
-        background-color: #c0392b;
-        border-color: #c0392b;
-        transform: scale(1.05);
-    }
-    .aspiration-container {
-        padding: 10px;
-        border-radius: 5px;
-        margin-bottom: 10px;
-    }
-    .aspiration-error {
-        background-color: #D8A7B1 !important;
-        color: #2c3e50 !important;
-    }
-    .aspiration-success {
-        background-color: #A8C4B6 !important;
-        color: #2c3e50 !important;
-    }
-    .recommendation-card {
-        border: 1px solid #2c3e50;
-        border-radius: 8px;
-        padding: 15px;
-        margin-bottom: 15px;
-        background-color: #ffffff;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        min-height: 120px;
-        overflow: hidden;
-    }
-    .recommendation-card strong {
-        white-space: pre-wrap;
-        word-wrap: break-word;
-        overflow-wrap: anywhere;
-        display: block;
-        font-size: 1.1em;
-        color: #2c3e50;
-    }
-    .recommendation-card .details {
-        white-space: pre-wrap;
-        word-wrap: break-word;
-        overflow-wrap: anywhere;
-        margin-top: 8px;
-        font-size: 0.9em;
-        color: #555;
-        line-height: 1.4;
-    }
-    </style>
-    """,
+    f'<link rel="stylesheet" href="app/static/style.css?v={get_style_version()}">',
     unsafe_allow_html=True
 )
 
-@st.cache_data
 def load_and_process_data():
-    """預處理資料集，解析 CSV 並過濾無效資料，新增 school 和 dept 欄位"""
-    try:
-        df = pd.read_csv("programs.csv", encoding='utf-8-sig')
-    except FileNotFoundError:
-        logger.warning("找不到 programs.csv 檔案，使用內建測試資料。")
-        df = pd.DataFrame(DEFAULT_PROGRAMS)
-    
-    # 清理 group 欄位的空白
-    df["group"] = df["group"].astype(str).str.strip()
-    
-    # 確保 program_name 和 school 為字串型態
-    df["program_name"] = df["program_name"].astype(str).replace("nan", "")
-    df["school"] = df["program_name"].str.extract(r"^(\S+大學|\S+學院|\S+醫學大學|\S+市立大學)")[0]
-    df["school"] = df["school"].fillna(df["program_name"].str.extract(r"^(\S+)")[0]).fillna("").astype(str)
-    
-    # 提取 dept 欄位
-    df["dept"] = df.apply(
-        lambda row: row["program_name"].replace(row["school"], "").strip(),
-        axis=1
-    )
-    
-    # 檢查是否有空或異常的 dept 值
-    invalid_depts = df[df["dept"] == ""]
-    if not invalid_depts.empty:
-        logger.warning(f"發現 {len(invalid_depts)} 筆空的 dept 值：{invalid_depts['program_name'].tolist()}")
-    
-    # 生成動態學群選項
-    group_options = sorted(df["group"].dropna().astype(str).str.strip().unique().tolist())
-    logger.info(f"動態生成的學群選項：{group_options}")
-    
-    # 生成學校清單
-    school_list = ["全部學校"] + sorted(df["school"].dropna().unique().tolist())
-    
-    programs_list = []
-    invalid_subjects = set()
-    invalid_scores_log = []
-    skipped_programs = 0
-
-    for idx, row in df.iterrows():
-        try:
-            score_dict = ast.literal_eval(row["expanded_score_dict"])
-            score_dict = {k: max(0, v) for k, v in score_dict.items()}
-            raw_subjects = list(score_dict.keys())
-            required_subjects = [SUBJECT_MAPPING.get(k, k) for k in raw_subjects]
-            
-            # 檢查科目有效性
-            invalid_subj = [subj for subj in required_subjects if subj not in ["國文", "英文", "數學 A", "數學 B", "社會", "自然"]]
-            if invalid_subj:
-                invalid_subjects.update(invalid_subj)
-                skipped_programs += 1
-                logger.warning(f"行 {idx+1}: {row['program_name']} 包含無效科目 {invalid_subj}")
-                continue
-            
-            # 檢查分數範圍（允許 0-15）
-            invalid_scores = [k for k, v in score_dict.items() if v < 0 or v > 15]
-            if invalid_scores:
-                invalid_scores_log.append((row["program_name"], invalid_scores))
-                skipped_programs += 1
-                logger.warning(f"行 {idx+1}: {row['program_name']} 包含無效分數 {invalid_scores}")
-                continue
-            
-            programs_list.append({
-                "program_name": row["program_name"],
-                "required_subjects": required_subjects,
-                "raw_subjects": raw_subjects,
-                "expanded_score_dict": score_dict,
-                "score": sum(score_dict.values()),
-                "group": row["group"],
-                "school": row["school"],
-                "dept": row["dept"]
-            })
-        except Exception as e:
-            skipped_programs += 1
-            logger.error(f"行 {idx+1}: 解析 {row['program_name']} 時出錯：{str(e)}")
-            continue
-    
-    if invalid_subjects:
-        logger.warning(f"發現無效科目：{', '.join(invalid_subjects)}，已跳過 {skipped_programs} 個科系。")
-    if invalid_scores_log:
-        logger.warning(f"發現分數異常（<0或>15）的科系：{len(invalid_scores_log)} 筆，已跳過。")
-    if skipped_programs > 0:
-        logger.warning(f"共跳過 {skipped_programs} 個無效科系。")
+    """
+    目前版本的資料集。科系紀錄為不可變的 recommender.Program，session 只保存科系 id。
+    資料集存放處與各項共用快取由 warmup 模組保存（每個行程一份，伺服器啟動時即可在背景預熱）
+    """
+    return warmup.catalog_store().current()
+
+def session_catalog():
+    """
+    本 session 推薦結果所依據的資料集：產生推薦時固定下來，移除/遞補都使用同一版本，
+    資料集在中途更新時 session 的科系 id 與候選池仍一致，下次送出才改用新版本
+    """
+    return st.session_state.get("catalog") or load_and_process_data()
 
-    return programs_list, school_list, group_options
+def record_session_footprint():
+    """量測本 session 推薦器狀態的用量並回報"""
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return
+    footprint = session_metrics.measure_session(st.session_state)
+    warmup.footprint_registry().record(ctx.session_id, footprint)
 
 def get_user_input(school_list, group_options):
     """獲取使用者輸入"""
@@ -368,15 +74,13 @@ def get_user_input(school_list, group_options):
     st.markdown("<hr style='border: 1px solid #2c3e50; margin: 20px 0;'>", unsafe_allow_html=True)
 
     st.subheader("學測級分輸入")
-    subject_options = ["國文", "英文", "數學 A", "數學 B", "社會", "自然"]
-    
     if "subject_selections" not in st.session_state:
-        st.session_state.subject_selections = {subject: False for subject in subject_options}
+        st.session_state.subject_selections = {subject: False for subject in SUBJECT_OPTIONS}
     
     subject_cols = st.columns(3)
     selected_subjects = []
     scores = {}
-    for i, subject in enumerate(subject_options):
+    for i, subject in enumerate(SUBJECT_OPTIONS):
         with subject_cols[i % 3]:
             col1, col2 = st.columns([1, 1])
             with col1:
@@ -385,11 +89,12 @@ def get_user_input(school_list, group_options):
             if checked:
                 selected_subjects.append(subject)
                 with col2:
+                    if f"score_{subject}" not in st.session_state:
+                        st.session_state[f"score_{subject}"] = 10
                     scores[subject] = st.number_input(
                         f"{subject} 級分",
                         min_value=0,
                         max_value=15,
-                        value=10,
                         step=1,
                         key=f"score_{subject}",
                         label_visibility="collapsed"
@@ -397,11 +102,11 @@ def get_user_input(school_list, group_options):
 
     with st.sidebar:
         st.subheader("感興趣的學群")
-        selected_groups = st.multiselect("", options=group_options, default=None)
+        selected_groups = st.multiselect("", options=group_options, default=None, key="interests")
         st.markdown(f"已選擇：**{', '.join(selected_groups) if selected_groups else '尚未選擇'}**")
 
         st.subheader("篩選學校")
-        selected_school = st.selectbox("", school_list, index=0)
+        selected_school = st.selectbox("", school_list, index=0, key="school")
 
         st.subheader("志願風險偏好分配（共 6 個志願）")
         
@@ -438,6 +143,11 @@ def get_user_input(school_list, group_options):
         with col6:
             ambitious = st.number_input("夢幻型", 0, 6, key="ambitious")
 
+        optimize = st.toggle(
+            "依錄取機率最佳化志願組合", key="optimize",
+            help="依你的級分與各科系門檻的差距估計錄取機率，在上述志願分配下挑選預期結果最好的組合，而非各類別的前幾名"
+        )
+
     button_label = "模擬志願分發" if not st.session_state.get("submitted", False) else "重新生成推薦志願"
     
     with st.form(key="input_form"):
@@ -475,7 +185,8 @@ def get_user_input(school_list, group_options):
                     "保守型": st.session_state.conservative,
                     "務實型": st.session_state.realistic,
                     "夢幻型": st.session_state.ambitious
-                }
+                },
+                "optimize": optimize
             }
             
             if "prev_input" not in st.session_state or current_input != st.session_state.prev_input:
@@ -484,7 +195,7 @@ def get_user_input(school_list, group_options):
                 st.session_state.submitted = True
                 # 清空舊狀態
                 for key in list(st.session_state.keys()):
-                    if key.startswith(('recommendation_data', 'shown_items', 'available_pools', 'message_')):
+                    if key.startswith(('recommendation_', 'shown_items', 'available_pools', 'removed_items', 'message_', 'catalog')):
                         del st.session_state[key]
                 logger.info("使用者輸入已更新，舊狀態已清除")
                 return current_input
@@ -497,296 +208,372 @@ def get_user_input(school_list, group_options):
 
     return None
 
-def is_skippable(program, user_scores):
-    """檢查是否應跳過科系（完全無交集才跳過）"""
-    return set(program["required_subjects"]).isdisjoint(user_scores.keys())
+def session_id():
+    """本 session 的持久化識別碼：放在網址的 ?sid= 參數，重新整理頁面或重新連線後仍相同"""
+    sid = st.query_params.get("sid")
+    if not sid:
+        sid = st.query_params["sid"] = uuid.uuid4().hex
+    return sid
+
+def save_session_state():
+    """登記本 session 的推薦狀態（只取出科系 id、uid 與遞補 cursor），由背景執行緒批次寫入"""
+    store = warmup.session_state_store()
+    if store is None:
+        return
+    state = session_store.snapshot(
+        st.session_state.catalog["version"],
+        st.session_state.user_input,
+        st.session_state.shown_items,
+        st.session_state.available_pools,
+        st.session_state.removed_items,
+        st.session_state.recommendation_warnings,
+    )
+    store.save(session_id(), state)
 
-def generate_reason(program, user_input, strategy_type):
+def restore_session_state(catalog):
     """
-    生成推薦理由 (量化＋模板)：
-    1. 若沒填任何分數 → 提示輸入成績
-    2. 若缺少必填科目 → 列出缺科目
-    3. 若完全無交集 (is_skippable) → 無法評估
-    4. 否則：
-       • 計算各科 diff、min_diff、mean_diff
-       • 用範本庫 (REASON_TEMPLATES) 依學群＋level(level: 頂標/中段/後段) 產生 summary
-       • details 組合所需科目、你的分數、分差明細
+    重新整理頁面或重新連線後（新的 session 尚無輸入），依網址的 sid 還原上次的輸入與推薦狀態。
+    推薦結果只在資料集版本相同時還原（科系 id 才一致），推薦理由由科系 id 以 generate_reasons 重建，
+    不重新計算推薦；資料集已更新時只還原輸入，依新版本重新推薦
     """
-    scores = user_input.get("scores", {})
-    # 1. 尚未輸入任何成績
-    if not scores:
-        return {"summary": "請先輸入學測成績。", "details": ""}
-
-    required = program["required_subjects"]
-    raw_keys = program["raw_subjects"]
-    score_dict = program["expanded_score_dict"]
-    group = program.get("group", "default")
-
-    # 2. 缺少必填科目
-    missing = [s for s in required if s not in scores]
-    if missing:
-        return {
-            "summary": f"缺少科目：{', '.join(missing)}",
-            "details": ""
-        }
-
-    # 3. 完全無交集 (自定義跳過條件)
-    if is_skippable(program, scores):
-        return {
-            "summary": "無任何匹配的科目分數，無法評估錄取可能性。",
-            "details": ""
-        }
-
-    # 4. 計算分差
-    user_score_str = ", ".join(f"{subj}: {scores.get(subj, 0)} 分"
-                               for subj in required)
-    program_score_str = ", ".join(f"{subj}: {score_dict.get(key, 0)} 分"
-                                 for key, subj in zip(raw_keys, required))
-
-    diffs = [scores.get(subj, 0) - score_dict.get(key, 0)
-             for key, subj in zip(raw_keys, required)]
-    min_diff = min(diffs)
-    mean_diff = sum(diffs) / len(diffs)
-
-    diff_str = ", ".join(f"{subj}: {diff:+.1f} 分"
-                         for subj, diff in zip(required, diffs))
-
-    details = (
-        f"📋 所需科目與分數：{program_score_str}<br>"
-        f"✅ 你的分數：{user_score_str}<br>"
-        f"🔍 分數差距：{diff_str}"
-    )
-
-    # 5. 判斷等級 (level) → 用於選模板
-    if min_diff >= 3:
-        level = "頂標"
-    elif min_diff >= 0:
-        level = "中段"
-    else:
-        level = "後段"
-
-    # 6. 從 REASON_TEMPLATES 裡取對應範本
-    template_group = group if group in REASON_TEMPLATES else "default"
-    summary_tpl = REASON_TEMPLATES[template_group][level]
-
-    # 7. 生成最終 summary（帶 icon）
-    summary = f"💡 {summary_tpl.format(mean_diff=mean_diff, min_diff=min_diff)}"
-
-    return {"summary": summary, "details": details}
+    if st.session_state.get("session_restored") or "user_input" in st.session_state:
+        return
+    st.session_state.session_restored = True
+    store = warmup.session_state_store()
+    sid = st.query_params.get("sid")
+    if store is None or not sid:
+        return
+    state = store.load(sid)
+    if state is None:
+        return
+
+    # 輸入表單的元件狀態（需在元件建立前設定）
+    user_input = state["user_input"]
+    st.session_state.subject_selections = {subject: subject in user_input["selected_subjects"] for subject in SUBJECT_OPTIONS}
+    for subject, score in user_input["scores"].items():
+        st.session_state[f"score_{subject}"] = score
+    st.session_state.interests = [group for group in user_input["interests"] if group in catalog["group_options"]]
+    if user_input["school"] in catalog["school_list"]:
+        st.session_state.school = user_input["school"]
+    st.session_state.conservative = user_input["strategy_allocation"]["保守型"]
+    st.session_state.realistic = user_input["strategy_allocation"]["務實型"]
+    st.session_state.ambitious = user_input["strategy_allocation"]["夢幻型"]
+    st.session_state.optimize = user_input["optimize"]
+    st.session_state.user_input = user_input
+    st.session_state.prev_input = user_input
+    st.session_state.submitted = True
+
+    if state["version"] != catalog["version"]:
+        logger.info(f"session {sid[:8]} 的資料集版本已更新，只還原輸入並重新推薦")
+        return
+    shown_items = {}
+    for stype, entries in state["shown"].items():
+        reasons = recommender.generate_reasons(catalog, [entry[0] for entry in entries], user_input) if entries else []
+        shown_items[stype] = [
+            {"id": entry[0], "uid": entry[1], "reason": reason, **({"probability": entry[2]} if len(entry) > 2 else {})}
+            for entry, reason in zip(entries, reasons)
+        ]
+    st.session_state.catalog = catalog
+    st.session_state.recommendation_data = {stype: list(items) for stype, items in shown_items.items()}
+    st.session_state.shown_items = shown_items
+    st.session_state.available_pools = {stype: dict(pool) for stype, pool in state["pools"].items()}
+    st.session_state.removed_items = {stype: list(ids) for stype, ids in state["removed"].items()}
+    st.session_state.recommendation_warnings = list(state["warnings"])
+    METRICS.inc("recommender_session_restores_total")
+    logger.info(f"已還原 session {sid[:8]} 的推薦狀態")
 
 def generate_recommendations(user_input):
     """生成推薦志願"""
-    # 明確解包 load_and_process_data 的返回值
-    programs_list, school_list, group_options = load_and_process_data()
-    
-    # 調試：檢查 programs_list 結構
-    logger.info(f"programs_list type: {type(programs_list)}, length: {len(programs_list)}")
-    if programs_list:
-        logger.info(f"First program type: {type(programs_list[0])}, content: {programs_list[0]}")
+    if "recommendation_data" in st.session_state:
+        # 已送出（或已由 sid 還原）的 session：沿用 session 狀態，rerun 不重新計算
+        for message in st.session_state.recommendation_warnings:
+            st.warning(message)
+        return st.session_state.recommendation_data
+
+    catalog = session_catalog()
+    programs_list = catalog["programs"]
     
-    selected_groups = user_input.get("interests", [])
-    selected_school = user_input.get("school", "全部學校")
+    # 調試：檢查 programs_list 結構（僅 DEBUG 或抽樣時輸出完整內容）
+    if programs_list and should_log_payload(logger):
+        logger.info(f"programs_list length: {len(programs_list)}, first program: {programs_list[0]}")
     
-    # 過濾學群
-    if not selected_groups:
-        logger.warning("未選擇任何感興趣的學群，將顯示所有有效科系。")
-        filtered_programs = programs_list
+    if catalog is load_and_process_data():
+        result = warmup.recommendation_cache().get_or_compute(catalog, user_input)
     else:
-        filtered_programs = [p for p in programs_list if p["group"] in selected_groups]
-    
-    # 過濾學校
-    if selected_school != "全部學校":
-        filtered_programs = [p for p in filtered_programs if p["school"] == selected_school]
-    
-    # 調試：檢查 filtered_programs 結構
-    logger.info(f"filtered_programs type: {type(filtered_programs)}, length: {len(filtered_programs)}")
-    if filtered_programs:
-        logger.info(f"First filtered program type: {type(filtered_programs[0])}, content: {filtered_programs[0]}")
-    
-    conservative_pool = []
-    realistic_pool = []
-    ambitious_pool = []
-    missing_subjects_log = {}
-
-    user_scores = user_input.get("scores", {})
-    for program in filtered_programs:
-        if not isinstance(program, dict):
-            logger.error(f"Invalid program type: {type(program)}, content: {program}")
-            continue
-        
-        required_subjects = program["required_subjects"]
-        raw_subjects = program["raw_subjects"]
-        score_dict = program["expanded_score_dict"]
-
-        missing_subjects = [s for s in required_subjects if s not in user_scores]
-        if missing_subjects:
-            for subj in missing_subjects:
-                missing_subjects_log[subj] = missing_subjects_log.get(subj, 0) + 1
-            continue
-
-        subject_pairs = [(user_scores[subj], score_dict[raw_subj]) for raw_subj, subj in zip(raw_subjects, required_subjects)]
-
-        if any(user < required for user, required in subject_pairs):
-            ambitious_pool.append(program)
-        elif all(user >= required + 2 for user, required in subject_pairs):
-            conservative_pool.append(program)
-        elif all(user >= required for user, required in subject_pairs):
-            realistic_pool.append(program)
-        else:
-            ambitious_pool.append(program)
-
-    conservative_pool.sort(key=lambda x: (x["score"], len(x["required_subjects"])), reverse=True)
-    realistic_pool.sort(key=lambda x: (x["score"], len(x["required_subjects"])), reverse=True)
-    ambitious_pool.sort(key=lambda x: (x["score"], len(x["required_subjects"])), reverse=True)
-
-    logger.info(f"候選池大小 - 保守型: {len(conservative_pool)} 筆, 務實型: {len(realistic_pool)} 筆, 夢幻型: {len(ambitious_pool)} 筆")
+        # 資料集已更新但本 session 尚未重新送出：以原版本計算，不影響共用快取
+        result = recommender.generate_recommendations(catalog, user_input)
+    for message in result["warnings"]:
+        st.warning(message)
 
-    strategy_allocation = user_input.get("strategy_allocation", {})
+    # session 狀態只保存 {id, uid, reason}（最佳化模式另有 probability）；reason 為快取中的共用物件，不複製
     recommendation_result = {
-        "保守型": [],
-        "務實型": [],
-        "夢幻型": []
+        strategy_type: [
+            {**item, "uid": str(uuid.uuid4())}
+            for item in items
+        ]
+        for strategy_type, items in result["recommendations"].items()
     }
 
-    for pool, count, strategy_type in [
-        (conservative_pool, strategy_allocation.get("保守型", 0), "保守型"),
-        (realistic_pool, strategy_allocation.get("務實型", 0), "務實型"),
-        (ambitious_pool, strategy_allocation.get("夢幻型", 0), "夢幻型")
-    ]:
-        selected_programs = pool[:count]
-        processed_programs = []
-        for program in selected_programs:
-            program_with_id = copy.deepcopy(program)
-            program_with_id["uid"] = str(uuid.uuid4())
-            program_with_id["reason"] = generate_reason(program_with_id, user_input, strategy_type)
-            processed_programs.append(program_with_id)
-
-        recommendation_result[strategy_type] = processed_programs
-
-        if len(pool) < count:
-            logger.warning(f"{strategy_type} 僅有 {len(pool)} 個符合條件的科系，少於要求的 {count} 個")
-            st.warning(f"{strategy_type} 僅有 {len(pool)} 個符合條件的科系，無法滿足 {count} 個志願。")
-
-    if "recommendation_data" not in st.session_state:
-        st.session_state.recommendation_data = recommendation_result
-        st.session_state.shown_items = {
-            stype: copy.deepcopy(recommendation_result[stype]) for stype in recommendation_result
-        }
-        st.session_state.available_pools = {
-            "保守型": [copy.deepcopy(p) for p in conservative_pool if not any(p["program_name"] == selected["program_name"] for selected in recommendation_result["保守型"])],
-            "務實型": [copy.deepcopy(p) for p in realistic_pool if not any(p["program_name"] == selected["program_name"] for selected in recommendation_result["務實型"])],
-            "夢幻型": [copy.deepcopy(p) for p in ambitious_pool if not any(p["program_name"] == selected["program_name"] for selected in recommendation_result["夢幻型"])]
+    # 每次送出只計入一次需求統計（之後的 rerun 沿用 session 狀態）
+    counters = warmup.demand_counters()
+    if counters is not None:
+        counters.record(catalog, result)
+    st.session_state.catalog = catalog
+    st.session_state.recommendation_data = recommendation_result
+    st.session_state.recommendation_warnings = list(result["warnings"])
+    st.session_state.shown_items = {
+        stype: list(recommendation_result[stype]) for stype in recommendation_result
+    }
+    # 候選池只保存共用的 bitset 與本 session 的遞補 cursor，不展開、不複製科系資料
+    st.session_state.available_pools = {
+        stype: {
+            "bits": pool["bits"],
+            "cursor": pool["cursor"],
+            "remaining": pool["size"] - len(recommendation_result[stype]),
         }
-        logger.info(f"初始化 available_pools - 保守型: {len(st.session_state.available_pools['保守型'])}, 務實型: {len(st.session_state.available_pools['務實型'])}, 夢幻型: {len(st.session_state.available_pools['夢幻型'])}")
+        for stype, pool in result["pools"].items()
+    }
+    st.session_state.removed_items = {stype: [] for stype in recommendation_result}
+    logger.info(f"初始化 available_pools - 保守型: {st.session_state.available_pools['保守型']['remaining']}, 務實型: {st.session_state.available_pools['務實型']['remaining']}, 夢幻型: {st.session_state.available_pools['夢幻型']['remaining']}")
+    save_session_state()
 
     return recommendation_result
 
-def display_recommendations(user_input, recommendation_data):
-    """顯示推薦志願並處理移除/遞補（不跨池）"""
-    st.header("推薦志願（點擊移除可自動遞補）")
-    st.markdown("<hr style='border: 1px solid #2c3e50; margin: 20px 0;'>", unsafe_allow_html=True)
-
-    strategy_types = ["保守型", "務實型", "夢幻型"]
+def handle_remove(stype, item_uid, user_input):
+    """處理移除與遞補邏輯（僅同池遞補）；作為移除按鈕的 on_click，執行完後只重跑該欄的 fragment"""
+    catalog = session_catalog()
+    programs = catalog["programs"]
+    logger.debug(f"進入 handle_remove，stype={stype}, item_uid={item_uid}")
+    if should_log_payload(logger):
+        logger.info(f"shown_items[{stype}] = {[programs[item['id']].program_name for item in st.session_state.shown_items[stype]]}")
+    
+    removed_item = None
+    for item in st.session_state.shown_items[stype]:
+        if item["uid"] == item_uid:
+            removed_item = item
+            st.session_state.shown_items[stype].remove(item)
+            logger.info(f"已移除 {programs[item['id']].program_name} (UID: {item_uid})")
+            break
+    
+    if not removed_item:
+        logger.error(f"未找到 UID {item_uid} 的項目，移除失敗")
+        st.session_state[f"message_{stype}"] = "移除失敗：未找到指定項目"
+        return
+
+    removed_name = programs[removed_item["id"]].program_name
+    st.session_state.removed_items[stype].append(removed_item["id"])
+    available = st.session_state.available_pools.get(stype)
+    logger.debug(f"可用項目數量 ({stype}): {available['remaining'] if available else 0}")
+    if available and available["remaining"] > 0:
+        next_idx, available["cursor"] = recommender.take_from_pool(
+            catalog["index"], available["bits"], available["cursor"], 1
+        )
+        available["remaining"] -= len(next_idx)
+        next_program = programs[next_idx[0]]
+        next_item = {
+            "id": next_program.id,
+            "uid": str(uuid.uuid4()),
+            "reason": recommender.generate_reasons(catalog, next_idx, user_input)[0],
+        }
+        st.session_state.shown_items[stype].append(next_item)
+        logger.info(f"從 {stype} 遞補 {next_program.program_name} (UID: {next_item['uid']})")
+        st.session_state[f"message_{stype}"] = f"已移除 {removed_name}，已遞補 {next_program.program_name}"
+    else:
+        logger.warning(f"{stype} 無更多可遞補項目")
+        st.session_state[f"message_{stype}"] = f"已移除 {removed_name}，無更多可遞補項目"
+    save_session_state()
+    
+    if should_log_payload(logger):
+        logger.info(f"更新後 shown_items[{stype}] = {[programs[item['id']].program_name for item in st.session_state.shown_items[stype]]}")
+    record_session_footprint()
 
-    def handle_remove(stype, item_uid):
-        """處理移除與遞補邏輯（僅同池遞補）"""
-        logger.info(f"進入 handle_remove，stype={stype}, item_uid={item_uid}")
-        logger.info(f"shown_items[{stype}] = {[item['program_name'] for item in st.session_state.shown_items[stype]]}")
+@st.fragment
+def display_strategy_column(stype, user_input):
+    """
+    顯示單一策略欄（獨立的 fragment）：
+    移除/遞補只重跑這一欄，不會重新執行 CSS 注入、資料載入、輸入表單與推薦計算
+    """
+    with METRICS.span("render_column"):
+        catalog = session_catalog()
+        programs = catalog["programs"]
+        program_history = warmup.program_history(catalog)
+
+        st.subheader(f"{stype}")
+        target_count = user_input["strategy_allocation"].get(stype, 0)
+        current_items = st.session_state.shown_items.get(stype, [])
+        if should_log_payload(logger):
+            logger.info(f"顯示 {stype}：{len(current_items)} 筆，項目名稱={[programs[item['id']].program_name for item in current_items]}")
         
-        removed_item = None
-        for item in st.session_state.shown_items[stype]:
-            if item["uid"] == item_uid:
-                removed_item = item
-                st.session_state.shown_items[stype].remove(item)
-                logger.info(f"已移除 {item['program_name']} (UID: {item_uid})")
-                break
+        if f"message_{stype}" in st.session_state:
+            st.success(st.session_state[f"message_{stype}"])
+            del st.session_state[f"message_{stype}"]
         
-        if not removed_item:
-            logger.error(f"未找到 UID {item_uid} 的項目，移除失敗")
-            st.session_state[f"message_{stype}"] = "移除失敗：未找到指定項目"
-            st.rerun()
-            return
-
-        available = st.session_state.available_pools.get(stype, [])
-        logger.info(f"可用項目數量 ({stype}): {len(available)}")
-        if available:
-            next_item = copy.deepcopy(available.pop(0))
-            next_item["uid"] = str(uuid.uuid4())
-            next_item["reason"] = generate_reason(next_item, user_input, stype)
-            st.session_state.shown_items[stype].append(next_item)
-            logger.info(f"從 {stype} 遞補 {next_item['program_name']} (UID: {next_item['uid']})")
-            st.session_state[f"message_{stype}"] = f"已移除 {removed_item['program_name']}，已遞補 {next_item['program_name']}"
-        else:
-            logger.warning(f"{stype} 無更多可遞補項目")
-            st.session_state[f"message_{stype}"] = f"已移除 {removed_item['program_name']}，無更多可遞補項目"
+        if not current_items and target_count > 0:
+            st.warning(f"{stype} 無符合條件的科系，可能因缺少所需科目或分數不足。")
         
-        logger.info(f"更新後 shown_items[{stype}] = {[item['program_name'] for item in st.session_state.shown_items[stype]]}")
-        st.rerun()
+        for item in current_items:
+            program = programs[item["id"]]
+            with st.container():
+                reason = item["reason"]["summary"] if isinstance(item["reason"], dict) else item["reason"]
+                details = item["reason"]["details"] if isinstance(item["reason"], dict) else item["reason"]
+                probability = f"<br>🎯 預估錄取機率：{item['probability']:.0%}" if "probability" in item else ""
+                
+                st.markdown(f"""
+                    <div class="recommendation-card">
+                        <strong>🎓 {program.program_name}</strong>
+                        <div class="details">
+                        📚 學群：{program.group}<br>
+                        💡 推薦理由：{reason}{probability}
+                        </div>
+                    </div>
+                """, unsafe_allow_html=True)
+                
+                with st.expander("查看詳細理由"):
+                    st.markdown(details, unsafe_allow_html=True)
+                    history_text = history.format_history(program_history, program.id)
+                    if history_text:
+                        st.markdown(f"📈 歷年門檻：<br>{history_text}", unsafe_allow_html=True)
+                
+                btn_key = f"remove_{item['uid']}_{stype}"
+                logger.debug(f"生成按鈕鍵：{btn_key}")
+                st.button(
+                    "移除", key=btn_key, help="移除此志願",
+                    on_click=handle_remove, args=(stype, item["uid"], user_input)
+                )
+        
+        if len(current_items) < target_count:
+            st.warning(f"{stype} 目前僅有 {len(current_items)}/{target_count} 筆可推薦，無法再補充。")
+        else:
+            shown = len(current_items)
+            pool = st.session_state.available_pools[stype]["remaining"] if stype in st.session_state.available_pools else 0
+            total_pool = shown + pool
+            st.success(f"已顯示 {shown}/{target_count} 筆推薦，可遞補 {pool} 筆，共 {total_pool} 筆可選")
+
+        available = st.session_state.available_pools.get(stype)
+        if available and available["remaining"] > 0 and st.checkbox(f"列出所有可遞補的{stype}科系", key=f"show_all_{stype}"):
+            candidate_idx, _ = recommender.take_from_pool(catalog["index"], available["bits"], available["cursor"])
+            reasons = recommender.generate_reasons(catalog, candidate_idx, user_input)
+            st.dataframe(
+                [
+                    {"科系": programs[pid].program_name, "學群": programs[pid].group, "推薦理由": reason["summary"]}
+                    for pid, reason in zip(candidate_idx, reasons)
+                ],
+                hide_index=True,
+                width="stretch",
+            )
+
+def display_score_sweep(user_input):
+    """級分敏感度分析：各科加減 1、2 級分時三個候選池的變化，以及新增可達的科系"""
+    catalog = session_catalog()
+    programs = catalog["programs"]
+    sweep = recommender.sweep_score_variants(catalog, user_input)
+    if sweep is None:
+        return
+
+    deltas = sweep["deltas"]
+    base = deltas.index(0)
+    base_combo = (base,) * len(sweep["subjects"])
+    base_reach = sweep["pools"]["保守型"][base_combo] + sweep["pools"]["務實型"][base_combo]
+    rows = []
+    for axis, subj in enumerate(sweep["subjects"]):
+        for j, delta in enumerate(deltas):
+            combo = base_combo[:axis] + (j,) + base_combo[axis + 1:]
+            if delta == 0 or not sweep["valid"][combo]:
+                continue
+            reach = sweep["pools"]["保守型"][combo] + sweep["pools"]["務實型"][combo]
+            count, top_id = sweep["unlocked"][subj].get(delta, (0, None))
+            rows.append({
+                "科目": subj,
+                "級分變動": f"{delta:+d}",
+                "保守型": int(sweep["pools"]["保守型"][combo]),
+                "務實型": int(sweep["pools"]["務實型"][combo]),
+                "夢幻型": int(sweep["pools"]["夢幻型"][combo]),
+                "可達門檻科系增減": int(reach - base_reach),
+                "新增可達科系（排序最前）": programs[top_id].program_name if top_id is not None else "",
+            })
+    st.dataframe(rows, hide_index=True, width="stretch")
+
+    # 全部組合中：總共多 2 級分（不降低任何科目）時最有利的分配
+    combos = np.argwhere(sweep["valid"])
+    changes = np.asarray(deltas)[combos]
+    candidates = combos[(changes >= 0).all(axis=1) & (changes.sum(axis=1) == 2)]
+    if len(candidates):
+        reach = [sweep["pools"]["保守型"][tuple(c)] + sweep["pools"]["務實型"][tuple(c)] for c in candidates]
+        best = candidates[int(np.argmax(reach))]
+        plan = "、".join(f"{subj} {deltas[j]:+d}" for subj, j in zip(sweep["subjects"], best) if deltas[j])
+        st.caption(f"若總共再多 2 級分，最有利的分配為 {plan}：可達門檻的科系由 {base_reach} 個增加為 {max(reach)} 個。")
+
+@st.fragment
+def display_program_search(user_input):
+    """
+    校系搜尋（獨立的 fragment）：輸入時即時查詢校系名稱、學校與科系，只重跑這一區，
+    已送出成績時同時顯示每個結果對你屬於哪一類
+    """
+    catalog = load_and_process_data()
+    query = st.text_input(
+        "🔎 搜尋校系", key="program_search", type="search", live="200ms",
+        placeholder="輸入校名或科系，例如：臺灣大學 外國語文、護理"
+    )
+    if not query.strip():
+        return
+
+    program_ids = recommender.search_programs(catalog, query)
+    if not program_ids:
+        st.caption("找不到符合的校系。")
+        return
+    scores = user_input["scores"] if user_input else {}
+    labels = recommender.classify_programs(catalog, program_ids, scores) if scores else ["—"] * len(program_ids)
+    programs = catalog["programs"]
+    st.dataframe(
+        [
+            {
+                "校系名稱": programs[pid].program_name,
+                "學群": programs[pid].group,
+                "所需科目與分數": catalog["reasons"]["requirement_str"][pid],
+                "你的分類": label,
+            }
+            for pid, label in zip(program_ids, labels)
+        ],
+        hide_index=True,
+        width="stretch",
+    )
+    if not scores:
+        st.caption("送出成績後會顯示每個校系對你屬於保守型、務實型或夢幻型。")
+
+def display_recommendations(user_input, recommendation_data):
+    """顯示推薦志願並處理移除/遞補（不跨池）"""
+    st.header("推薦志願（點擊移除可自動遞補）")
+    st.markdown("<hr style='border: 1px solid #2c3e50; margin: 20px 0;'>", unsafe_allow_html=True)
 
     cols = st.columns(3)
-    
-    for i, stype in enumerate(strategy_types):
+    for i, stype in enumerate(recommender.STRATEGY_TYPES):
         with cols[i]:
-            st.subheader(f"{stype}")
-            target_count = user_input["strategy_allocation"].get(stype, 0)
-            current_items = st.session_state.shown_items.get(stype, [])
-            logger.info(f"顯示 {stype}：{len(current_items)} 筆，項目名稱={[item['program_name'] for item in current_items]}")
-            
-            if f"message_{stype}" in st.session_state:
-                st.success(st.session_state[f"message_{stype}"])
-                del st.session_state[f"message_{stype}"]
-            
-            if not current_items and target_count > 0:
-                st.warning(f"{stype} 無符合條件的科系，可能因缺少所需科目或分數不足。")
-            
-            for item in current_items:
-                with st.container():
-                    reason = item["reason"]["summary"] if isinstance(item["reason"], dict) else item["reason"]
-                    details = item["reason"]["details"] if isinstance(item["reason"], dict) else item["reason"]
-                    
-                    st.markdown(f"""
-                        <div class="recommendation-card">
-                            <strong>🎓 {item['program_name']}</strong>
-                            <div class="details">
-                            📚 學群：{item['group']}<br>
-                            💡 推薦理由：{reason}
-                            </div>
-                        </div>
-                    """, unsafe_allow_html=True)
-                    
-                    with st.expander("查看詳細理由"):
-                        st.markdown(details, unsafe_allow_html=True)
-                    
-                    btn_key = f"remove_{item['uid']}_{stype}"
-                    logger.info(f"生成按鈕鍵：{btn_key}")
-                    if st.button("移除", key=btn_key, help="移除此志願"):
-                        logger.info(f"點擊移除按鈕，UID: {item['uid']}, 科系: {item['program_name']}")
-                        handle_remove(stype, item["uid"])
-            
-            if len(current_items) < target_count:
-                missing = target_count - len(current_items)
-                st.warning(f"{stype} 目前僅有 {len(current_items)}/{target_count} 筆可推薦，無法再補充。")
-            else:
-                shown = len(current_items)
-                pool = len(st.session_state.available_pools.get(stype, []))
-                total_pool = shown + pool
-                st.success(f"已顯示 {shown}/{target_count} 筆推薦，可遞補 {pool} 筆，共 {total_pool} 筆可選")
+            display_strategy_column(stype, user_input)
+
+    if st.checkbox("如果級分不同？顯示級分敏感度分析", key="show_sweep"):
+        display_score_sweep(user_input)
 
     st.markdown("<hr style='border: 1px solid #2c3e50; margin: 20px 0;'>", unsafe_allow_html=True)
     st.write("© 2025 學測志願模擬器")
 
 def main():
     """主程式"""
-    programs_list, school_list, group_options = load_and_process_data()
-    user_input = get_user_input(school_list, group_options)
+    warmup.start()
+    catalog = load_and_process_data()
+    restore_session_state(catalog)
+    user_input = get_user_input(catalog["school_list"], catalog["group_options"])
+    display_program_search(user_input)
     
     if user_input:
         with st.spinner("正在生成推薦志願..."):
             recommendation_data = generate_recommendations(user_input)
-        display_recommendations(user_input, recommendation_data)
+        with METRICS.span("render"):
+            display_recommendations(user_input, recommendation_data)
     else:
         st.info("請輸入成績、選擇學群並設置志願分配，然後點擊「模擬志願分發」按鈕。")
 
+    record_session_footprint()
+
 if __name__ == "__main__":
     main()
 
@@ -0,0 +1,136 @@
+"""
+批次推薦工具：讀取整個年級的學測成績 CSV，為每位學生輸出推薦志願。
+
+輸入 CSV 欄位（除成績外皆可省略）：
+  • id：學生識別碼（預設為列號）
+  • 國文、英文、數學 A、數學 B、社會、自然（亦可用 國/英/數A/數B/社/自）：級分，空白代表未應考
+  • interests：感興趣的學群，以「、」「;」或「,」分隔
+  • school：篩選學校（預設「全部學校」）
+  • 保守型、務實型、夢幻型：志願分配（預設各 2 個）
+驗證規則與 JSON API 相同（api_server.parse_user_input）：級分為 0–15 的整數、學校需存在於資料集、
+志願分配為非負整數且總和為 6。資料有誤的學生輸出一列只含 id 與 error（錯誤原因）的紀錄，其餘學生照常處理。
+
+用法：
+  python batch_recommend.py students.csv -o recommendations.csv --workers 8
+"""
+import os
+import re
+import csv
+import sys
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import api_server
+import recommender
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_FIELDS = ["id", "strategy", "rank", "program_name", "school", "dept", "group", "summary", "details", "error"]
+
+# 每個工作行程各自載入一次資料集（由 _init_worker 設定）
+_worker_catalog = None
+
+def _init_worker(csv_path):
+    """工作行程初始化：載入資料集（有磁碟快照時幾乎不需解析）"""
+    global _worker_catalog
+    _worker_catalog = recommender.load_catalog(csv_path)
+
+def _number(value, field):
+    """將 CSV 儲存格轉為數值（整數值回傳 int，其餘回傳 float，交由 parse_user_input 判斷是否有效）"""
+    try:
+        number = float(value)
+    except ValueError:
+        raise api_server.BadRequest(f"{field} 不是數字：{value}")
+    return int(number) if number.is_integer() else number
+
+def build_user_input(row, catalog):
+    """將一列學生資料轉為 JSON API 的請求格式，以 api_server.parse_user_input 驗證並正規化（資料有誤時拋出 BadRequest）"""
+    scores = {}
+    for raw_subj, subject in recommender.SUBJECT_MAPPING.items():
+        value = (row.get(subject) or row.get(raw_subj) or "").strip()
+        if value:
+            scores[subject] = _number(value, subject)
+
+    interests = [g.strip() for g in re.split(r"[、;,]", row.get("interests") or "") if g.strip()]
+    allocation = {
+        stype: _number(row[stype].strip(), stype)
+        for stype in recommender.STRATEGY_TYPES
+        if (row.get(stype) or "").strip()
+    }
+    return api_server.parse_user_input({
+        "scores": scores,
+        "interests": interests,
+        "school": (row.get("school") or "").strip() or "全部學校",
+        "strategy_allocation": allocation,
+    }, catalog)
+
+def recommend_row(item):
+    """在工作行程中處理一位學生，回傳輸出列"""
+    student_id, row = item
+    try:
+        user_input = build_user_input(row, _worker_catalog)
+    except api_server.BadRequest as e:
+        logger.error(f"學生 {student_id} 的資料格式錯誤：{str(e)}")
+        return [{"id": student_id, "error": str(e)}]
+
+    result = recommender.generate_recommendations(_worker_catalog, user_input)
+    output_rows = []
+    for stype in recommender.STRATEGY_TYPES:
+        for rank, item in enumerate(result["recommendations"][stype], start=1):
+            program = _worker_catalog["programs"][item["id"]]
+            output_rows.append({
+                "id": student_id,
+                "strategy": stype,
+                "rank": rank,
+                "program_name": program.program_name,
+                "school": program.school,
+                "dept": program.dept,
+                "group": program.group,
+                "summary": item["reason"]["summary"],
+                "details": item["reason"]["details"].replace("<br>", "；"),
+            })
+    return output_rows
+
+def read_students(path):
+    """逐列讀取學生資料，回傳 (id, row)"""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for line_no, row in enumerate(csv.DictReader(f), start=1):
+            yield (row.get("id") or str(line_no)).strip(), row
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="批次產生學測志願推薦")
+    parser.add_argument("students", help="學生成績 CSV")
+    parser.add_argument("-o", "--output", default="-", help="輸出 CSV（預設為標準輸出）")
+    parser.add_argument("--catalog", default=recommender.PROGRAMS_CSV_PATH, help="校系資料 CSV")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="工作行程數")
+    parser.add_argument("--chunksize", type=int, default=64, help="每次派送給工作行程的學生數")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    # 引擎的逐位學生日誌（候選池大小、候選不足等）在批次模式下過於冗長
+    logging.getLogger("recommender").setLevel(logging.ERROR)
+
+    # 先在主行程載入一次，確保磁碟快照已建立，工作行程即可直接讀取快照
+    recommender.load_catalog(args.catalog)
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8-sig")
+    try:
+        writer = csv.DictWriter(out, fieldnames=OUTPUT_FIELDS)
+        writer.writeheader()
+        students = 0
+        with ProcessPoolExecutor(
+            max_workers=args.workers, initializer=_init_worker, initargs=(args.catalog,)
+        ) as executor:
+            for rows in executor.map(recommend_row, read_students(args.students), chunksize=args.chunksize):
+                writer.writerows(rows)
+                students += 1
+        logger.info(f"已完成 {students} 位學生的推薦")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
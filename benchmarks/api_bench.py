@@ -0,0 +1,134 @@
+"""
+推薦 API 吞吐量基準：啟動 api_server.py（釘選在單一 CPU 核心），以多條 keep-alive 連線送出請求，
+回報 /recommend 的每秒請求數與延遲分布，以及 /recommend/batch 的每秒學生數。
+
+學生輸入為隨機產生（與 bench.py 相同的分布），大多數請求不會命中推薦快取。
+批次端點分兩次量測：已快取（重送 /recommend 用過的輸入）與未快取（另一組未送過的隨機輸入），分別回報；
+--requests 超過推薦快取上限（1024 筆）時，「已快取」的輸入有一部分已被擠出快取。
+
+用法：
+  python benchmarks/api_bench.py --requests 2000 --connections 8 --batch-size 100
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import recommender  # noqa: E402
+from bench import random_inputs  # noqa: E402
+
+# 等待伺服器啟動的逾時（秒）
+STARTUP_TIMEOUT = 60
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(port, catalog, cpu):
+    """以子行程啟動 API 伺服器，cpu 不為 None 時釘選在該核心（Linux）"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "api_server.py"), "--port", str(port), "--catalog", catalog],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(process.pid, {cpu})
+    return process
+
+async def request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def wait_ready(port):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            status, health = await request(reader, writer, "GET", "/health")
+            writer.close()
+            if status == 200:
+                return health
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("API 伺服器未在時限內啟動")
+
+async def run_load(port, path, payloads, connections):
+    """以 connections 條連線平均送出 payloads，回傳 (總耗時, 各請求延遲)"""
+    latencies = []
+
+    async def worker(share):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for payload in share:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, "POST", path, payload)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                raise RuntimeError(f"{path} 回應 {status}")
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(payloads[i::connections]) for i in range(connections)))
+    return time.perf_counter() - start, latencies
+
+async def run(args):
+    catalog = recommender.load_catalog(args.catalog)
+    inputs = random_inputs(catalog, args.requests, args.seed)
+    port = free_port()
+    process = start_server(port, args.catalog, args.cpu)
+    try:
+        health = await wait_ready(port)
+        print(f"API 伺服器就緒：{health['programs']} 個科系，CPU 核心 {args.cpu}")
+
+        await run_load(port, "/recommend", inputs[:50], 1)  # 暖身
+        elapsed, latencies = await run_load(port, "/recommend", inputs, args.connections)
+        arr = np.asarray(latencies) * 1000
+        print(f"/recommend：{len(inputs)} 個請求，{len(inputs) / elapsed:.0f} 請求/秒，"
+              f"p50 {np.percentile(arr, 50):.2f} ms，p99 {np.percentile(arr, 99):.2f} ms")
+
+        fresh_inputs = random_inputs(catalog, args.requests, args.seed + 1)
+        # 先量已快取（/recommend 剛送過，尚未被新的輸入擠出快取），再量未快取
+        for label, students in (("已快取", inputs), ("未快取", fresh_inputs)):
+            batches = [{"students": students[i:i + args.batch_size]} for i in range(0, len(students), args.batch_size)]
+            elapsed, _ = await run_load(port, "/recommend/batch", batches, args.connections)
+            print(f"/recommend/batch（{label}）：每批 {args.batch_size} 位，{len(students) / elapsed:.0f} 位學生/秒")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="推薦 API 吞吐量基準")
+    parser.add_argument("--catalog", default=recommender.PROGRAMS_CSV_PATH, help="校系資料 CSV")
+    parser.add_argument("--requests", type=int, default=2000, help="請求數（亦為批次測試的學生總數）")
+    parser.add_argument("--connections", type=int, default=8, help="同時連線數")
+    parser.add_argument("--batch-size", type=int, default=100, help="批次端點每次的學生數")
+    parser.add_argument("--cpu", type=int, default=0, help="伺服器釘選的 CPU 核心（-1 表示不釘選）")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    args = parser.parse_args(argv)
+    if args.cpu < 0:
+        args.cpu = None
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+推薦引擎效能基準：以合成資料量測各階段耗時，結果附加至 benchmarks/results.jsonl，可跨 commit 比較。
+
+量測項目（每種資料規模）：
+  • load_parse：不使用快照，完整解析 CSV
+  • load_parse_wide：不使用快照，解析正規化（寬）格式的同一份資料
+  • load_snapshot：由磁碟快照載入
+  • load_incremental：修改 INCREMENTAL_CHANGE_RATIO 比例的列後增量重新解析
+  • recommend：generate_recommendations（隨機學生輸入，每次皆重新計算）
+  • optimize：同上，但開啟最佳化模式（optimize_portfolio）
+  • reasons：generate_reasons 一次產生 REASON_BATCH 筆理由
+  • refill：take_from_pool 逐筆遞補 REFILL_STEPS 次
+  • search：逐字輸入校系名稱片段時的 search_programs ＋ classify_programs
+
+用法：
+  python benchmarks/bench.py --sizes 10000,100000          # 量測並記錄
+  python benchmarks/bench.py --compare HEAD~1 HEAD         # 比較兩個 commit 的最新結果
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import subprocess
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+import recommender  # noqa: E402
+from generate_catalog import write_catalog  # noqa: E402
+from convert_catalog import convert  # noqa: E402
+
+DATA_DIR = os.path.join(ROOT, "benchmarks", "data")
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results.jsonl")
+
+# 每種規模量測的學生輸入數、理由批次大小、遞補次數
+RECOMMEND_SAMPLES = 200
+REASON_BATCH = 1000
+REFILL_STEPS = 100
+SEARCH_SAMPLES = 100
+
+# 增量解析時修改的列比例
+INCREMENTAL_CHANGE_RATIO = 0.01
+
+# 比較時視為退化的倍數
+REGRESSION_RATIO = 1.2
+
+def git_commit():
+    """目前的 commit（工作目錄有未提交變更時加上 -dirty）"""
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD", "--", "*.py"], cwd=ROOT) != 0
+        return commit + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def resolve_commit(ref):
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", ref], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ref
+
+def summarize(samples):
+    """耗時樣本（秒）→ 統計（毫秒）"""
+    arr = np.asarray(samples) * 1000
+    return {
+        "n": len(arr),
+        "mean_ms": float(arr.mean()),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p99_ms": float(np.percentile(arr, 99)),
+    }
+
+def random_inputs(catalog, count, seed):
+    """隨機學生輸入（科目、級分、學群、學校、志願分配）"""
+    rng = random.Random(seed)
+    inputs = []
+    for _ in range(count):
+        subjects = [s for s in recommender.SUBJECT_COLUMNS if rng.random() < 0.7] or ["英文"]
+        inputs.append({
+            "scores": {s: rng.randint(5, 15) for s in subjects},
+            "interests": rng.sample(catalog["group_options"], rng.randint(0, 3)),
+            "school": rng.choice(catalog["school_list"]) if rng.random() < 0.1 else "全部學校",
+            "strategy_allocation": {"保守型": 2, "務實型": 2, "夢幻型": 2},
+        })
+    return inputs
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def bench_size(size, seed=0):
+    """量測單一資料規模，回傳 {階段: 統計}"""
+    csv_path = os.path.join(DATA_DIR, f"programs_{size}.csv")
+    if not os.path.exists(csv_path):
+        print(f"產生 {size} 筆合成資料…")
+        write_catalog(csv_path, size, seed)
+
+    stages = {}
+    elapsed, _ = timed(lambda: recommender.parse_programs(pd.read_csv(csv_path, encoding="utf-8-sig"), version="bench"))
+    stages["load_parse"] = summarize([elapsed])
+
+    wide_path = os.path.join(DATA_DIR, f"programs_{size}_wide.csv")
+    if not os.path.exists(wide_path):
+        convert(pd.read_csv(csv_path, encoding="utf-8-sig")).to_csv(wide_path, index=False)
+    elapsed, _ = timed(lambda: recommender.parse_wide_programs(pd.read_csv(wide_path, encoding="utf-8-sig"), version="bench"))
+    stages["load_parse_wide"] = summarize([elapsed])
+
+    recommender.load_catalog(csv_path)  # 確保快照存在
+    elapsed, catalog = timed(recommender.load_catalog, csv_path)
+    stages["load_snapshot"] = summarize([elapsed])
+
+    df = pd.read_csv(csv_path, encoding="utf-8-sig")
+    changed_rows = np.random.default_rng(seed).choice(len(df), max(1, int(len(df) * INCREMENTAL_CHANGE_RATIO)), replace=False)
+    df.loc[changed_rows, "group"] = df.loc[changed_rows, "group"] + " "
+    elapsed, _ = timed(lambda: recommender.parse_programs(df, version="bench-incremental", previous=catalog))
+    stages["load_incremental"] = summarize([elapsed])
+
+    inputs = random_inputs(catalog, RECOMMEND_SAMPLES, seed)
+    samples = []
+    results = []
+    for user_input in inputs:
+        elapsed, result = timed(recommender.generate_recommendations, catalog, user_input)
+        samples.append(elapsed)
+        results.append(result)
+    stages["recommend"] = summarize(samples)
+    stages["optimize"] = summarize([
+        timed(recommender.generate_recommendations, catalog, dict(user_input, optimize=True))[0] for user_input in inputs
+    ])
+
+    ids = np.random.default_rng(seed).integers(0, len(catalog["programs"]), size=REASON_BATCH)
+    stages["reasons"] = summarize([timed(recommender.generate_reasons, catalog, ids, user_input)[0] for user_input in inputs[:20]])
+
+    samples = []
+    for result in results[:20]:
+        pool = max(result["pools"].values(), key=lambda p: p["size"])
+        cursor = pool["cursor"]
+        for _ in range(REFILL_STEPS):
+            elapsed, (taken, cursor) = timed(recommender.take_from_pool, catalog["index"], pool["bits"], cursor, 1)
+            samples.append(elapsed)
+            if not len(taken):
+                break
+    stages["refill"] = summarize(samples)
+
+    # 模擬逐字輸入：每個校系名稱的前 1…6 個字各查詢一次
+    rng = random.Random(seed)
+    samples = []
+    for program_id in rng.sample(range(len(catalog["programs"])), min(SEARCH_SAMPLES, len(catalog["programs"]))):
+        name = catalog["programs"][program_id].program_name.replace(" ", "")
+        start = rng.randrange(max(len(name) - 6, 1))
+        for end in range(start + 1, min(start + 7, len(name) + 1)):
+            elapsed, hits = timed(recommender.search_programs, catalog, name[start:end])
+            elapsed += timed(recommender.classify_programs, catalog, hits, inputs[0]["scores"])[0]
+            samples.append(elapsed)
+    stages["search"] = summarize(samples)
+    return stages
+
+def run(sizes, seed):
+    entry = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": {},
+    }
+    for size in sizes:
+        print(f"== {size} 筆 ==")
+        stages = bench_size(size, seed)
+        entry["results"][str(size)] = stages
+        for stage, stats in stages.items():
+            print(f"  {stage:<16} mean {stats['mean_ms']:9.3f} ms  p50 {stats['p50_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms")
+
+    with open(RESULTS_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    print(f"結果已附加至 {RESULTS_PATH}（commit {entry['commit']}）")
+
+def load_results():
+    if not os.path.exists(RESULTS_PATH):
+        return []
+    with open(RESULTS_PATH, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def compare(base_ref, head_ref):
+    """比較兩個 commit 最新一次的結果（p50）；有階段退化超過 REGRESSION_RATIO 時回傳 1"""
+    entries = load_results()
+    latest = {}
+    for entry in entries:
+        latest[entry["commit"].replace("-dirty", "")] = entry
+    base_commit, head_commit = resolve_commit(base_ref), resolve_commit(head_ref)
+    if base_commit not in latest or head_commit not in latest:
+        print(f"找不到 {base_commit} 或 {head_commit} 的基準結果，請先在兩個 commit 執行 bench.py")
+        return 2
+
+    regressions = 0
+    base, head = latest[base_commit]["results"], latest[head_commit]["results"]
+    for size in sorted(set(base) & set(head), key=int):
+        print(f"== {size} 筆（{base_commit} → {head_commit}）==")
+        for stage in base[size]:
+            if stage not in head[size]:
+                continue
+            before, after = base[size][stage]["p50_ms"], head[size][stage]["p50_ms"]
+            ratio = after / before if before else float("inf")
+            flag = "  ← 退化" if ratio > REGRESSION_RATIO else ""
+            regressions += bool(flag)
+            print(f"  {stage:<16} {before:9.3f} → {after:9.3f} ms  ×{ratio:5.2f}{flag}")
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="推薦引擎效能基準")
+    parser.add_argument("--sizes", default="10000,100000", help="資料規模（逗號分隔）")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="比較兩個 commit 的結果")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("recommender").setLevel(logging.ERROR)
+
+    if args.compare:
+        sys.exit(compare(*args.compare))
+    run([int(s) for s in args.sizes.split(",")], args.seed)
+
+if __name__ == "__main__":
+    main()
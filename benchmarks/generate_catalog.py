@@ -0,0 +1,66 @@
+"""
+合成校系資料產生器：以 programs.csv 為母體，產生任意筆數、欄位格式相同的測試資料。
+
+每筆合成科系以一筆真實科系為範本（依原始頻率抽樣），保留其學群、學校與必填科目組合，
+門檻級分隨機 ±1（限制在 0–15），因此學群、學校、科目組合與門檻分布皆與真實資料一致。
+科系名稱加上「第 N 組」後綴以確保不重複，且仍符合 load_catalog 的學校名稱擷取規則。
+
+用法：
+  python benchmarks/generate_catalog.py 100000 -o benchmarks/data/programs_100000.csv
+"""
+import os
+import sys
+import csv
+import argparse
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import recommender  # noqa: E402
+
+def generate_rows(size, seed=0, source_path=None):
+    """產生 size 筆合成科系（dict，欄位與 programs.csv 相同）"""
+    source = recommender.load_catalog(source_path or os.path.join(ROOT, recommender.PROGRAMS_CSV_PATH))
+    templates = source["programs"]
+    rng = np.random.default_rng(seed)
+
+    template_idx = rng.integers(0, len(templates), size=size)
+    max_subjects = max(len(p.thresholds) for p in templates)
+    jitter = rng.integers(-1, 2, size=(size, max_subjects))
+
+    for i, (t, deltas) in enumerate(zip(template_idx, jitter)):
+        template = templates[t]
+        thresholds = [int(min(max(v + d, 0), recommender.SCORE_LEVELS - 1)) for v, d in zip(template.thresholds, deltas)]
+        score_dict = dict(zip(template.raw_subjects, thresholds))
+        yield {
+            "program_name": f"{template.school} {template.dept}第{i + 1}組",
+            "required_subjects": str(list(template.raw_subjects)),
+            "expanded_score_dict": str(score_dict),
+            "group": template.group,
+            "score_dict": str({k: float(v) for k, v in score_dict.items()}),
+        }
+
+def write_catalog(path, size, seed=0, source_path=None):
+    """寫出合成資料 CSV（utf-8-sig，與 programs.csv 相同）"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=["program_name", "required_subjects", "expanded_score_dict", "group", "score_dict"])
+        writer.writeheader()
+        writer.writerows(generate_rows(size, seed, source_path))
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生合成校系資料")
+    parser.add_argument("size", type=int, help="科系筆數")
+    parser.add_argument("-o", "--output", help="輸出 CSV（預設 benchmarks/data/programs_<size>.csv）")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    parser.add_argument("--source", help="母體資料（預設為 programs.csv）")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "data", f"programs_{args.size}.csv")
+    write_catalog(output, args.size, args.seed, args.source)
+    print(f"已輸出 {args.size} 筆合成科系至 {output}")
+
+if __name__ == "__main__":
+    main()
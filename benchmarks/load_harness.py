@@ -0,0 +1,175 @@
+"""
+多使用者負載測試：以 streamlit.testing 的 AppTest 同時驅動多個 app.py session（不需瀏覽器或網路）。
+
+AppTest 共用行程層級的 Streamlit runtime 狀態，不能在同一行程的多個執行緒中同時執行，
+因此每個同時進行的使用者各自在一個以 spawn 建立的 worker 行程中執行（--concurrency 個行程），
+同一 worker 內的使用者依序執行並共用該行程的資料集與快取（如同一個伺服器行程）。
+
+每個虛擬使用者依序：
+  1. 開啟頁面（首次執行）
+  2. 勾選隨機科目並輸入級分，送出 input_form（量測 submit 延遲）
+  3. 連續點擊「移除」按鈕 REMOVES 次（量測 remove 延遲）
+
+輸出各動作延遲分布（p50/p90/p99）、失敗率、吞吐量與 worker 行程峰值 RSS；
+延遲只涵蓋成功的使用者，有任何使用者失敗時以非 0 結束碼離開，報告不可視為有效。
+
+用法：
+  python benchmarks/load_harness.py --users 50 --concurrency 8 --removes 3
+"""
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import resource
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+
+SUBJECTS = ["國文", "英文", "數學 A", "數學 B", "社會", "自然"]
+
+# 單次腳本執行的逾時（秒）
+RUN_TIMEOUT = 120
+
+def peak_rss_mb():
+    """行程峰值 RSS（MB；Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def init_worker():
+    """worker 行程初始化：關閉指標伺服器（各 worker 不搶同一個埠），並壓低日誌"""
+    os.environ["RECOMMENDER_METRICS_PORT"] = "0"
+    logging.basicConfig(level=logging.ERROR)
+    logging.disable(logging.WARNING)
+    os.chdir(ROOT)
+
+def _timed_run(at, latencies, action):
+    start = time.perf_counter()
+    at.run(timeout=RUN_TIMEOUT)
+    latencies.append((action, time.perf_counter() - start))
+    if at.exception:
+        raise RuntimeError(f"{action} 發生例外：{at.exception[0].message}")
+
+def simulate_user(user_id, removes, seed):
+    """單一虛擬使用者的完整流程，回傳 [(動作, 秒數)]"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(seed + user_id)
+    latencies = []
+    at = AppTest.from_file(APP_PATH, default_timeout=RUN_TIMEOUT)
+    _timed_run(at, latencies, "load")
+
+    chosen = [s for s in SUBJECTS if rng.random() < 0.7] or ["英文"]
+    for subject in chosen:
+        at.checkbox(key=f"subject_{subject}").check()
+    at.run(timeout=RUN_TIMEOUT)
+    for subject in chosen:
+        at.number_input(key=f"score_{subject}").set_value(rng.randint(6, 15))
+
+    submit = [b for b in at.button if b.form_id == "input_form"]
+    if not submit:
+        raise RuntimeError("找不到 input_form 的送出按鈕")
+    submit[0].click()
+    _timed_run(at, latencies, "submit")
+
+    for _ in range(removes):
+        remove_buttons = [b for b in at.button if b.key and b.key.startswith("remove_")]
+        if not remove_buttons:
+            break
+        rng.choice(remove_buttons).click()
+        _timed_run(at, latencies, "remove")
+    return latencies
+
+def run_user(user_id, removes, seed):
+    """worker 行程中執行一位使用者，回傳 (latencies, 錯誤訊息或 None, 行程峰值 RSS)"""
+    try:
+        latencies = simulate_user(user_id, removes, seed)
+        error = None
+    except Exception as e:
+        latencies = []
+        error = f"user {user_id}: {type(e).__name__}: {e}".rstrip(": ")
+        logging.getLogger(__name__).debug(traceback.format_exc())
+    return latencies, error, peak_rss_mb()
+
+def summarize(samples):
+    arr = np.asarray(samples) * 1000
+    return {
+        "n": len(arr),
+        "p50_ms": float(np.percentile(arr, 50)),
+        "p90_ms": float(np.percentile(arr, 90)),
+        "p99_ms": float(np.percentile(arr, 99)),
+        "max_ms": float(arr.max()),
+    }
+
+def run(users, concurrency, removes, seed):
+    latencies = []
+    errors = []
+    peak_rss = 0.0
+
+    # AppTest 執行腳本時會替換 worker 的 __main__ 模組，工作函式需以模組名稱（load_harness）傳給 worker
+    import load_harness
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=context, initializer=load_harness.init_worker) as executor:
+        futures = [executor.submit(load_harness.run_user, user_id, removes, seed) for user_id in range(users)]
+        for future in futures:
+            result, error, rss = future.result()
+            latencies.extend(result)
+            if error is not None:
+                errors.append(error)
+            peak_rss = max(peak_rss, rss)
+    wall = time.perf_counter() - start
+
+    report = {
+        "users": users,
+        "concurrency": concurrency,
+        "removes_per_user": removes,
+        "wall_seconds": wall,
+        "actions_per_second": len(latencies) / wall if wall else 0.0,
+        "peak_rss_mb": peak_rss,
+        "failed_users": len(errors),
+        "error_rate": len(errors) / users if users else 0.0,
+        "errors": errors,
+        "latency": {},
+    }
+    for action in ("load", "submit", "remove"):
+        samples = [seconds for name, seconds in latencies if name == action]
+        if samples:
+            report["latency"][action] = summarize(samples)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="app.py 多使用者負載測試（AppTest）")
+    parser.add_argument("--users", type=int, default=20, help="虛擬使用者總數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時進行的使用者數")
+    parser.add_argument("--removes", type=int, default=3, help="每位使用者點擊移除的次數")
+    parser.add_argument("--seed", type=int, default=0, help="亂數種子")
+    parser.add_argument("-o", "--output", help="另存 JSON 報告")
+    args = parser.parse_args(argv)
+
+    report = run(args.users, args.concurrency, args.removes, args.seed)
+    print(f"{report['users']} 位使用者（同時 {report['concurrency']} 位），耗時 {report['wall_seconds']:.2f} 秒，"
+          f"吞吐量 {report['actions_per_second']:.1f} 動作/秒，worker 峰值 RSS {report['peak_rss_mb']:.1f} MB")
+    print(f"  失敗 {report['failed_users']}/{report['users']} 位使用者（錯誤率 {report['error_rate']:.1%}）"
+          + ("，以下延遲只涵蓋成功的使用者" if report["errors"] else ""))
+    for action, stats in report["latency"].items():
+        print(f"  {action:<7} n={stats['n']:<5} p50 {stats['p50_ms']:8.1f} ms  p90 {stats['p90_ms']:8.1f} ms  "
+              f"p99 {stats['p99_ms']:8.1f} ms  max {stats['max_ms']:8.1f} ms")
+    for error in report["errors"]:
+        print(f"  錯誤：{error}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if report["errors"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
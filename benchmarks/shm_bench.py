@@ -0,0 +1,103 @@
+"""
+多工作行程記憶體基準：比較「各行程自行載入資料集」與「附加共享記憶體資料集」時，每個工作行程的記憶體用量。
+
+啟動 K 個工作行程（spawn），各自取得資料集並執行 RECOMMEND_SAMPLES 次推薦後回報：
+  • RSS：常駐記憶體（共享記憶體頁面在每個行程都會計入）
+  • PSS：按共用行程數分攤後的用量（/proc/self/smaps_rollup，僅 Linux），加總即為主機實際用量
+  • USS（Private）：行程獨占的記憶體，代表每多一個工作行程增加的用量
+
+用法：
+  python benchmarks/shm_bench.py --size 20000 --workers 4
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import recommender  # noqa: E402
+import shared_catalog  # noqa: E402
+from bench import random_inputs, DATA_DIR  # noqa: E402
+from generate_catalog import write_catalog  # noqa: E402
+
+RECOMMEND_SAMPLES = 100
+
+def memory_mb():
+    """目前行程的 {"rss", "pss", "uss"}（MB）；無 smaps_rollup 的平台只回報 RSS"""
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                    usage[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss": peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024}
+    return {
+        "rss": usage["Rss"],
+        "pss": usage["Pss"],
+        "uss": usage["Private_Clean"] + usage["Private_Dirty"],
+    }
+
+def worker(mode, source, ready, results):
+    """工作行程：取得資料集、執行推薦，等所有工作行程完成後量測記憶體"""
+    logging.disable(logging.WARNING)
+    start = time.perf_counter()
+    catalog = shared_catalog.attach(source) if mode == "shared" else recommender.load_catalog(source)
+    load_seconds = time.perf_counter() - start
+    for user_input in random_inputs(catalog, RECOMMEND_SAMPLES, seed=os.getpid()):
+        recommender.generate_recommendations(catalog, user_input)
+    # 等所有工作行程都附加後再量測，PSS 才會反映實際的共用行程數
+    ready.wait()
+    results.put({"load_seconds": load_seconds, **memory_mb()})
+
+def run_mode(mode, source, workers):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(mode, source, ready, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    reports = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return reports
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多工作行程記憶體基準（自行載入 vs 共享記憶體）")
+    parser.add_argument("--size", type=int, default=20000, help="合成資料的科系數")
+    parser.add_argument("--workers", type=int, default=4, help="工作行程數")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    csv_path = os.path.join(DATA_DIR, f"programs_{args.size}.csv")
+    if not os.path.exists(csv_path):
+        print(f"產生 {args.size} 筆合成資料…")
+        write_catalog(csv_path, args.size, 0)
+    recommender.load_catalog(csv_path)  # 確保快照存在，兩種模式都不含完整解析時間
+
+    segment = shared_catalog.publish(recommender.load_catalog(csv_path))
+    try:
+        runs = {
+            "private": run_mode("private", csv_path, args.workers),
+            "shared": run_mode("shared", segment.name, args.workers),
+        }
+    finally:
+        segment.close()
+        segment.unlink()
+
+    print(f"{args.size} 個科系，{args.workers} 個工作行程，共享區塊 {segment.size / 1024 / 1024:.1f} MB")
+    for mode, reports in runs.items():
+        mean = {key: sum(r[key] for r in reports) / len(reports) for key in reports[0]}
+        total_pss = f"，PSS 合計 {sum(r['pss'] for r in reports):8.1f} MB" if "pss" in mean else ""
+        private = f"，USS {mean['uss']:7.1f} MB，PSS {mean['pss']:7.1f} MB" if "pss" in mean else ""
+        print(f"  {mode:<8} 載入 {mean['load_seconds'] * 1000:7.1f} ms，RSS {mean['rss']:7.1f} MB{private}{total_pss}")
+
+if __name__ == "__main__":
+    main()
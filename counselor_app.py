@@ -0,0 +1,72 @@
+"""
+輔導老師檢視：本季全體學生的志願需求統計（讀取 demand.py 已彙總的計數，不重新掃描歷次送出）。
+
+學生端需以 RECOMMENDER_DEMAND_ANALYTICS=1 啟動才會累計；檢視端與學生端使用同一個 RECOMMENDER_DEMAND_DB。
+用法：
+  streamlit run counselor_app.py --server.port 8502
+"""
+import os
+import logging
+import pandas as pd
+import streamlit as st
+import demand
+import recommender
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 各排行榜顯示的科系數
+TOP_N = 20
+
+st.set_page_config(page_title="志願需求統計（輔導老師）", layout="wide")
+
+@st.cache_resource
+def get_connection():
+    """統計資料庫的唯讀用連線（每個伺服器行程一份）"""
+    return demand.connect(demand.DEMAND_DB_PATH)
+
+def group_table(groups):
+    """學群 × 策略的推薦次數與候選池人次"""
+    df = pd.DataFrame(groups, columns=["學群", "策略", "推薦次數", "候選池人次"])
+    if df.empty:
+        return df
+    table = df.pivot_table(index="學群", columns="策略", values=["推薦次數", "候選池人次"], fill_value=0)
+    table = table.reindex(columns=recommender.STRATEGY_TYPES, level=1)
+    return table.sort_values(("推薦次數", "夢幻型"), ascending=False)
+
+def program_table(rows, submissions):
+    df = pd.DataFrame(rows, columns=["校系名稱", "學群", "推薦次數", "候選池人次"])
+    # 擁擠度：這一季的送出中，有多少比例把該科系列在此類候選池
+    df["擁擠度"] = (df["候選池人次"] / max(submissions, 1)).map("{:.1%}".format)
+    return df
+
+def main():
+    if not os.path.exists(demand.DEMAND_DB_PATH):
+        st.info(f"尚無統計資料（{demand.DEMAND_DB_PATH}）。學生端需設定 RECOMMENDER_DEMAND_ANALYTICS=1 才會開始累計。")
+        return
+    conn = get_connection()
+    seasons = demand.list_seasons(conn) or [demand.DEMAND_SEASON]
+    season = st.sidebar.selectbox("季別", seasons)
+    if st.sidebar.button("重新整理"):
+        st.rerun()
+
+    summary = demand.read_summary(conn, season, top_n=TOP_N)
+    st.title(f"{season} 志願需求統計")
+    st.metric("累計送出次數", f"{summary['submissions']:,}")
+    st.caption(f"學生端每 {demand.DEMAND_FLUSH_SECONDS} 秒批次寫入一次，數字可能略為落後。")
+
+    st.subheader("各學群")
+    st.dataframe(group_table(summary["groups"]), width="stretch")
+
+    for stype in ("夢幻型", "務實型", "保守型"):
+        st.subheader(stype)
+        left, right = st.columns(2)
+        with left:
+            st.markdown("**最常被推薦**")
+            st.dataframe(program_table(summary["top_recommended"][stype], summary["submissions"]), hide_index=True, width="stretch")
+        with right:
+            st.markdown("**候選池最擁擠**")
+            st.dataframe(program_table(summary["most_crowded"][stype], summary["submissions"]), hide_index=True, width="stretch")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+志願需求統計：累計本季所有送出的推薦結果，供輔導老師檢視哪些科系最常被推薦、各科系的夢幻型/務實型
+候選池有多擁擠。
+
+每次送出時只累加計數（科系 × 策略的 numpy 陣列，成本與科系數成正比，與累計送出次數無關），
+每 DEMAND_FLUSH_SECONDS 秒或累積 DEMAND_FLUSH_RECORDS 次送出時，由背景執行緒整批以 UPSERT 寫入本機 SQLite
+（送出的畫面重跑不等待寫入；寫入失敗時計數保留到下一次 flush）；
+資料表本身即為彙總結果，多個伺服器行程寫入同一個檔案即為全體的合計，檢視時不需重新掃描歷次送出。
+
+計數以校系名稱（program_name）為鍵，資料集更新、科系 id 改變後仍累計在同一列：
+  • recommended：列入該策略前 N 名推薦的次數
+  • in_pool：落在該策略候選池中的次數（該科系在此類志願的競爭人數）
+"""
+import os
+import time
+import atexit
+import sqlite3
+import logging
+import datetime
+import threading
+import numpy as np
+import recommender
+from instrumentation import METRICS
+
+logger = logging.getLogger(__name__)
+
+# 需求統計模式；預設關閉，設為 1 時開始累計
+DEMAND_ANALYTICS = os.environ.get("RECOMMENDER_DEMAND_ANALYTICS", "0") == "1"
+
+# 統計資料庫（SQLite，多個伺服器行程可共用）
+DEMAND_DB_PATH = os.environ.get("RECOMMENDER_DEMAND_DB", "demand.sqlite3")
+
+# 本季的識別（預設為西元年），計數依季分開
+DEMAND_SEASON = os.environ.get("RECOMMENDER_SEASON", str(datetime.date.today().year))
+
+# 批次寫入的時間間隔（秒）與送出次數上限，先達到者觸發寫入
+DEMAND_FLUSH_SECONDS = 30
+DEMAND_FLUSH_RECORDS = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    season TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS program_demand (
+    season TEXT NOT NULL,
+    program_name TEXT NOT NULL,
+    school TEXT NOT NULL,
+    dept TEXT NOT NULL,
+    program_group TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    recommended INTEGER NOT NULL,
+    in_pool INTEGER NOT NULL,
+    PRIMARY KEY (season, program_name, strategy)
+);
+CREATE INDEX IF NOT EXISTS program_demand_recommended ON program_demand (season, strategy, recommended DESC);
+CREATE INDEX IF NOT EXISTS program_demand_in_pool ON program_demand (season, strategy, in_pool DESC);
+CREATE TABLE IF NOT EXISTS group_demand (
+    season TEXT NOT NULL,
+    program_group TEXT NOT NULL,
+    strategy TEXT NOT NULL,
+    recommended INTEGER NOT NULL,
+    in_pool INTEGER NOT NULL,
+    PRIMARY KEY (season, program_group, strategy)
+);
+"""
+
+def connect(db_path=DEMAND_DB_PATH):
+    """開啟統計資料庫（WAL 模式：寫入時不阻擋檢視端讀取）"""
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+class DemandCounters:
+    """
+    行程內尚未寫入的計數（執行緒安全）：
+    • record()：累加一次送出的推薦結果；累積 flush_records 次時通知背景執行緒提前 flush
+    • flush()：將累積的差額整批寫入資料庫並歸零；寫入失敗時差額放回，下次再寫入
+    • start_flushing()：背景執行緒每 interval 秒（或被 record() 通知時）flush 一次；行程結束時也會 flush
+    """
+
+    def __init__(self, db_path=DEMAND_DB_PATH, season=DEMAND_SEASON, flush_records=DEMAND_FLUSH_RECORDS):
+        self.db_path = db_path
+        self.season = season
+        self.flush_records = flush_records
+        # 依資料集版本分開累計：{版本: {"catalog", "recommended", "in_pool"}}，陣列為科系數 × 三種策略
+        self._pending = {}
+        self._pending_submissions = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._conn = connect(db_path)
+        self._flusher = None
+        self._flush_requested = threading.Event()
+        atexit.register(self.flush)
+
+    def record(self, catalog, result):
+        """累加一次送出（result 為 generate_recommendations 的結果）"""
+        index = catalog["index"]
+        n = index["n"]
+        with self._lock:
+            pending = self._pending.get(catalog["version"])
+            if pending is None:
+                shape = (n, len(recommender.STRATEGY_TYPES))
+                pending = self._pending[catalog["version"]] = {
+                    "catalog": catalog,
+                    "recommended": np.zeros(shape, dtype=np.int64),
+                    "in_pool": np.zeros(shape, dtype=np.int64),
+                }
+            for k, stype in enumerate(recommender.STRATEGY_TYPES):
+                recommended_ids = [item["id"] for item in result["recommendations"].get(stype, [])]
+                in_pool = np.zeros(n, dtype=bool)
+                pool = result["pools"].get(stype)
+                if pool is not None:
+                    in_pool[index["order"][np.unpackbits(pool["bits"], count=n).astype(bool)]] = True
+                # 最佳化模式的候選池已移除選中的項目，需補回
+                in_pool[recommended_ids] = True
+                pending["recommended"][recommended_ids, k] += 1
+                pending["in_pool"][:, k] += in_pool
+            self._pending_submissions += 1
+            should_flush = self._pending_submissions >= self.flush_records
+        METRICS.inc("recommender_demand_submissions_total")
+        if should_flush:
+            if self._flusher is None:
+                # 沒有背景執行緒時（未呼叫 start_flushing）只能在呼叫端寫入
+                self.flush()
+            else:
+                self._flush_requested.set()
+
+    def flush(self):
+        """將累積的計數以單一交易寫入資料庫，回傳寫入的送出次數（寫入失敗時放回計數並回傳 0）"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            submissions, self._pending_submissions = self._pending_submissions, 0
+        if not submissions:
+            return 0
+
+        program_rows = []
+        group_totals = {}
+        for entry in pending.values():
+            programs = entry["catalog"]["programs"]
+            touched = np.flatnonzero(entry["in_pool"].any(axis=1))
+            for program_id in touched:
+                program = programs[program_id]
+                for k, stype in enumerate(recommender.STRATEGY_TYPES):
+                    recommended = int(entry["recommended"][program_id, k])
+                    in_pool = int(entry["in_pool"][program_id, k])
+                    if not in_pool:
+                        continue
+                    program_rows.append((
+                        self.season, program.program_name, program.school, program.dept, program.group,
+                        stype, recommended, in_pool,
+                    ))
+                    totals = group_totals.setdefault((program.group, stype), [0, 0])
+                    totals[0] += recommended
+                    totals[1] += in_pool
+        group_rows = [(self.season, group, stype, totals[0], totals[1]) for (group, stype), totals in group_totals.items()]
+
+        start = time.perf_counter()
+        try:
+            self._write(program_rows, group_rows, submissions)
+        except sqlite3.Error as e:
+            self._requeue(pending, submissions)
+            logger.error(f"寫入需求統計失敗，{submissions} 次送出的計數保留到下一次寫入：{str(e)}")
+            return 0
+        METRICS.observe("recommender_demand_flush_seconds", time.perf_counter() - start)
+        logger.info(f"已寫入需求統計：{submissions} 次送出，{len(program_rows)} 筆科系計數")
+        return submissions
+
+    def _write(self, program_rows, group_rows, submissions):
+        with self._write_lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO submissions (season, count) VALUES (?, ?) "
+                "ON CONFLICT (season) DO UPDATE SET count = count + excluded.count",
+                (self.season, submissions),
+            )
+            self._conn.executemany(
+                "INSERT INTO program_demand VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (season, program_name, strategy) DO UPDATE SET "
+                "school = excluded.school, dept = excluded.dept, program_group = excluded.program_group, "
+                "recommended = recommended + excluded.recommended, in_pool = in_pool + excluded.in_pool",
+                program_rows,
+            )
+            self._conn.executemany(
+                "INSERT INTO group_demand VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (season, program_group, strategy) DO UPDATE SET "
+                "recommended = recommended + excluded.recommended, in_pool = in_pool + excluded.in_pool",
+                group_rows,
+            )
+
+    def _requeue(self, pending, submissions):
+        """寫入失敗時把取出的計數加回（期間新累計的計數保留）"""
+        with self._lock:
+            for version, entry in pending.items():
+                current = self._pending.get(version)
+                if current is None:
+                    self._pending[version] = entry
+                else:
+                    current["recommended"] += entry["recommended"]
+                    current["in_pool"] += entry["in_pool"]
+            self._pending_submissions += submissions
+
+    def start_flushing(self, interval=DEMAND_FLUSH_SECONDS):
+        """啟動背景寫入執行緒"""
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, args=(interval,), name="demand-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self, interval):
+        while True:
+            self._flush_requested.wait(interval)
+            self._flush_requested.clear()
+            self.flush()
+
+def read_summary(conn, season=DEMAND_SEASON, top_n=20):
+    """
+    輔導老師檢視用的彙總（直接讀取已彙總的資料表，不掃描歷次送出）：
+    回傳 {"submissions", "groups": [(學群, 策略, recommended, in_pool)],
+          "top_recommended" / "most_crowded": {策略: [(校系名稱, 學群, recommended, in_pool)]}}
+    """
+    row = conn.execute("SELECT count FROM submissions WHERE season = ?", (season,)).fetchone()
+    groups = conn.execute(
+        "SELECT program_group, strategy, recommended, in_pool FROM group_demand WHERE season = ?", (season,)
+    ).fetchall()
+    top_recommended = {}
+    most_crowded = {}
+    for stype in recommender.STRATEGY_TYPES:
+        columns = "program_name, program_group, recommended, in_pool"
+        top_recommended[stype] = conn.execute(
+            f"SELECT {columns} FROM program_demand WHERE season = ? AND strategy = ? ORDER BY recommended DESC LIMIT ?",
+            (season, stype, top_n),
+        ).fetchall()
+        most_crowded[stype] = conn.execute(
+            f"SELECT {columns} FROM program_demand WHERE season = ? AND strategy = ? ORDER BY in_pool DESC LIMIT ?",
+            (season, stype, top_n),
+        ).fetchall()
+    return {
+        "submissions": row[0] if row else 0,
+        "groups": groups,
+        "top_recommended": top_recommended,
+        "most_crowded": most_crowded,
+    }
+
+def list_seasons(conn):
+    return [season for (season,) in conn.execute("SELECT season FROM submissions ORDER BY season DESC")]
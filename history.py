@@ -0,0 +1,222 @@
+"""
+歷年門檻資料：串流讀取一個目錄下的各年度 CSV（格式同 programs.csv），以工作行程平行解析，
+結果存為精簡的數值陣列（int8，年度 × 科系 × 六科），不保留逐列的 dict 或 DataFrame。
+
+目錄內的檔名需包含年度（如 programs_112.csv、2024.csv），年度取檔名中第一段 3–4 位數字。
+每個檔案各自辨識格式（原始格式的 expanded_score_dict 或正規化（寬）格式，同 recommender.is_wide_format），
+欄位不符或讀取失敗的年度記錄警告後略過，不影響其他年度。
+"""
+import os
+import re
+import glob
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import recommender
+from instrumentation import METRICS
+
+logger = logging.getLogger(__name__)
+
+# 歷年資料目錄；不存在時不載入歷年門檻
+HISTORY_DIR = os.environ.get("RECOMMENDER_HISTORY_DIR", "history")
+
+# 每次讀入並派送給工作行程的列數
+HISTORY_CHUNK_ROWS = 20000
+
+# 解析工作行程數（1 代表在本行程內依序解析）；所有年度檔案合計小於 HISTORY_PARALLEL_MIN_BYTES 時不啟用
+HISTORY_WORKERS = int(os.environ.get("RECOMMENDER_HISTORY_WORKERS", min(4, os.cpu_count() or 1)))
+HISTORY_PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+
+# 門檻陣列中代表「未要求此科」或「該年度無此科系」的值
+MISSING_THRESHOLD = -1
+
+YEAR_PATTERN = re.compile(r"(\d{3,4})")
+
+# expanded_score_dict 中的一組「'科目': 分數」
+SCORE_PATTERN = re.compile(r"'([^']*)'\s*:\s*(-?\d+(?:\.\d+)?)")
+
+RAW_SUBJECT_INDEX = {raw: recommender.SUBJECT_INDEX[subject] for raw, subject in recommender.SUBJECT_MAPPING.items()}
+
+# 原始格式需要的欄位
+RAW_COLUMNS = ["program_name", "expanded_score_dict"]
+
+def list_year_files(directory):
+    """目錄內的年度 CSV，依年度排序，回傳 [(年度, 路徑)]"""
+    files = []
+    for path in glob.glob(os.path.join(directory, "*.csv")):
+        match = YEAR_PATTERN.search(os.path.basename(path))
+        if match is None:
+            logger.warning(f"無法從檔名判斷年度，略過 {path}")
+            continue
+        files.append((int(match.group(1)), path))
+    return sorted(files)
+
+def parse_threshold_chunk(score_dicts):
+    """
+    將一批 expanded_score_dict 字串解析為門檻陣列（列數 × 六科，int8），不逐列 literal_eval：
+    相同字串（常見的科目與門檻組合）只解析一次，以正規表示式取出「科目: 分數」。
+    與 parse_programs 相同負分視為 0；含無效科目、分數超過 15 或不是整數、格式無法辨識的列視為無效，
+    整列為 MISSING_THRESHOLD（不截斷小數、不讓超出 int8 的值溢位）。回傳 (門檻陣列, 各列是否無效)；空白的列為缺值，不算無效
+    """
+    codes, uniques = pd.factorize(pd.Series(score_dicts, dtype=object))
+    unique_thresholds = np.full((len(uniques) + 1, len(recommender.SUBJECT_COLUMNS)), MISSING_THRESHOLD, dtype=np.int8)
+    unique_invalid = np.zeros(len(uniques) + 1, dtype=bool)
+    for i, text in enumerate(uniques):
+        text = str(text)
+        pairs = SCORE_PATTERN.findall(text)
+        # 分數格式無法辨識的項目（冒號數多於取出的組數）同樣視為無效
+        if len(pairs) != text.count(":"):
+            unique_invalid[i] = True
+            continue
+        row = unique_thresholds[i]
+        for raw_subject, value in pairs:
+            col = RAW_SUBJECT_INDEX.get(raw_subject)
+            value = float(value)
+            if col is None or not value.is_integer() or value > 15:
+                row[:] = MISSING_THRESHOLD
+                unique_invalid[i] = True
+                break
+            row[col] = max(int(value), 0)
+    # factorize 以 -1 表示缺值，對應到最後一列（全為 MISSING_THRESHOLD）
+    return unique_thresholds[codes], unique_invalid[codes]
+
+def parse_wide_chunk(values):
+    """
+    將一批正規化格式的門檻（列數 × 六科，float，空白為 NaN；無法轉為數字的儲存格為 inf）解析為門檻陣列（int8）。
+    與 parse_threshold_chunk 相同負分視為 0，含超過 15 或不是整數的分數的列視為無效，整列為 MISSING_THRESHOLD。
+    回傳 (門檻陣列, 各列是否無效)
+    """
+    present = ~np.isnan(values)
+    clipped = np.maximum(np.where(present, values, 0), 0)
+    too_high = clipped > 15
+    invalid = (too_high | (np.where(too_high, 0, clipped) % 1 != 0)).any(axis=1)
+    thresholds = np.where(present & ~invalid[:, None], clipped, MISSING_THRESHOLD).astype(np.int8)
+    return thresholds, invalid
+
+def _parse_job(job):
+    """工作行程：解析一個區塊，回傳 (年度序號, 科系 id 陣列, 門檻陣列, 各列是否無效)"""
+    year_index, ids, wide, data = job
+    return (year_index, ids, *(parse_wide_chunk(data) if wide else parse_threshold_chunk(data)))
+
+def _read_chunks(path, chunk_rows):
+    """依檔案欄位辨識格式並分塊讀取，產生 (是否為正規化格式, 區塊)；兩種格式的欄位都不符時拋出 ValueError"""
+    header = pd.read_csv(path, encoding="utf-8-sig", nrows=0)
+    if recommender.is_wide_format(header):
+        columns = ["program_name"] + recommender.WIDE_SUBJECT_COLUMNS
+        wide = True
+    elif set(RAW_COLUMNS).issubset(header.columns):
+        columns = RAW_COLUMNS
+        wide = False
+    else:
+        raise ValueError(f"缺少 {'、'.join(RAW_COLUMNS)} 或正規化格式的欄位")
+    for chunk in pd.read_csv(path, encoding="utf-8-sig", usecols=columns, dtype=str, chunksize=chunk_rows):
+        yield wide, chunk
+
+def _iter_jobs(year_files, name_to_id, chunk_rows, skipped):
+    """
+    依序串流讀取各年度 CSV，只保留目前資料集中存在的科系，
+    產生 (年度序號, 科系 id, 是否為正規化格式, expanded_score_dict 或門檻陣列) 區塊。
+    讀取失敗的年度記錄警告並將年度序號加入 skipped（已產生的區塊由呼叫端捨棄）
+    """
+    for year_index, (_, path) in enumerate(year_files):
+        try:
+            for wide, chunk in _read_chunks(path, chunk_rows):
+                ids = chunk["program_name"].str.strip().map(name_to_id)
+                known = ids.notna().to_numpy()
+                if not known.any():
+                    continue
+                if wide:
+                    cells = chunk[recommender.WIDE_SUBJECT_COLUMNS][known]
+                    data = cells.apply(pd.to_numeric, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+                    # 無法轉為數字的儲存格設為 inf，由 parse_wide_chunk 判定該列無效
+                    data[cells.notna().to_numpy() & np.isnan(data)] = np.inf
+                else:
+                    data = chunk["expanded_score_dict"][known].tolist()
+                yield year_index, ids[known].to_numpy(dtype=np.int64), wide, data
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            logger.warning(f"無法讀取歷年門檻 {path}，略過此年度：{str(e)}")
+            skipped.append(year_index)
+
+def _run_jobs(jobs, executor, max_pending):
+    """依序派送區塊，同時處理中的區塊不超過 max_pending，使記憶體用量與資料量無關"""
+    if executor is None:
+        yield from map(_parse_job, jobs)
+        return
+    pending = deque()
+    for job in jobs:
+        pending.append(executor.submit(_parse_job, job))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def load_history(programs, directory=HISTORY_DIR, workers=HISTORY_WORKERS, chunk_rows=HISTORY_CHUNK_ROWS):
+    """
+    載入歷年門檻並對齊目前資料集的科系 id（以校系名稱比對）。
+    回傳 {"years": 年度 tuple, "thresholds": int8 陣列（年度數 × 科系數 × 六科）}；
+    目錄不存在或沒有可讀取的年度檔案時回傳 None。
+    載入過程只保留結果陣列與處理中的區塊（最多 workers × 2 個），尖峰記憶體不隨年度數增加。
+    資料量小於 HISTORY_PARALLEL_MIN_BYTES 時在本行程內解析，省去啟動工作行程的成本。
+    """
+    if not os.path.isdir(directory):
+        return None
+    year_files = list_year_files(directory)
+    if not year_files:
+        return None
+
+    name_to_id = {program.program_name.strip(): program.id for program in programs}
+    thresholds = np.full(
+        (len(year_files), len(programs), len(recommender.SUBJECT_COLUMNS)), MISSING_THRESHOLD, dtype=np.int8
+    )
+    matched = np.zeros(len(year_files), dtype=np.int64)
+    invalid_ids = [[] for _ in year_files]
+    skipped = []
+    total_bytes = sum(os.path.getsize(path) for _, path in year_files)
+    with METRICS.span("load_history"):
+        # 以 spawn 啟動工作行程：伺服器行程已有其他執行緒，fork 可能複製到被鎖住的鎖
+        executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) if workers > 1 and total_bytes >= HISTORY_PARALLEL_MIN_BYTES else None
+        try:
+            jobs = _iter_jobs(year_files, name_to_id, chunk_rows, skipped)
+            for year_index, ids, chunk_thresholds, chunk_invalid in _run_jobs(jobs, executor, workers * 2):
+                thresholds[year_index, ids] = chunk_thresholds
+                matched[year_index] += len(ids)
+                invalid_ids[year_index].extend(ids[chunk_invalid].tolist())
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    kept = [year_index for year_index in range(len(year_files)) if year_index not in skipped]
+    if not kept:
+        return None
+    for year_index in kept:
+        (year, path), count, invalid = year_files[year_index], matched[year_index], invalid_ids[year_index]
+        logger.info(f"已載入 {year} 年度門檻：{count}/{len(programs)} 個科系")
+        if invalid:
+            names = "、".join(programs[program_id].program_name for program_id in invalid[:5])
+            logger.warning(
+                f"{path}：{len(invalid)} 個科系的門檻格式錯誤（無效科目或分數超過 15、不是整數），已略過：{names}"
+                + ("…" if len(invalid) > 5 else "")
+            )
+    # 略過的年度整個移除（可能已寫入部分區塊）
+    thresholds = thresholds[kept] if len(kept) < len(year_files) else thresholds
+    thresholds.setflags(write=False)
+    return {"years": tuple(year_files[year_index][0] for year_index in kept), "thresholds": thresholds}
+
+def format_history(history, program_id):
+    """單一科系的歷年門檻文字（每年一行），無任何年度資料時回傳空字串"""
+    if history is None:
+        return ""
+    lines = []
+    for year, row in zip(history["years"], history["thresholds"][:, program_id]):
+        required = row != MISSING_THRESHOLD
+        if required.any():
+            lines.append(f"{year}：" + ", ".join(
+                f"{subject}: {int(threshold)} 分"
+                for subject, threshold, is_required in zip(recommender.SUBJECT_COLUMNS, row, required) if is_required
+            ))
+    return "<br>".join(lines)
@@ -0,0 +1,206 @@
+"""階段延遲與計數指標：以 span 記錄各階段耗時，並以 Prometheus 文字或 JSON 格式輸出"""
+import os
+import json
+import time
+import random
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# 指標伺服器埠號（僅綁定 127.0.0.1）；設為 0 可停用。
+# 同一主機的每個伺服器行程需要各自的埠號：serve.py 未設定此變數時改用 Streamlit 埠號 + METRICS_PORT_OFFSET
+METRICS_PORT = int(os.environ.get("RECOMMENDER_METRICS_PORT", 9108))
+METRICS_PORT_OFFSET = 1000
+
+# 未開啟 DEBUG 時，完整內容日誌（科系清單、按鈕鍵等）的抽樣比例
+PAYLOAD_LOG_SAMPLE_RATE = float(os.environ.get("RECOMMENDER_PAYLOAD_LOG_SAMPLE_RATE", 0.0))
+
+# 階段耗時的分桶上限（秒）
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 候選池大小的分桶上限（筆）
+SIZE_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 100000)
+
+def should_log_payload(log):
+    """完整內容日誌的開關：logger 開啟 DEBUG，或依 PAYLOAD_LOG_SAMPLE_RATE 抽樣"""
+    return log.isEnabledFor(logging.DEBUG) or (PAYLOAD_LOG_SAMPLE_RATE > 0 and random.random() < PAYLOAD_LOG_SAMPLE_RATE)
+
+class Histogram:
+    """累積分桶（與 Prometheus histogram 相同語意：bucket 為 ≤ 上限的累計次數）"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class MetricsRegistry:
+    """
+    行程內的指標登錄（執行緒安全）：
+    • counters：單調遞增計數（如請求數）
+    • histograms：耗時、候選池大小等分布
+    • collectors：輸出時才呼叫的函式，回傳 {名稱: 數值} 作為 gauge（如快取命中數）
+    指標以 (名稱, 標籤) 為鍵，標籤為 tuple of (key, value)
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    @contextmanager
+    def span(self, stage):
+        """記錄一個階段的耗時至 recommender_stage_seconds{stage=...}"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("recommender_stage_seconds", time.perf_counter() - start, stage=stage)
+
+    def _gauges(self):
+        gauges = {}
+        for collector in list(self._collectors):
+            try:
+                gauges.update(collector())
+            except Exception as e:
+                logger.warning(f"指標收集失敗：{str(e)}")
+        return gauges
+
+    def to_json(self):
+        """以 JSON 可序列化的 dict 輸出所有指標"""
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in self._counters.items()]
+            histograms = [{"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum,
+                           "buckets": [[str(bound), count] for bound, count in h.cumulative()]}
+                          for (name, labels), h in self._histograms.items()]
+        return {"counters": counters, "histograms": histograms, "gauges": self._gauges()}
+
+    def to_prometheus(self):
+        """以 Prometheus 文字格式輸出所有指標"""
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}{fmt_labels(labels)} {value}")
+            for (name, labels), h in sorted(self._histograms.items()):
+                for bound, count in h.cumulative():
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', le)])} {count}")
+                lines.append(f"{name}_sum{fmt_labels(labels)} {h.sum}")
+                lines.append(f"{name}_count{fmt_labels(labels)} {h.count}")
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+# 全域指標登錄
+METRICS = MetricsRegistry()
+
+# 就緒檢查：回傳 (是否就緒, JSON 物件) 的函式；未設定時一律視為就緒
+_readiness_check = None
+
+def set_readiness_check(check):
+    global _readiness_check
+    _readiness_check = check
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics → Prometheus 文字；GET /metrics.json → JSON；GET /ready → 就緒時 200，否則 503"""
+
+    def do_GET(self):
+        status = 200
+        if self.path == "/ready":
+            ready, payload = _readiness_check() if _readiness_check is not None else (True, {"status": "ready"})
+            status = 200 if ready else 503
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        elif self.path == "/metrics":
+            body = METRICS.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/metrics.json":
+            body = json.dumps(METRICS.to_json(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+# start_metrics_server() 預設使用的埠號，以及無法綁定時是否視為錯誤（由 configure_metrics_server 設定）
+_metrics_port = METRICS_PORT
+_metrics_required = False
+
+def configure_metrics_server(port, required):
+    """
+    設定之後 start_metrics_server() 使用的埠號；required 為真時，埠號無法綁定即拋出 RuntimeError，
+    避免行程在沒有 /ready 與 /metrics 的情況下繼續服務（serve.py 使用）
+    """
+    global _metrics_port, _metrics_required
+    _metrics_port = port
+    _metrics_required = required
+
+def start_metrics_server(port=None):
+    """
+    在背景執行緒啟動指標伺服器（127.0.0.1），埠號為 0 時回傳 None；
+    埠號已被占用時，configure_metrics_server 設為 required 則拋出 RuntimeError，否則記錄警告並回傳 None
+    """
+    port = _metrics_port if port is None else port
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    except OSError as e:
+        message = f"無法啟動指標伺服器（port {port}）：{str(e)}"
+        if _metrics_required:
+            raise RuntimeError(f"{message}；同一主機的每個伺服器行程需使用不同的 RECOMMENDER_METRICS_PORT") from e
+        logger.warning(f"{message}；本行程沒有 /ready 與 /metrics，多個行程時請為每個行程設定不同的 RECOMMENDER_METRICS_PORT")
+        return None
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"指標伺服器已啟動：http://127.0.0.1:{port}/metrics")
+    return server
@@ -0,0 +1,1313 @@
+"""學測志願推薦引擎：資料載入、分類與推薦理由（不依賴 Streamlit，可供網頁介面與批次工具共用）"""
+import os
+import io
+import ast
+import pickle
+import hashlib
+import logging
+import tempfile
+import sys
+import time
+import threading
+import unicodedata
+from typing import NamedTuple
+from collections import OrderedDict
+import pandas as pd
+import numpy as np
+from instrumentation import METRICS, SIZE_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+# 科目名稱映射表
+SUBJECT_MAPPING = {
+    '國': '國文',
+    '英': '英文',
+    '數A': '數學 A',
+    '數B': '數學 B',
+    '社': '社會',
+    '自': '自然'
+}
+
+# 門檻矩陣的欄位順序（對應 SUBJECT_MAPPING 的六個科目）
+SUBJECT_COLUMNS = list(SUBJECT_MAPPING.values())
+SUBJECT_INDEX = {subject: i for i, subject in enumerate(SUBJECT_COLUMNS)}
+
+# 三種志願策略（亦為推薦結果的鍵順序）
+STRATEGY_TYPES = ["保守型", "務實型", "夢幻型"]
+
+# 點陣索引的級分層級（學測級分 0–15）
+SCORE_LEVELS = 16
+
+# 候選池逐段掃描的區塊大小（位元組；每位元組 8 個科系）
+POOL_SCAN_BLOCK = 512
+
+# 資料檔與解析快照（快照與 programs.csv 放在同一目錄，以內容雜湊判斷是否過期）
+PROGRAMS_CSV_PATH = "programs.csv"
+SNAPSHOT_SUFFIX = ".snapshot"
+# 解析結果的結構有變動時請遞增版本，舊快照會自動重建
+SNAPSHOT_VERSION = 7
+
+# 最佳化模式的錄取機率尺度：最小分差為 +d 時錄取機率為 1 / (1 + e^(−d / ADMISSION_SCALE))
+ADMISSION_SCALE = 1.5
+
+# 級分敏感度分析中每科的級分變動
+SWEEP_DELTAS = (-2, -1, 0, 1, 2)
+
+# 校系搜尋回傳的筆數上限
+SEARCH_LIMIT = 20
+
+# 正規化（寬）格式的欄位：每科一欄門檻（空白代表不要求），subjects 依原始順序列出要求的科目（以空白分隔），
+# school / dept 於轉換時預先拆好；載入時不需 literal_eval 與正規表示式（轉換工具見 scripts/convert_catalog.py）
+WIDE_SUBJECT_COLUMNS = list(SUBJECT_MAPPING)
+WIDE_COLUMNS = ["program_name", "school", "dept", "group", "subjects"] + WIDE_SUBJECT_COLUMNS
+
+# 監看 programs.csv 變動的間隔（秒）；設為 0 可停用熱重載
+CATALOG_WATCH_INTERVAL = float(os.environ.get("RECOMMENDER_CATALOG_WATCH_SECONDS", 5))
+
+# 推薦理由範本庫（量化描述）
+REASON_TEMPLATES = {
+    "工程": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強數理或面試準備。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
+    },
+    "管理": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議準備校系特色項目。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他管理科系。"
+    },
+    "文史哲": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強背景知識準備。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議探索其他相關科系。"
+    },
+    "醫藥衛生": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議強化專業科目。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
+    },
+    "資訊": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議提前準備程式基礎。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他資訊科系。"
+    },
+    "生物資源": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議準備相關實務能力。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
+    },
+    "外語": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強語言能力準備。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他外語科系。"
+    },
+    "default": {
+        "頂標": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，符合「頂標」條件，錄取機會極高。",
+        "中段": "平均超出要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「中段」，建議加強準備校系特色。",
+        "後段": "平均落後要求 {mean_diff:+.1f} 分，最小分差 {min_diff:+.1f} 分，屬於「後段」，建議備選其他相關科系。"
+    }
+}
+
+# 內建測試資料（包含 school 和 dept）
+DEFAULT_PROGRAMS = [
+    {
+        "program_name": "世新大學 企業管理學系",
+        "expanded_score_dict": "{'國': 12, '社': 12}",
+        "group": "管理",
+        "school": "世新大學",
+        "dept": "企業管理學系"
+    },
+    {
+        "program_name": "世新大學 傳播管理學系",
+        "expanded_score_dict": "{'國': 11}",
+        "group": "管理",
+        "school": "世新大學",
+        "dept": "傳播管理學系"
+    },
+    {
+        "program_name": "世新大學 行政管理學系",
+        "expanded_score_dict": "{'英': 10, '社': 10}",
+        "group": "管理",
+        "school": "世新大學",
+        "dept": "行政管理學系"
+    },
+    {
+        "program_name": "世新大學 財務金融學系",
+        "expanded_score_dict": "{'數B': 10, '社': 10}",
+        "group": "管理",
+        "school": "世新大學",
+        "dept": "財務金融學系"
+    },
+    {
+        "program_name": "銘傳大學 應用中文與華語文教",
+        "expanded_score_dict": "{'國': 10, '英': 10}",
+        "group": "文史哲",
+        "school": "銘傳大學",
+        "dept": "應用中文與華語文教"
+    },
+    {
+        "program_name": "世新大學 數位多媒體設計學系",
+        "expanded_score_dict": "{'國': 11}",
+        "group": "藝術",
+        "school": "世新大學",
+        "dept": "數位多媒體設計學系"
+    },
+    {
+        "program_name": "某大學 醫學系",
+        "expanded_score_dict": "{'國': 14, '英': 14, '數A': 14, '自': 14}",
+        "group": "醫藥衛生",
+        "school": "某大學",
+        "dept": "醫學系"
+    },
+    {
+        "program_name": "某大學 護理學系",
+        "expanded_score_dict": "{'英': 13, '自': 13}",
+        "group": "醫藥衛生",
+        "school": "某大學",
+        "dept": "護理學系"
+    },
+    {
+        "program_name": "某大學 資訊工程學系",
+        "expanded_score_dict": "{'數A': 12, '自': 12}",
+        "group": "資訊",
+        "school": "某大學",
+        "dept": "資訊工程學系"
+    },
+    {
+        "program_name": "某大學 生物資源學系",
+        "expanded_score_dict": "{'自': 11, '數A': 11}",
+        "group": "生物資源",
+        "school": "某大學",
+        "dept": "生物資源學系"
+    },
+    {
+        "program_name": "國立臺灣大學 外國語文學系",
+        "expanded_score_dict": "{'國': 13, '英': 13}",
+        "group": "外語",
+        "school": "國立臺灣大學",
+        "dept": "外國語文學系"
+    }
+]
+
+class Program(NamedTuple):
+    """
+    不可變的科系紀錄（每個行程只保存一份，session 僅以 id 參照）：
+    raw_subjects / required_subjects / thresholds 三者依序對應，
+    例如 ('國', '社') / ('國文', '社會') / (12, 12)
+    """
+    id: int
+    program_name: str
+    school: str
+    dept: str
+    group: str
+    raw_subjects: tuple
+    required_subjects: tuple
+    thresholds: tuple
+    score: float
+
+def _snapshot_path(csv_path):
+    """快照檔路徑（programs.csv → programs.csv.snapshot）"""
+    return csv_path + SNAPSHOT_SUFFIX
+
+def _load_snapshot(csv_path, csv_hash):
+    """讀取快照；版本或內容雜湊不符、檔案損毀時回傳 None"""
+    path = _snapshot_path(csv_path)
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"讀取快照 {path} 失敗，將重新解析：{str(e)}")
+        return None
+
+    if snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("csv_sha256") != csv_hash:
+        logger.info(f"快照 {path} 已過期，將重新解析 {csv_path}")
+        return None
+    return snapshot["data"]
+
+def _write_snapshot(csv_path, csv_hash, data):
+    """以暫存檔＋os.replace 原子寫入快照，避免其他行程讀到寫到一半的檔案"""
+    path = _snapshot_path(csv_path)
+    snapshot = {"version": SNAPSHOT_VERSION, "csv_sha256": csv_hash, "data": data}
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # mkstemp 建立的檔案權限為 0600：改為與 CSV 相同，其他帳號執行的行程才讀得到快照
+        os.chmod(tmp_path, os.stat(csv_path).st_mode & 0o666)
+        os.replace(tmp_path, path)
+        logger.info(f"已寫入快照 {path}")
+    except OSError as e:
+        logger.warning(f"無法寫入快照 {path}：{str(e)}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def load_catalog(csv_path=PROGRAMS_CSV_PATH, previous=None):
+    """
+    載入資料集：CSV 未變動時直接讀取磁碟快照，
+    否則重新解析並寫入新快照（找不到 CSV 時使用內建測試資料，不寫快照）；
+    傳入 previous（舊版 catalog）時只重新解析有變動的列
+    回傳 catalog：{"programs", "school_list", "group_options", "matrix", "index", "reasons", "search", "row_cache", "version"}
+    """
+    with METRICS.span("load"):
+        return _read_catalog(csv_path, previous)
+
+def _read_catalog(csv_path, previous=None):
+    """load_catalog 的實作（快照 → CSV → 內建測試資料）"""
+    try:
+        with open(csv_path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        logger.warning(f"找不到 {csv_path} 檔案，使用內建測試資料。")
+        return parse_programs(pd.DataFrame(DEFAULT_PROGRAMS), version="builtin")
+
+    csv_hash = hashlib.sha256(raw).hexdigest()
+    catalog = _load_snapshot(csv_path, csv_hash)
+    if catalog is not None:
+        logger.info(f"使用快照載入 {len(catalog['programs'])} 個科系")
+        return catalog
+
+    df = pd.read_csv(io.BytesIO(raw), encoding='utf-8-sig')
+    if is_wide_format(df):
+        catalog = parse_wide_programs(df, version=csv_hash)
+    else:
+        catalog = parse_programs(df, version=csv_hash, previous=previous)
+    _write_snapshot(csv_path, csv_hash, catalog)
+    return catalog
+
+class CatalogStore:
+    """
+    目前使用中的資料集（執行緒安全），並監看 CSV 變動、增量重新載入：
+    • current()：目前版本的 catalog；catalog 建立後不再修改，呼叫端可持續持有以維持一致的版本
+    • refresh()：CSV 的修改時間或大小改變時重新載入（只重新解析變動的列），完成後以單一參照整批替換
+    • start_watching()：背景執行緒每 interval 秒呼叫一次 refresh()
+    重新載入失敗時保留舊版本並記錄錯誤
+    """
+
+    def __init__(self, csv_path=PROGRAMS_CSV_PATH):
+        self.csv_path = csv_path
+        self.reloads = 0
+        self._stat = self._file_stat()
+        self._catalog = self._load()
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def current(self):
+        return self._catalog
+
+    def _load(self, previous=None):
+        """載入監看中的檔案（子類別可改變資料來源，例如共享記憶體）"""
+        return load_catalog(self.csv_path, previous=previous)
+
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.csv_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def refresh(self):
+        """檢查 CSV 是否變動，有新版本時替換並回傳 True"""
+        with self._lock:
+            stat = self._file_stat()
+            if stat == self._stat:
+                return False
+            # 失敗時也記下 stat，等檔案再次變動才重試，不會每個間隔重複報錯
+            self._stat = stat
+            previous = self._catalog
+            try:
+                catalog = self._load(previous)
+            except Exception as e:
+                logger.error(f"重新載入 {self.csv_path} 失敗，繼續使用版本 {previous['version'][:12]}：{str(e)}")
+                return False
+            if catalog["version"] == previous["version"]:
+                return False
+            self._catalog = catalog
+            self.reloads += 1
+
+        METRICS.inc("recommender_catalog_reloads_total")
+        logger.info(f"資料集已更新：版本 {previous['version'][:12]} → {catalog['version'][:12]}，共 {len(catalog['programs'])} 個科系")
+        return True
+
+    def start_watching(self, interval=CATALOG_WATCH_INTERVAL):
+        """啟動背景監看執行緒（interval 為 0 時不監看）"""
+        if not interval or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="catalog-watcher", daemon=True)
+        self._watcher.start()
+        logger.info(f"開始監看 {self.csv_path}（每 {interval} 秒）")
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            self.refresh()
+
+def parse_programs(df, version, previous=None):
+    """
+    預處理資料集，解析 CSV 並過濾無效資料，新增 school 和 dept 欄位；version 為資料來源的識別（CSV 內容雜湊）。
+    傳入 previous（舊版 catalog）時為增量解析：以列內容雜湊比對，只重新解析新增或修改過的列，
+    其餘列沿用 previous["row_cache"] 的結果；門檻矩陣、點陣索引與理由片段則依新的科系清單重建。
+    """
+    # 以原始欄位內容計算每列雜湊（必須在任何欄位修改之前）
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    previous_cache = previous["row_cache"] if previous is not None else {}
+    changed = np.fromiter((h not in previous_cache for h in row_hashes.tolist()), dtype=bool, count=len(df))
+    if previous is not None:
+        logger.info(f"增量解析：{int(changed.sum())}/{len(df)} 列有變動")
+
+    # 清理 group 欄位的空白
+    df["group"] = df["group"].astype(str).str.strip()
+
+    # 生成動態學群選項
+    group_options = sorted(df["group"].dropna().astype(str).str.strip().unique().tolist())
+    logger.info(f"動態生成的學群選項：{group_options}")
+
+    row_cache = {h: previous_cache[h] for h in row_hashes[~changed].tolist()}
+    row_cache.update(_parse_rows(df[changed].copy() if previous is not None else df, row_hashes[changed]))
+
+    # 依 CSV 列順序組出科系清單（id 為在清單中的位置）與學校清單
+    programs_list = []
+    schools = set()
+    for h in row_hashes.tolist():
+        school, program = row_cache[h]
+        schools.add(school)
+        if program is not None:
+            programs_list.append(program._replace(id=len(programs_list)))
+    school_list = ["全部學校"] + sorted(schools)
+
+    program_matrix = build_program_matrix(programs_list)
+    index = build_bitmap_index(program_matrix)
+
+    return {
+        "programs": tuple(programs_list),
+        "school_list": school_list,
+        "group_options": group_options,
+        "matrix": program_matrix,
+        "index": index,
+        "reasons": build_reason_parts(programs_list),
+        "search": build_search_index(programs_list, index["order"]),
+        "row_cache": row_cache,
+        "version": version,
+    }
+
+def derive_school_dept(df):
+    """由 program_name 拆出 school 和 dept 欄位（就地新增，正規化格式在轉換時執行一次）"""
+    # 確保 program_name 和 school 為字串型態
+    df["program_name"] = df["program_name"].astype(str).replace("nan", "")
+    df["school"] = df["program_name"].str.extract(r"^(\S+大學|\S+學院|\S+醫學大學|\S+市立大學)")[0]
+    df["school"] = df["school"].fillna(df["program_name"].str.extract(r"^(\S+)")[0]).fillna("").astype(str)
+    
+    # 提取 dept 欄位
+    df["dept"] = [
+        program_name.replace(school, "").strip()
+        for program_name, school in zip(df["program_name"], df["school"])
+    ]
+    _warn_empty_depts(df)
+    return df
+
+def _warn_empty_depts(df):
+    # 檢查是否有空或異常的 dept 值
+    invalid_depts = df[df["dept"] == ""]
+    if not invalid_depts.empty:
+        logger.warning(f"發現 {len(invalid_depts)} 筆空的 dept 值：{invalid_depts['program_name'].tolist()}")
+
+def _parse_rows(df, row_hashes):
+    """逐列解析科系，回傳 {列雜湊: (學校, Program 或 None)}；無效的列為 None（仍保留學校供學校清單使用）"""
+    derive_school_dept(df)
+    
+    parsed = {}
+    invalid_subjects = set()
+    invalid_scores_log = []
+    skipped_programs = 0
+
+    for (idx, row), row_hash in zip(df.iterrows(), row_hashes.tolist()):
+        school = sys.intern(row["school"])
+        parsed[row_hash] = (school, None)
+        try:
+            score_dict = ast.literal_eval(row["expanded_score_dict"])
+            score_dict = {k: max(0, v) for k, v in score_dict.items()}
+            raw_subjects = list(score_dict.keys())
+            required_subjects = [SUBJECT_MAPPING.get(k, k) for k in raw_subjects]
+            
+            # 檢查科目有效性
+            invalid_subj = [subj for subj in required_subjects if subj not in ["國文", "英文", "數學 A", "數學 B", "社會", "自然"]]
+            if invalid_subj:
+                invalid_subjects.update(invalid_subj)
+                skipped_programs += 1
+                logger.warning(f"行 {idx+1}: {row['program_name']} 包含無效科目 {invalid_subj}")
+                continue
+            
+            # 檢查分數範圍（允許 0-15）
+            invalid_scores = [k for k, v in score_dict.items() if v < 0 or v > 15]
+            if invalid_scores:
+                invalid_scores_log.append((row["program_name"], invalid_scores))
+                skipped_programs += 1
+                logger.warning(f"行 {idx+1}: {row['program_name']} 包含無效分數 {invalid_scores}")
+                continue
+            
+            # 學群、學校、科目名稱大量重複，以 sys.intern 共用同一個字串物件；id 由 parse_programs 依列順序指定
+            parsed[row_hash] = (school, Program(
+                id=-1,
+                program_name=row["program_name"],
+                school=school,
+                dept=row["dept"],
+                group=sys.intern(row["group"]),
+                raw_subjects=tuple(sys.intern(k) for k in raw_subjects),
+                required_subjects=tuple(sys.intern(k) for k in required_subjects),
+                thresholds=tuple(score_dict.values()),
+                score=sum(score_dict.values()),
+            ))
+        except Exception as e:
+            skipped_programs += 1
+            logger.error(f"行 {idx+1}: 解析 {row['program_name']} 時出錯：{str(e)}")
+            continue
+    
+    if invalid_subjects:
+        logger.warning(f"發現無效科目：{', '.join(invalid_subjects)}，已跳過 {skipped_programs} 個科系。")
+    if invalid_scores_log:
+        logger.warning(f"發現分數異常（<0或>15）的科系：{len(invalid_scores_log)} 筆，已跳過。")
+    if skipped_programs > 0:
+        logger.warning(f"共跳過 {skipped_programs} 個無效科系。")
+    return parsed
+
+def is_wide_format(df):
+    """是否為正規化（寬）格式；否則視為原始格式（expanded_score_dict 字串）"""
+    return set(WIDE_COLUMNS).issubset(df.columns)
+
+def parse_wide_programs(df, version):
+    """
+    解析正規化格式：門檻直接取自數值欄位，school / dept 已預先拆好，
+    驗證（負分視為 0、超過 15 級分的科系跳過）以陣列運算完成，結果與 parse_programs 解析原始格式相同。
+    正規化格式本身已無逐列解析成本，不做增量解析（row_cache 為空）。
+    """
+    df = df.copy()
+    df["group"] = df["group"].astype(str).str.strip()
+    for col in ("program_name", "school", "dept"):
+        df[col] = df[col].fillna("").astype(str)
+    df["subjects"] = df["subjects"].fillna("").astype(str)
+    _warn_empty_depts(df)
+
+    group_options = sorted(df["group"].unique().tolist())
+    logger.info(f"動態生成的學群選項：{group_options}")
+    school_list = ["全部學校"] + sorted(df["school"].unique().tolist())
+
+    raw_thresholds = df[WIDE_SUBJECT_COLUMNS].to_numpy(dtype=np.float64)
+    invalid = (raw_thresholds > 15).any(axis=1)
+    for idx in np.flatnonzero(invalid):
+        invalid_scores = [k for k, v in zip(WIDE_SUBJECT_COLUMNS, raw_thresholds[idx]) if v > 15]
+        logger.warning(f"行 {idx+1}: {df['program_name'].iat[idx]} 包含無效分數 {invalid_scores}")
+    if invalid.any():
+        logger.warning(f"發現分數異常（<0或>15）的科系：{int(invalid.sum())} 筆，已跳過。")
+        logger.warning(f"共跳過 {int(invalid.sum())} 個無效科系。")
+    thresholds = np.maximum(raw_thresholds, 0)
+
+    # 相同的科目組合共用同一組 raw_subjects / required_subjects / 欄位索引
+    subject_sets = {}
+    programs_list = []
+    valid = ~invalid
+    for name, school, dept, group, subjects, row in zip(
+        df["program_name"][valid], df["school"][valid], df["dept"][valid],
+        df["group"][valid], df["subjects"][valid], thresholds[valid],
+    ):
+        subject_set = subject_sets.get(subjects)
+        if subject_set is None:
+            raw_subjects = tuple(sys.intern(k) for k in subjects.split())
+            subject_set = subject_sets[subjects] = (
+                raw_subjects,
+                tuple(sys.intern(SUBJECT_MAPPING[k]) for k in raw_subjects),
+                [WIDE_SUBJECT_COLUMNS.index(k) for k in raw_subjects],
+            )
+        raw_subjects, required_subjects, cols = subject_set
+        values = tuple(int(v) if v.is_integer() else v for v in row[cols].tolist())
+        programs_list.append(Program(
+            id=len(programs_list),
+            program_name=name,
+            school=sys.intern(school),
+            dept=dept,
+            group=sys.intern(group),
+            raw_subjects=raw_subjects,
+            required_subjects=required_subjects,
+            thresholds=values,
+            score=sum(values),
+        ))
+
+    program_matrix = build_program_matrix(programs_list)
+    index = build_bitmap_index(program_matrix)
+
+    return {
+        "programs": tuple(programs_list),
+        "school_list": school_list,
+        "group_options": group_options,
+        "matrix": program_matrix,
+        "index": index,
+        "reasons": build_reason_parts(programs_list),
+        "search": build_search_index(programs_list, index["order"]),
+        "row_cache": {},
+        "version": version,
+    }
+
+def build_program_matrix(programs_list):
+    """
+    將科系清單轉為門檻矩陣（科系數 × 六科）：
+    • thresholds：各科最低級分，未要求的科目為 0
+    • required：必填科目遮罩
+    • score / n_required：排序鍵（門檻總和、必填科目數）
+    • group / school：供學群、學校篩選使用
+    """
+    n = len(programs_list)
+    thresholds = np.zeros((n, len(SUBJECT_COLUMNS)), dtype=np.float64)
+    required = np.zeros((n, len(SUBJECT_COLUMNS)), dtype=bool)
+    for i, program in enumerate(programs_list):
+        for subj, threshold in zip(program.required_subjects, program.thresholds):
+            col = SUBJECT_INDEX[subj]
+            thresholds[i, col] = threshold
+            required[i, col] = True
+
+    return {
+        "thresholds": thresholds,
+        "required": required,
+        "score": np.array([p.score for p in programs_list], dtype=np.float64),
+        "n_required": required.sum(axis=1),
+        "group": np.array([p.group for p in programs_list], dtype=object),
+        "school": np.array([p.school for p in programs_list], dtype=object),
+    }
+
+def build_bitmap_index(program_matrix):
+    """
+    建立點陣索引（每個 bitset 以 np.packbits 壓縮，位元位置依推薦排序）：
+    • group / school：各學群、各學校的科系集合
+    • required[科目]：要求該科的科系集合
+    • meets[科目, 級分]：要求該科且門檻 ≤ 該級分的科系集合
+    位元位置 p 對應科系 order[p]，order 依 (score, 必填科目數) 由高至低穩定排序，
+    因此查詢結果解包後即為已排序的候選池，不需再排序。
+    """
+    n = len(program_matrix["score"])
+    order = np.lexsort((-program_matrix["n_required"], -program_matrix["score"]))
+
+    def pack(mask):
+        return np.packbits(mask[order])
+
+    groups = program_matrix["group"]
+    schools = program_matrix["school"]
+    required = program_matrix["required"]
+    thresholds = program_matrix["thresholds"]
+    levels = np.arange(SCORE_LEVELS)
+
+    meets = np.stack([
+        np.stack([pack(required[:, col] & (thresholds[:, col] <= level)) for level in levels])
+        for col in range(len(SUBJECT_COLUMNS))
+    ]) if n else np.zeros((len(SUBJECT_COLUMNS), SCORE_LEVELS, 0), dtype=np.uint8)
+
+    return {
+        "n": n,
+        "order": order,
+        "all": pack(np.ones(n, dtype=bool)),
+        "group": {g: pack(groups == g) for g in np.unique(groups)},
+        "school": {s: pack(schools == s) for s in np.unique(schools)},
+        "required": np.stack([pack(required[:, col]) for col in range(len(SUBJECT_COLUMNS))])
+        if n else np.zeros((len(SUBJECT_COLUMNS), 0), dtype=np.uint8),
+        "meets": meets,
+    }
+
+def _popcount(bits):
+    """計算 bitset 中的科系數"""
+    return int(np.unpackbits(bits).sum())
+
+def take_from_pool(index, bits, cursor, k=None):
+    """
+    從候選池 bitset 的位元位置 cursor 起，依推薦排序取出最多 k 個科系（k=None 取出全部）。
+    以 POOL_SCAN_BLOCK 為單位逐段解包，取滿即停，成本取決於取出數量而非候選池大小。
+    回傳 (科系索引陣列, 下一次取用的 cursor)
+    """
+    n = index["n"]
+    taken = []
+    remaining = k
+    byte = cursor // 8
+    while byte < len(bits) and (remaining is None or remaining > 0):
+        block_end = len(bits) if remaining is None else byte + POOL_SCAN_BLOCK
+        positions = np.flatnonzero(np.unpackbits(bits[byte:block_end])) + byte * 8
+        positions = positions[(positions >= cursor) & (positions < n)]
+        if remaining is not None:
+            positions = positions[:remaining]
+            remaining -= len(positions)
+        taken.append(positions)
+        byte = block_end
+
+    positions = np.concatenate(taken) if taken else np.zeros(0, dtype=np.int64)
+    if remaining == 0:
+        # 已取滿：下次從最後一個取出的科系之後繼續（k=0 時 cursor 不變）
+        next_cursor = int(positions[-1]) + 1 if len(positions) else cursor
+    else:
+        next_cursor = n
+    return index["order"][positions], next_cursor
+
+def query_bitmap_index(index, selected_groups, selected_school, user_scores):
+    """
+    以位元運算一次求出三個候選池：
+    1. 候選 = (所選學群 OR) AND 學校
+    2. 缺科 = OR(未輸入科目的 required)，缺科者不列入任何池
+    3. 未達門檻 = OR(required[科目] AND NOT meets[科目, 你的級分]) → 夢幻型
+    4. 門檻 +2 未達 = OR(required[科目] AND NOT meets[科目, 你的級分-2])；全部達到 → 保守型，其餘 → 務實型
+    回傳 (保守型 bitset, 務實型 bitset, 夢幻型 bitset, missing_subjects_log)；以 take_from_pool 依推薦排序取出科系
+    """
+    empty = np.zeros_like(index["all"])
+
+    with METRICS.span("filter"):
+        if selected_groups:
+            candidates = empty.copy()
+            for group in selected_groups:
+                candidates |= index["group"].get(group, empty)
+        else:
+            candidates = index["all"].copy()
+        if selected_school != "全部學校":
+            candidates &= index["school"].get(selected_school, empty)
+
+    with METRICS.span("classify"):
+        missing = empty.copy()
+        below = empty.copy()
+        tight = empty.copy()
+        missing_subjects_log = {}
+        for col, subj in enumerate(SUBJECT_COLUMNS):
+            required = index["required"][col]
+            if subj not in user_scores:
+                count = _popcount(candidates & required)
+                if count:
+                    missing_subjects_log[subj] = count
+                missing |= required
+                continue
+            level = int(min(max(user_scores[subj], 0), SCORE_LEVELS - 1))
+            below |= required & ~index["meets"][col, level]
+            tight |= (required & ~index["meets"][col, level - 2]) if level >= 2 else required
+
+        eligible = candidates & ~missing
+        ambitious = eligible & below
+        conservative = eligible & ~tight
+        realistic = eligible & ~below & tight
+
+    return (
+        conservative,
+        realistic,
+        ambitious,
+        missing_subjects_log,
+    )
+
+def is_skippable(program, user_scores):
+    """檢查是否應跳過科系（完全無交集才跳過）"""
+    return set(program.required_subjects).isdisjoint(user_scores.keys())
+
+def generate_reason(program, user_input, strategy_type):
+    """
+    生成推薦理由 (量化＋模板)：
+    1. 若沒填任何分數 → 提示輸入成績
+    2. 若缺少必填科目 → 列出缺科目
+    3. 若完全無交集 (is_skippable) → 無法評估
+    4. 否則：
+       • 計算各科 diff、min_diff、mean_diff
+       • 用範本庫 (REASON_TEMPLATES) 依學群＋level(level: 頂標/中段/後段) 產生 summary
+       • details 組合所需科目、你的分數、分差明細
+    """
+    scores = user_input.get("scores", {})
+    # 1. 尚未輸入任何成績
+    if not scores:
+        return {"summary": "請先輸入學測成績。", "details": ""}
+
+    required = program.required_subjects
+    thresholds = program.thresholds
+    group = program.group
+
+    # 2. 缺少必填科目
+    missing = [s for s in required if s not in scores]
+    if missing:
+        return {
+            "summary": f"缺少科目：{', '.join(missing)}",
+            "details": ""
+        }
+
+    # 3. 完全無交集 (自定義跳過條件)
+    if is_skippable(program, scores):
+        return {
+            "summary": "無任何匹配的科目分數，無法評估錄取可能性。",
+            "details": ""
+        }
+
+    # 4. 計算分差
+    user_score_str = ", ".join(f"{subj}: {scores.get(subj, 0)} 分"
+                               for subj in required)
+    program_score_str = ", ".join(f"{subj}: {threshold} 分"
+                                 for subj, threshold in zip(required, thresholds))
+
+    diffs = [scores.get(subj, 0) - threshold
+             for subj, threshold in zip(required, thresholds)]
+    min_diff = min(diffs)
+    mean_diff = sum(diffs) / len(diffs)
+
+    diff_str = ", ".join(f"{subj}: {diff:+.1f} 分"
+                         for subj, diff in zip(required, diffs))
+
+    details = (
+        f"📋 所需科目與分數：{program_score_str}<br>"
+        f"✅ 你的分數：{user_score_str}<br>"
+        f"🔍 分數差距：{diff_str}"
+    )
+
+    # 5. 判斷等級 (level) → 用於選模板
+    if min_diff >= 3:
+        level = "頂標"
+    elif min_diff >= 0:
+        level = "中段"
+    else:
+        level = "後段"
+
+    # 6. 從 REASON_TEMPLATES 裡取對應範本
+    template_group = group if group in REASON_TEMPLATES else "default"
+    summary_tpl = REASON_TEMPLATES[template_group][level]
+
+    # 7. 生成最終 summary（帶 icon）
+    summary = f"💡 {summary_tpl.format(mean_diff=mean_diff, min_diff=min_diff)}"
+
+    return {"summary": summary, "details": details}
+
+def generate_recommendations(catalog, user_input):
+    """
+    依使用者輸入產生推薦（不含任何 UI 狀態）：
+    回傳 {"recommendations": 各策略前 N 名 [{"id": 科系 id, "reason": 推薦理由}],
+          "pools": 各策略候選池 {"bits": bitset, "size": 科系數, "cursor": 已取出前 N 名後的位置},
+          "warnings": 候選不足的提示, "missing_subjects_log": 缺少科目統計}
+    候選池不會完整展開或排序，遞補時以 take_from_pool 從 cursor 繼續取出。
+    user_input["optimize"] 為真時改以 optimize_portfolio 挑選組合，推薦項目另附 "probability"（預估錄取機率），
+    結果另含 "expected_utility"。
+    """
+    index = catalog["index"]
+
+    selected_groups = user_input.get("interests", [])
+    selected_school = user_input.get("school", "全部學校")
+    if not selected_groups:
+        logger.warning("未選擇任何感興趣的學群，將顯示所有有效科系。")
+
+    METRICS.inc("recommender_requests_total")
+
+    # 學群、學校篩選與分類皆由點陣索引以位元運算完成
+    user_scores = user_input.get("scores", {})
+    conservative_bits, realistic_bits, ambitious_bits, missing_subjects_log = query_bitmap_index(
+        index, selected_groups, selected_school, user_scores
+    )
+    if missing_subjects_log:
+        logger.info(f"缺少科目統計：{missing_subjects_log}")
+
+    strategy_allocation = user_input.get("strategy_allocation", {})
+    pool_bits = dict(zip(STRATEGY_TYPES, (conservative_bits, realistic_bits, ambitious_bits)))
+    portfolio = None
+    if user_input.get("optimize"):
+        with METRICS.span("optimize"):
+            portfolio = optimize_portfolio(catalog, pool_bits, user_scores, strategy_allocation)
+
+    recommendations = {}
+    pools = {}
+    warnings = []
+    for strategy_type, bits in pool_bits.items():
+        count = strategy_allocation.get(strategy_type, 0)
+        # 候選池 bitset 會被快取並由多個 session 共用，設為唯讀
+        bits.setflags(write=False)
+        size = _popcount(bits)
+        if portfolio is None:
+            with METRICS.span("sort"):
+                top_idx, cursor = take_from_pool(index, bits, 0, count)
+            probabilities = None
+        else:
+            # 最佳化選出的科系不一定是池中前幾名：遞補改由移除已選科系後的 bitset 從頭依排序取出
+            top_idx, probabilities = portfolio["ids"][strategy_type], portfolio["probabilities"][strategy_type]
+            bits, cursor = portfolio["remaining_bits"][strategy_type], 0
+            bits.setflags(write=False)
+        with METRICS.span("reason"):
+            reasons = generate_reasons(catalog, top_idx, user_input)
+        METRICS.observe("recommender_pool_size", size, buckets=SIZE_BUCKETS, strategy=strategy_type)
+        recommendations[strategy_type] = [
+            {"id": int(i), "reason": reason} for i, reason in zip(top_idx, reasons)
+        ]
+        if probabilities is not None:
+            for item, probability in zip(recommendations[strategy_type], probabilities):
+                item["probability"] = probability
+        pools[strategy_type] = {"bits": bits, "size": size, "cursor": cursor}
+        if size < count:
+            logger.warning(f"{strategy_type} 僅有 {size} 個符合條件的科系，少於要求的 {count} 個")
+            warnings.append(f"{strategy_type} 僅有 {size} 個符合條件的科系，無法滿足 {count} 個志願。")
+
+    logger.info(f"候選池大小 - 保守型: {pools['保守型']['size']} 筆, 務實型: {pools['務實型']['size']} 筆, 夢幻型: {pools['夢幻型']['size']} 筆")
+
+    result = {
+        "recommendations": recommendations,
+        "pools": pools,
+        "warnings": warnings,
+        "missing_subjects_log": missing_subjects_log,
+    }
+    if portfolio is not None:
+        result["expected_utility"] = portfolio["expected_utility"]
+    return result
+
+def admission_probability(min_margin):
+    """以最小分差（你的級分 − 門檻，取所有要求科目中最小者）估計錄取機率（logistic）"""
+    return 1.0 / (1.0 + np.exp(-np.asarray(min_margin, dtype=np.float64) / ADMISSION_SCALE))
+
+def optimize_portfolio(catalog, pool_bits, user_scores, strategy_allocation):
+    """
+    在各策略的志願數限制下，挑選使「預期錄取的最佳志願價值」最大的組合：
+    • 價值 v：科系的 score（門檻總和，與推薦排序相同的鍵）
+    • 錄取機率 p：admission_probability(最小分差)，各科系視為獨立
+    • 目標：E[錄取者中的最大 v]；依 v 由低到高加入科系時 E ← v·p + (1−p)·E
+    動態規劃的狀態為各池已選數量，E 對後續步驟單調遞增，因此每個狀態只保留最大的 E 即為最佳解。
+    同一池內若已有「志願數」個科系的 v 與 p 都不低於某科系，該科系不會出現在最佳解中；
+    分差只有少數整數值，每個分差只需保留 v 最高的前幾名，候選數與資料集大小無關。
+    回傳 {"ids": {策略: 科系 id 陣列（依 v 由高到低）}, "probabilities": {策略: 錄取機率},
+          "remaining_bits": {策略: 移除已選科系後的 bitset}, "expected_utility": E}
+    """
+    index = catalog["index"]
+    matrix = catalog["matrix"]
+    n = index["n"]
+    user_vector = np.array([user_scores.get(subj, 0) for subj in SUBJECT_COLUMNS], dtype=np.float64)
+
+    candidates = []
+    targets = []
+    pool_positions = {}
+    for k, strategy_type in enumerate(STRATEGY_TYPES):
+        bits = pool_bits[strategy_type]
+        positions = np.flatnonzero(np.unpackbits(bits, count=n))
+        pool_positions[strategy_type] = positions
+        target = min(strategy_allocation.get(strategy_type, 0), len(positions))
+        targets.append(target)
+        if target == 0:
+            continue
+        ids = index["order"][positions]
+        required = matrix["required"][ids]
+        margins = np.where(required, user_vector - matrix["thresholds"][ids], np.inf).min(axis=1)
+        # 位元位置已依 v 由高到低排序；穩定排序後取每個分差的前 target 名
+        by_margin = np.argsort(margins, kind="stable")
+        sorted_margins = margins[by_margin]
+        group_start = np.flatnonzero(np.r_[True, sorted_margins[1:] != sorted_margins[:-1]])
+        rank_in_group = np.arange(len(by_margin)) - np.repeat(group_start, np.diff(np.r_[group_start, len(by_margin)]))
+        keep = np.sort(by_margin[rank_in_group < target])
+        for position, program_id, margin in zip(positions[keep], ids[keep], margins[keep]):
+            candidates.append((float(matrix["score"][program_id]), -int(position), k, int(program_id), margin))
+
+    # 依 v 由低到高（同分時排序在後者先加入）逐一考慮，states：{各池已選數: (E, 已選科系)}
+    states = {(0, 0, 0): (0.0, ())}
+    for value, _, k, program_id, margin in sorted(candidates):
+        probability = float(admission_probability(margin))
+        for counts, (expected, chosen) in list(states.items()):
+            if counts[k] >= targets[k]:
+                continue
+            new_counts = counts[:k] + (counts[k] + 1,) + counts[k + 1:]
+            new_expected = value * probability + (1 - probability) * expected
+            if new_counts not in states or new_expected > states[new_counts][0]:
+                states[new_counts] = (new_expected, chosen + ((k, program_id, probability),))
+
+    expected_utility, chosen = states.get(tuple(targets), (0.0, ()))
+    result = {"ids": {}, "probabilities": {}, "remaining_bits": {}, "expected_utility": expected_utility}
+    for k, strategy_type in enumerate(STRATEGY_TYPES):
+        picks = [(program_id, probability) for pool, program_id, probability in reversed(chosen) if pool == k]
+        ids = np.array([program_id for program_id, _ in picks], dtype=np.int64)
+        result["ids"][strategy_type] = ids
+        result["probabilities"][strategy_type] = [probability for _, probability in picks]
+        positions = pool_positions[strategy_type]
+        cleared = positions[np.isin(index["order"][positions], ids)]
+        remaining = pool_bits[strategy_type].copy()
+        np.bitwise_and.at(remaining, cleared // 8, ~(np.uint8(0x80) >> (cleared % 8).astype(np.uint8)))
+        result["remaining_bits"][strategy_type] = remaining
+    return result
+
+def sweep_score_variants(catalog, user_input, deltas=SWEEP_DELTAS):
+    """
+    級分敏感度分析：一次算出已填科目各自加減 deltas 的所有組合（最多 5^6 種）下三個候選池的大小。
+    每個科系對每科只需一個數字「需要的級分變動」（達門檻：門檻 − 你的級分；保守：再 +2），
+    依 deltas 分桶後把所有科系放進 (len(deltas)+1)^k 的直方圖，沿各軸累加即得
+    「每種組合下所有要求科目都達到的科系數」，不需逐一重算每種組合。
+    回傳 None（未填任何科目）或
+      {"subjects": 科目, "deltas": deltas, "eligible": 不缺科的候選數,
+       "pools": {策略: 陣列（各軸依 deltas 順序）}, "valid": 變動後級分仍在 0–15 的組合,
+       "unlocked": {科目: {變動: (新增達門檻的科系數, 其中排序最前的科系 id 或 None)}}}
+    """
+    user_scores = user_input.get("scores", {})
+    subjects = [subj for subj in SUBJECT_COLUMNS if subj in user_scores]
+    if not subjects:
+        return None
+
+    with METRICS.span("sweep"):
+        index = catalog["index"]
+        matrix = catalog["matrix"]
+        pools = query_bitmap_index(
+            index, user_input.get("interests", []), user_input.get("school", "全部學校"), user_scores
+        )[:3]
+        eligible_bits = pools[0] | pools[1] | pools[2]
+        ids = index["order"][np.flatnonzero(np.unpackbits(eligible_bits, count=index["n"]))]
+
+        cols = [SUBJECT_INDEX[subj] for subj in subjects]
+        user_vector = np.array([min(max(user_scores[subj], 0), SCORE_LEVELS - 1) for subj in subjects], dtype=np.float64)
+        required = matrix["required"][ids][:, cols]
+        need = np.where(required, np.ceil(matrix["thresholds"][ids][:, cols] - user_vector), -np.inf)
+
+        deltas = np.asarray(deltas)
+        shape = (len(deltas) + 1,) * len(subjects)
+
+        def reach_counts(need):
+            # 分桶：桶 i 代表「變動 ≥ deltas[i] 即可達到」，最後一桶代表範圍內達不到
+            buckets = np.searchsorted(deltas, need, side="left")
+            histogram = np.zeros(shape, dtype=np.int64)
+            np.add.at(histogram, tuple(buckets.T), 1)
+            for axis in range(len(subjects)):
+                histogram = histogram.cumsum(axis=axis)
+            return histogram[(slice(0, len(deltas)),) * len(subjects)], buckets
+
+        met, met_buckets = reach_counts(need)
+        safe, _ = reach_counts(need + 2)
+
+        valid = np.ones((len(deltas),) * len(subjects), dtype=bool)
+        for axis, score in enumerate(user_vector):
+            in_range = (score + deltas >= 0) & (score + deltas <= SCORE_LEVELS - 1)
+            valid &= np.expand_dims(in_range, [a for a in range(len(subjects)) if a != axis])
+
+        # 單科變動時新增達門檻的科系（ids 已依推薦排序，取第一個即為排序最前者）
+        base = int(np.searchsorted(deltas, 0))
+        base_met = (met_buckets <= base).all(axis=1)
+        others_met = [(np.delete(met_buckets, axis, axis=1) <= base).all(axis=1) for axis in range(len(subjects))]
+        unlocked = {}
+        for axis, subj in enumerate(subjects):
+            unlocked[subj] = {}
+            for j, delta in enumerate(deltas):
+                if delta <= 0:
+                    continue
+                newly = others_met[axis] & (met_buckets[:, axis] <= j) & ~base_met
+                first = np.argmax(newly) if newly.any() else None
+                unlocked[subj][int(delta)] = (int(newly.sum()), int(ids[first]) if first is not None else None)
+
+    return {
+        "subjects": subjects,
+        "deltas": tuple(int(d) for d in deltas),
+        "eligible": len(ids),
+        "pools": {
+            "保守型": safe,
+            "務實型": met - safe,
+            "夢幻型": len(ids) - met,
+        },
+        "valid": valid,
+        "unlocked": unlocked,
+    }
+
+def canonical_input_key(user_input):
+    """
+    將 user_input 轉為可雜湊的標準形式：科目依固定順序、學群排序去重，
+    selected_subjects 由 scores 推得故不納入，確保相同輸入得到相同鍵
+    """
+    scores = user_input.get("scores", {})
+    allocation = user_input.get("strategy_allocation", {})
+    return (
+        tuple((subj, int(scores[subj])) for subj in SUBJECT_COLUMNS if subj in scores),
+        tuple(sorted(set(user_input.get("interests", [])))),
+        user_input.get("school", "全部學校"),
+        tuple(int(allocation.get(stype, 0)) for stype in STRATEGY_TYPES),
+        bool(user_input.get("optimize", False)),
+    )
+
+class RecommendationCache:
+    """
+    跨 session 共用的推薦結果快取（LRU，上限 maxsize 筆，執行緒安全）：
+    • 以 canonical_input_key 為鍵，快取 generate_recommendations 的結果
+    • 資料集版本（catalog["version"]）改變時整批失效
+    • 快取值為共用物件，呼叫端不可修改（需附加 uid 等 session 狀態時請先複製）
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, catalog, user_input):
+        """取得快取結果；未命中時計算並寫入"""
+        key = canonical_input_key(user_input)
+        with self._lock:
+            if catalog["version"] != self._version:
+                if self._entries:
+                    logger.info(f"資料集版本已變更，清除 {len(self._entries)} 筆推薦快取")
+                self._entries.clear()
+                self._version = catalog["version"]
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        # 計算不持有鎖，避免阻塞其他 session；同鍵同時計算時以後寫入者為準
+        result = generate_recommendations(catalog, user_input)
+
+        with self._lock:
+            if catalog["version"] == self._version:
+                self._entries[key] = result
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def stats(self):
+        """命中統計"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+def build_reason_parts(programs_list):
+    """
+    預先組好推薦理由中與學生分數無關的部分（載入時計算一次）：
+    • requirement_str：「所需科目與分數」字串
+    • subject_cols：必填科目在門檻矩陣中的欄位（依科系原始科目順序）
+    • templates：各學群對應的 REASON_TEMPLATES（無專屬範本者使用 default）
+    """
+    requirement_str = []
+    subject_cols = []
+    for program in programs_list:
+        requirement_str.append(", ".join(
+            f"{subj}: {threshold} 分" for subj, threshold in zip(program.required_subjects, program.thresholds)
+        ))
+        subject_cols.append(tuple(SUBJECT_INDEX[subj] for subj in program.required_subjects))
+
+    groups = {program.group for program in programs_list}
+    return {
+        "requirement_str": tuple(requirement_str),
+        "subject_cols": tuple(subject_cols),
+        "templates": {group: REASON_TEMPLATES.get(group, REASON_TEMPLATES["default"]) for group in groups},
+    }
+
+def generate_reasons(catalog, program_ids, user_input):
+    """
+    批次產生推薦理由（結果與逐筆呼叫 generate_reason 相同）：
+    以門檻矩陣一次算出所有科系的分差、最小分差、平均分差與等級，
+    再套用載入時預先組好的字串與範本，回傳與 program_ids 同序的 [{"summary", "details"}]
+    """
+    scores = user_input.get("scores", {})
+    program_ids = np.asarray(program_ids, dtype=np.int64)
+    if not scores:
+        return [{"summary": "請先輸入學測成績。", "details": ""} for _ in program_ids]
+
+    programs = catalog["programs"]
+    parts = catalog["reasons"]
+    required = catalog["matrix"]["required"][program_ids]
+    thresholds = catalog["matrix"]["thresholds"][program_ids]
+
+    user_vector = np.array([scores.get(subj, 0) for subj in SUBJECT_COLUMNS], dtype=np.float64)
+    provided = np.array([subj in scores for subj in SUBJECT_COLUMNS])
+    missing = (required & ~provided).any(axis=1)
+    n_required = required.sum(axis=1)
+
+    diffs = user_vector - thresholds
+    min_diff = np.where(required, diffs, np.inf).min(axis=1, initial=np.inf)
+    mean_diff = np.where(required, diffs, 0).sum(axis=1) / np.maximum(n_required, 1)
+    level = np.where(min_diff >= 3, "頂標", np.where(min_diff >= 0, "中段", "後段"))
+
+    # 「你的分數」字串只取決於必填科目組合，同組合共用
+    user_score_cache = {}
+    reasons = []
+    for row, pid in enumerate(program_ids):
+        program = programs[pid]
+        required_subjects = program.required_subjects
+        if missing[row]:
+            missing_subjects = [s for s in required_subjects if s not in scores]
+            reasons.append({"summary": f"缺少科目：{', '.join(missing_subjects)}", "details": ""})
+            continue
+        if n_required[row] == 0:
+            reasons.append({"summary": "無任何匹配的科目分數，無法評估錄取可能性。", "details": ""})
+            continue
+
+        user_score_str = user_score_cache.get(required_subjects)
+        if user_score_str is None:
+            user_score_str = ", ".join(f"{subj}: {scores.get(subj, 0)} 分" for subj in required_subjects)
+            user_score_cache[required_subjects] = user_score_str
+        diff_str = ", ".join(
+            f"{subj}: {diffs[row, col]:+.1f} 分"
+            for subj, col in zip(required_subjects, parts["subject_cols"][pid])
+        )
+        summary_tpl = parts["templates"][program.group][level[row]]
+        reasons.append({
+            "summary": f"💡 {summary_tpl.format(mean_diff=mean_diff[row], min_diff=min_diff[row])}",
+            "details": (
+                f"📋 所需科目與分數：{parts['requirement_str'][pid]}<br>"
+                f"✅ 你的分數：{user_score_str}<br>"
+                f"🔍 分數差距：{diff_str}"
+            ),
+        })
+    return reasons
+
+def normalize_search_text(text):
+    """搜尋用的正規化：全形轉半形（NFKC）、英文轉小寫、「臺」視同「台」、去除空白"""
+    return "".join(unicodedata.normalize("NFKC", str(text)).lower().replace("臺", "台").split())
+
+def _search_code(gram):
+    """單字或雙字的整數編碼：單字為字碼，雙字為 (第一字 + 1) << 21 | 第二字（Unicode 字碼小於 2^21，兩者不會重疊）"""
+    if len(gram) == 1:
+        return ord(gram)
+    return ((ord(gram[0]) + 1) << 21) | ord(gram[1])
+
+def _search_slot(keys, gram):
+    """gram 在排序 keys 中的位置，不存在時回傳 -1"""
+    code = _search_code(gram)
+    slot = int(np.searchsorted(keys, code))
+    return slot if slot < len(keys) and keys[slot] == code else -1
+
+def build_search_index(programs_list, order):
+    """
+    建立校系搜尋的字元 n-gram 索引（載入時計算一次）：
+    • keys：校系名稱、學校、科系中出現的所有單字與雙字（排序的整數編碼，見 _search_code，以二分搜尋查找）
+    • offsets / postings：各 key 對應的科系 id（postings[offsets[k]:offsets[k+1]]，id 遞增）
+    • text：各科系正規化後的校系名稱、學校、科系（以換行分隔，比對時不會跨欄位）
+    • prefix：科系名稱、學校名稱開頭 1、2 字的 key 位置（科系 1 字、科系 2 字、學校 1 字、學校 2 字；無則為 -1）
+    • name_length / rank：排序鍵（校系名稱長度、在推薦排序中的位置）
+    n-gram 以 numpy 對全部文字的字碼一次取出，不逐字建立 Python 字串
+    """
+    n = len(programs_list)
+    # 學校、科系名稱大量重複，正規化結果依字串快取
+    normalized = {}
+    texts = []
+    for program in programs_list:
+        fields = []
+        for field in (program.program_name, program.school, program.dept):
+            text = normalized.get(field)
+            if text is None:
+                text = normalized[field] = normalize_search_text(field)
+            fields.append(text)
+        texts.append("\n".join(fields))
+
+    # 各科系文字以換行串接後轉為字碼陣列；換行為欄位與科系的分隔，不與前後字組成雙字
+    chars = np.frombuffer("\n".join(texts).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+    owner = np.repeat(np.arange(n, dtype=np.int64), [len(text) + 1 for text in texts])[:len(chars)]
+    separator = chars == ord("\n")
+    unigram = ~separator
+    bigram = unigram[:-1] & unigram[1:]
+    codes = np.concatenate([chars[unigram], ((chars[:-1][bigram] + 1) << 21) | chars[1:][bigram]])
+    ids = np.concatenate([owner[unigram], owner[:-1][bigram]])
+
+    # 依 (key, 科系 id) 排序並去除同一科系的重複 key
+    sort = np.lexsort((ids, codes))
+    codes = codes[sort]
+    ids = ids[sort]
+    distinct = np.ones(len(codes), dtype=bool)
+    distinct[1:] = (codes[1:] != codes[:-1]) | (ids[1:] != ids[:-1])
+    codes = codes[distinct]
+    flat = ids[distinct].astype(np.int32)
+    key_start = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.zeros(0, dtype=np.int64)
+    keys = codes[key_start]
+    offsets = np.append(key_start, len(codes)).astype(np.int64)
+
+    prefix_codes = np.full((n, 4), -1, dtype=np.int64)
+    for i, text in enumerate(texts):
+        _, school, dept = text.split("\n")
+        for col, field in ((0, dept), (2, school)):
+            if field:
+                prefix_codes[i, col] = _search_code(field[:1])
+                prefix_codes[i, col + 1] = _search_code(field[:2])
+    # 開頭的字一定出現在 keys 中，searchsorted 即為其位置
+    prefix = np.where(prefix_codes >= 0, np.searchsorted(keys, prefix_codes), -1).astype(np.int32)
+    rank = np.empty(n, dtype=np.int32)
+    rank[order] = np.arange(n, dtype=np.int32)
+
+    return {
+        "keys": keys,
+        "offsets": offsets,
+        "postings": flat,
+        "text": tuple(texts),
+        "prefix": prefix,
+        "name_length": np.array([len(program.program_name) for program in programs_list], dtype=np.int32),
+        "rank": rank,
+    }
+
+def _match_search_term(search, term):
+    """
+    單一查詢詞的科系 id（遞增）：1–2 字直接取 postings；
+    較長的詞取各雙字 postings 的交集（由最短的開始），再確認整個詞確實出現
+    """
+    keys = search["keys"]
+    offsets = search["offsets"]
+    postings = search["postings"]
+    grams = [term] if len(term) <= 2 else {term[i:i + 2] for i in range(len(term) - 1)}
+    lists = []
+    for gram in grams:
+        slot = _search_slot(keys, gram)
+        if slot < 0:
+            return np.zeros(0, dtype=np.int32)
+        lists.append(postings[offsets[slot]:offsets[slot + 1]])
+    lists.sort(key=len)
+    candidates = lists[0]
+    for ids in lists[1:]:
+        candidates = np.intersect1d(candidates, ids, assume_unique=True)
+    if len(term) <= 2:
+        return candidates
+    texts = search["text"]
+    return candidates[np.fromiter((term in texts[i] for i in candidates), dtype=bool, count=len(candidates))]
+
+def search_programs(catalog, query, limit=SEARCH_LIMIT):
+    """
+    搜尋校系名稱、學校與科系：以空白分隔的每個詞都需出現（不分全半形、大小寫，「臺」視同「台」）。
+    排序：科系名稱以第一個詞開頭 > 學校名稱以第一個詞開頭 > 其他，其次為名稱較短、推薦排序較前。
+    回傳最多 limit 個科系 id
+    """
+    search = catalog["search"]
+    terms = [term for term in (normalize_search_text(part) for part in str(query).split()) if term]
+    if not terms:
+        return []
+
+    with METRICS.span("search"):
+        hits = None
+        for term in terms:
+            matched = _match_search_term(search, term)
+            hits = matched if hits is None else np.intersect1d(hits, matched, assume_unique=True)
+            if not len(hits):
+                return []
+
+        # 以開頭 1–2 字的 key 位置判斷是否以第一個詞開頭；更長的詞只對開頭 2 字相符者再逐筆確認
+        first = terms[0]
+        slot = _search_slot(search["keys"], first[:2])
+        col = min(len(first), 2) - 1
+        prefix = search["prefix"][hits]
+        dept_prefix = prefix[:, col] == slot
+        school_prefix = prefix[:, col + 2] == slot
+        if len(first) > 2:
+            texts = search["text"]
+            for row in np.flatnonzero(dept_prefix | school_prefix):
+                _, school, dept = texts[hits[row]].split("\n")
+                dept_prefix[row] = dept.startswith(first)
+                school_prefix[row] = school.startswith(first)
+        tier = np.where(dept_prefix, 0, np.where(school_prefix, 1, 2)).astype(np.int64)
+        # 三個排序鍵合併為單一整數（推薦排序位置 < 2^24、名稱長度 < 2^16），只對前 limit 名完整排序
+        key = (tier << 40) | (search["name_length"][hits].astype(np.int64) << 24) | search["rank"][hits]
+        if len(key) > limit:
+            top = np.argpartition(key, limit)[:limit]
+            hits = hits[top]
+            key = key[top]
+        return hits[np.argsort(key)].tolist()
+
+def classify_programs(catalog, program_ids, user_scores):
+    """
+    個別判斷科系對此學生屬於哪一類（規則與 query_bitmap_index 相同，但不套用學群、學校篩選）：
+    缺少必填科目 →「缺少科目」；任一科未達門檻 → 夢幻型；各科皆超過門檻 2 級分以上 → 保守型；其餘 → 務實型。
+    回傳與 program_ids 同序的分類字串
+    """
+    program_ids = np.asarray(program_ids, dtype=np.int64)
+    required = catalog["matrix"]["required"][program_ids]
+    thresholds = catalog["matrix"]["thresholds"][program_ids]
+    levels = np.array(
+        [int(min(max(user_scores.get(subj, 0), 0), SCORE_LEVELS - 1)) for subj in SUBJECT_COLUMNS], dtype=np.float64
+    )
+    provided = np.array([subj in user_scores for subj in SUBJECT_COLUMNS])
+    missing = (required & ~provided).any(axis=1)
+    margin = np.where(required, levels - thresholds, np.inf).min(axis=1, initial=np.inf)
+    labels = np.where(missing, "缺少科目", np.where(margin < 0, "夢幻型", np.where(margin < 2, "務實型", "保守型")))
+    return labels.tolist()
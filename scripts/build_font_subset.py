@@ -0,0 +1,58 @@
+"""
+產生離線用的 Noto Sans TC 子集字型（static/fonts/NotoSansTC-subset.woff2）。
+
+只保留介面文字與 programs.csv 中實際出現的字元，檔案大小約為完整字型的一小部分。
+預設的 static/style.css 只使用本機安裝的字型；產生子集後需在 @font-face 的 src 加上此檔才會使用。
+需要 fontTools 與 brotli（僅建置時使用，列於 requirements-dev.txt）：
+  pip install -r requirements-dev.txt
+  python scripts/build_font_subset.py /path/to/NotoSansTC-Regular.ttf
+"""
+import os
+import sys
+import string
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 字元來源：介面文字與資料集
+TEXT_SOURCES = ["app.py", "recommender.py", "programs.csv"]
+OUTPUT_PATH = os.path.join(ROOT, "static", "fonts", "NotoSansTC-subset.woff2")
+
+# 常用全形標點（學生輸入與理由文字中會出現）
+EXTRA_CHARACTERS = "，。、；：？！「」『』（）《》〈〉…—～．＋－％"
+
+def collect_characters():
+    """收集所有來源檔案中出現的字元"""
+    characters = set(string.printable) | set(EXTRA_CHARACTERS)
+    for name in TEXT_SOURCES:
+        path = os.path.join(ROOT, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, encoding="utf-8-sig") as f:
+            characters.update(f.read())
+    return "".join(sorted(c for c in characters if c.isprintable()))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="產生 Noto Sans TC 子集字型")
+    parser.add_argument("font", help="完整的 Noto Sans TC 字型檔（.ttf/.otf，可為可變字重版本）")
+    parser.add_argument("-o", "--output", default=OUTPUT_PATH, help="輸出的 woff2 路徑")
+    args = parser.parse_args(argv)
+
+    try:
+        from fontTools import subset
+    except ImportError:
+        sys.exit("需要 fontTools：pip install -r requirements-dev.txt")
+
+    characters = collect_characters()
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    subset.main([
+        args.font,
+        f"--text={characters}",
+        "--flavor=woff2",
+        "--layout-features=*",
+        f"--output-file={args.output}",
+    ])
+    print(f"已輸出 {args.output}（{len(characters)} 個字元，{os.path.getsize(args.output)} bytes）")
+
+if __name__ == "__main__":
+    main()
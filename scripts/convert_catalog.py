@@ -0,0 +1,79 @@
+"""
+將原始格式的校系資料（expanded_score_dict 等 Python 字面值字串）轉為正規化（寬）格式。
+
+正規化格式欄位：program_name, school, dept, group, subjects, 國, 英, 數A, 數B, 社, 自
+  • 國…自：各科最低級分，空白代表不要求
+  • subjects：要求的科目，依原始順序以空白分隔（決定推薦理由中科目的列出順序）
+  • school / dept：由 program_name 預先拆好
+required_subjects 與 score_dict 欄位載入時不會用到，轉換後不再保留。
+含無效科目的科系（載入時本來就會跳過）不寫入輸出；其餘驗證仍由載入時處理。
+
+recommender.load_catalog 會依欄位自動辨識兩種格式，轉換後直接取代 programs.csv 即可：
+  python scripts/convert_catalog.py programs.csv -o programs.csv
+"""
+import os
+import ast
+import sys
+import logging
+import argparse
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import recommender  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+def convert(df):
+    """原始格式 DataFrame → 正規化格式 DataFrame"""
+    if recommender.is_wide_format(df):
+        logger.info("資料已是正規化格式，不需轉換")
+        return df[recommender.WIDE_COLUMNS]
+
+    df = recommender.derive_school_dept(df.copy())
+    df["group"] = df["group"].astype(str).str.strip()
+
+    rows = []
+    skipped = 0
+    for idx, row in enumerate(df.itertuples(index=False)):
+        try:
+            score_dict = ast.literal_eval(row.expanded_score_dict)
+        except (ValueError, SyntaxError) as e:
+            logger.error(f"行 {idx+1}: 解析 {row.program_name} 時出錯：{str(e)}")
+            skipped += 1
+            continue
+        invalid_subj = [k for k in score_dict if k not in recommender.SUBJECT_MAPPING]
+        if invalid_subj:
+            logger.warning(f"行 {idx+1}: {row.program_name} 包含無效科目 {invalid_subj}，不寫入輸出")
+            skipped += 1
+            continue
+        rows.append({
+            "program_name": row.program_name,
+            "school": row.school,
+            "dept": row.dept,
+            "group": row.group,
+            "subjects": " ".join(score_dict),
+            **score_dict,
+        })
+
+    wide = pd.DataFrame(rows, columns=recommender.WIDE_COLUMNS)
+    # 門檻皆為整數時以可為空的整數欄位輸出，避免寫成 12.0
+    for col in recommender.WIDE_SUBJECT_COLUMNS:
+        if (wide[col].dropna() % 1 == 0).all():
+            wide[col] = wide[col].astype("Int64")
+    logger.info(f"已轉換 {len(wide)} 個科系，略過 {skipped} 筆")
+    return wide
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="將校系資料轉為正規化（寬）格式")
+    parser.add_argument("source", help="原始格式 CSV")
+    parser.add_argument("-o", "--output", required=True, help="輸出 CSV（可與來源相同以就地轉換）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    df = pd.read_csv(args.source, encoding="utf-8-sig")
+    convert(df).to_csv(args.output, index=False, encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+正式環境的啟動方式：先在背景開始預熱（warmup.start()），再於同一個行程內啟動 Streamlit 伺服器，
+第一位使用者不必負擔資料集載入與索引、快取建立的時間。
+
+負載平衡器的就緒檢查請使用指標伺服器的 GET http://127.0.0.1:<指標埠號>/ready
+（預熱完成前回應 503）；Streamlit 本身的 /_stcore/health 在伺服器啟動後即回應 200，不代表已預熱。
+
+指標埠號：設定 RECOMMENDER_METRICS_PORT 時使用該值，否則為 Streamlit 埠號 + 1000（--server.port 8501 → 9501）。
+同一主機執行多個工作行程時（例如搭配 shared_catalog.py），每個工作行程各自回報就緒狀態，
+負載平衡器應對每個後端（Streamlit 埠號）檢查其對應的指標埠號，而非共用一個；
+指標埠號無法綁定時（已被占用）本程式直接結束並回傳非 0 結束碼，不會在沒有 /ready 的情況下開始服務。
+
+用法（其後的參數原樣傳給 streamlit run）：
+  python serve.py --server.port 8501 --server.headless true     # 就緒檢查：127.0.0.1:9501/ready
+  python serve.py --server.port 8502 --server.headless true     # 就緒檢查：127.0.0.1:9502/ready
+"""
+import os
+import sys
+import logging
+from streamlit.web import cli
+
+import warmup
+from instrumentation import METRICS_PORT, METRICS_PORT_OFFSET, configure_metrics_server
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+# Streamlit 的預設埠號
+DEFAULT_SERVER_PORT = 8501
+
+def server_port(args):
+    """streamlit run 參數（--server.port）或 STREAMLIT_SERVER_PORT 指定的埠號"""
+    port = os.environ.get("STREAMLIT_SERVER_PORT", DEFAULT_SERVER_PORT)
+    for i, arg in enumerate(args):
+        if arg == "--server.port" and i + 1 < len(args):
+            port = args[i + 1]
+        elif arg.startswith("--server.port="):
+            port = arg.split("=", 1)[1]
+    return int(port)
+
+def metrics_port(args):
+    """本行程的指標埠號：RECOMMENDER_METRICS_PORT，未設定時為 Streamlit 埠號 + METRICS_PORT_OFFSET"""
+    if "RECOMMENDER_METRICS_PORT" in os.environ:
+        return METRICS_PORT
+    return server_port(args) + METRICS_PORT_OFFSET
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    args = sys.argv[1:] if argv is None else argv
+    configure_metrics_server(metrics_port(args), required=True)
+    try:
+        warmup.start()
+    except RuntimeError as e:
+        sys.exit(str(e))
+    cli.main(["run", APP_PATH, *args], prog_name="streamlit")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Session 記憶體用量估算與回報（不依賴 Streamlit，由 app.py 傳入 session_state）"""
+import os
+import sys
+import json
+import atexit
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 推薦器擁有的 session_state 鍵
+RECOMMENDER_SESSION_KEYS = ("recommendation_data", "shown_items", "available_pools", "removed_items", "prev_input", "user_input")
+
+# 單一 session 的記憶體預算（位元組），超過時記錄警告
+SESSION_MEMORY_BUDGET_BYTES = int(os.environ.get("RECOMMENDER_SESSION_BUDGET_BYTES", 256 * 1024))
+
+# 用量紀錄檔（JSON Lines）；預設停用，設定路徑（例如 session_footprint.jsonl）時開啟
+FOOTPRINT_LOG_PATH = os.environ.get("RECOMMENDER_FOOTPRINT_LOG", "")
+
+# 用量紀錄檔的大小上限（位元組）；超過時改名為 <路徑>.1（覆蓋前一份）後重新開始，最多占用兩倍空間
+FOOTPRINT_LOG_MAX_BYTES = int(os.environ.get("RECOMMENDER_FOOTPRINT_LOG_MAX_BYTES", 16 * 1024 * 1024))
+
+# 用量紀錄由背景執行緒批次寫入的時間間隔（秒）
+FOOTPRINT_FLUSH_SECONDS = 5
+
+# 超過此秒數未更新的 session 視為已結束，不列入彙總
+SESSION_TTL_SECONDS = 3600
+
+def estimate_size(obj, seen=None):
+    """
+    估算物件的遞迴位元組數，回傳 (owned, shared)：
+    • owned：此 session 獨有的物件
+    • shared：唯讀 numpy 陣列（跨 session 共用的候選池 bitset 等），只計入 shared
+    同一物件只計算一次（seen 以 id 去重，可跨多個鍵共用）
+    """
+    if seen is None:
+        seen = set()
+    owned = 0
+    shared = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+
+        if isinstance(item, np.ndarray):
+            if item.flags.writeable:
+                owned += sys.getsizeof(item) + (0 if item.base is None and item.flags.owndata else item.nbytes)
+            else:
+                shared += item.nbytes
+            continue
+
+        owned += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+    return owned, shared
+
+def measure_session(session_state):
+    """量測推薦器相關 session_state 鍵的用量"""
+    seen = set()
+    keys = {}
+    total = 0
+    total_shared = 0
+    for key in RECOMMENDER_SESSION_KEYS:
+        if key not in session_state:
+            continue
+        owned, shared = estimate_size(session_state[key], seen)
+        keys[key] = owned
+        total += owned
+        total_shared += shared
+    return {"bytes": total, "shared_bytes": total_shared, "keys": keys}
+
+class SessionFootprintRegistry:
+    """
+    行程內所有 session 的最新用量（執行緒安全）：
+    每次記錄時若用量有變動，暫存一行 JSON（含彙總數字），由 flush() 整批附加至 FOOTPRINT_LOG_PATH，
+    不在畫面重跑中寫檔；start_flushing() 啟動背景執行緒每 interval 秒 flush 一次，行程結束時也會 flush。
+    紀錄檔超過 max_bytes 時輪替為 <路徑>.1；未設定紀錄檔時不暫存、也不啟動背景執行緒。
+    超過 SESSION_MEMORY_BUDGET_BYTES 時記錄警告（每個 session 只警告一次）
+    """
+
+    def __init__(self, budget_bytes=SESSION_MEMORY_BUDGET_BYTES, log_path=FOOTPRINT_LOG_PATH, max_bytes=FOOTPRINT_LOG_MAX_BYTES):
+        self.budget_bytes = budget_bytes
+        self.log_path = log_path
+        self.max_bytes = max_bytes
+        self._sessions = {}
+        self._warned = set()
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flusher = None
+        atexit.register(self.flush)
+
+    def record(self, session_id, footprint):
+        now = time.time()
+        with self._lock:
+            previous = self._sessions.get(session_id)
+            self._sessions[session_id] = (now, footprint)
+            self._prune(now)
+            aggregate = self._aggregate()
+            over_budget = footprint["bytes"] > self.budget_bytes and session_id not in self._warned
+            if over_budget:
+                self._warned.add(session_id)
+
+        if over_budget:
+            logger.warning(f"session {session_id} 用量 {footprint['bytes']} bytes 超過預算 {self.budget_bytes} bytes：{footprint['keys']}")
+        if self.log_path and (previous is None or previous[1] != footprint):
+            with self._lock:
+                self._buffer.append({"ts": now, "session": session_id, **footprint, "aggregate": aggregate})
+
+    def aggregate(self):
+        """彙總：session 數、總用量、最大與平均用量"""
+        with self._lock:
+            self._prune(time.time())
+            return self._aggregate()
+
+    def _aggregate(self):
+        sizes = [footprint["bytes"] for _, footprint in self._sessions.values()]
+        return {
+            "sessions": len(sizes),
+            "total_bytes": sum(sizes),
+            "max_bytes": max(sizes, default=0),
+            "mean_bytes": sum(sizes) / len(sizes) if sizes else 0.0,
+        }
+
+    def _prune(self, now):
+        expired = [sid for sid, (ts, _) in self._sessions.items() if now - ts > SESSION_TTL_SECONDS]
+        for sid in expired:
+            del self._sessions[sid]
+            self._warned.discard(sid)
+
+    def flush(self):
+        """將暫存的用量紀錄整批附加至紀錄檔，回傳寫入的筆數"""
+        with self._lock:
+            entries, self._buffer = self._buffer, []
+        if not entries or not self.log_path:
+            return 0
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        try:
+            with self._write_lock:
+                self._rotate()
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+        except OSError as e:
+            logger.warning(f"無法寫入用量紀錄 {self.log_path}：{str(e)}")
+            return 0
+        return len(entries)
+
+    def _rotate(self):
+        """紀錄檔達到大小上限時改名為 <路徑>.1（覆蓋前一份）"""
+        try:
+            size = os.path.getsize(self.log_path)
+        except FileNotFoundError:
+            return
+        if size >= self.max_bytes:
+            os.replace(self.log_path, self.log_path + ".1")
+            logger.info(f"用量紀錄 {self.log_path} 已達 {size} bytes，輪替為 {self.log_path}.1")
+
+    def start_flushing(self, interval=FOOTPRINT_FLUSH_SECONDS):
+        """啟動背景寫入執行緒（未設定紀錄檔時不啟動）"""
+        if self._flusher is not None or not self.log_path:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, args=(interval,), name="footprint-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
@@ -0,0 +1,196 @@
+"""
+Session 推薦狀態的持久化：重新整理頁面或 websocket 重新連線後，以網址上的 session 識別碼（?sid=）
+從本機 SQLite 還原推薦結果、候選池遞補位置與移除紀錄，不需重新送出、也不重新計算推薦。
+
+每列只保存精簡的狀態（不含科系資料與推薦理由）：
+  • state：zlib 壓縮的 JSON，含資料集版本、使用者輸入、各策略顯示中的 [科系 id, uid(, 機率)]、
+    遞補 cursor 與剩餘數、移除過的科系 id 與警告訊息
+  • pools：三個候選池 bitset 依 STRATEGY_TYPES 順序串接後以 zlib 壓縮
+save() 只在記憶體中登記最新狀態（同一 session 多次移除只保留最後一次），序列化與寫入由背景執行緒
+每 SESSION_FLUSH_SECONDS 秒以單一交易完成，不占用畫面重跑的時間；寫入失敗時狀態保留到下一次寫入。
+
+隱私：保存的狀態含學生的各科級分與志願偏好，保留 SESSION_RETENTION_DAYS 天（自最後一次更新起算）後刪除。
+網址上的 sid 是讀取狀態的唯一憑證，取得該網址（分享連結、瀏覽紀錄、代理伺服器紀錄）即可還原他人的推薦，
+因此預設停用，需以 RECOMMENDER_SESSION_PERSISTENCE=1 明確開啟；開啟時應確保網址不外流。
+"""
+import os
+import json
+import time
+import zlib
+import atexit
+import sqlite3
+import logging
+import threading
+import numpy as np
+import recommender
+from instrumentation import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Session 狀態持久化；預設停用，設為 1 時開啟（sid 為唯一憑證，見模組說明）
+SESSION_PERSISTENCE = os.environ.get("RECOMMENDER_SESSION_PERSISTENCE", "0") == "1"
+
+# Session 狀態資料庫（SQLite，多個伺服器行程可共用）
+SESSION_DB_PATH = os.environ.get("RECOMMENDER_SESSION_DB", "sessions.sqlite3")
+
+# 批次寫入的時間間隔（秒）；重新整理若發生在寫入前，同一行程內仍可由尚未寫入的狀態還原
+SESSION_FLUSH_SECONDS = 1
+
+# 超過此天數未更新的 session 狀態會被刪除（保存的級分資料保留期限）
+SESSION_RETENTION_DAYS = 14
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    updated REAL NOT NULL,
+    state BLOB NOT NULL,
+    pools BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+"""
+
+def connect(db_path=SESSION_DB_PATH):
+    """開啟 session 狀態資料庫（WAL 模式：寫入時不阻擋其他行程讀取）"""
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def snapshot(version, user_input, shown_items, available_pools, removed_items, warnings):
+    """
+    取出要保存的狀態（只複製 id、uid 等小型資料；bitset 為唯讀共用陣列，直接引用）。
+    在畫面重跑中呼叫，之後 session_state 再變動也不影響已登記的內容
+    """
+    return {
+        "version": version,
+        "user_input": user_input,
+        "shown": {
+            stype: [
+                [item["id"], item["uid"], item["probability"]] if "probability" in item else [item["id"], item["uid"]]
+                for item in items
+            ]
+            for stype, items in shown_items.items()
+        },
+        "pools": {
+            stype: {"bits": pool["bits"], "cursor": int(pool["cursor"]), "remaining": int(pool["remaining"])}
+            for stype, pool in available_pools.items()
+        },
+        "removed": {stype: list(ids) for stype, ids in removed_items.items()},
+        "warnings": list(warnings),
+    }
+
+def encode(state):
+    """轉為資料庫的一列：(version, state, pools)"""
+    pools = state["pools"]
+    meta = {key: value for key, value in state.items() if key != "pools"}
+    meta["pools"] = {stype: [pool["cursor"], pool["remaining"]] for stype, pool in pools.items()}
+    bits = b"".join(np.ascontiguousarray(pools[stype]["bits"]).tobytes() for stype in recommender.STRATEGY_TYPES)
+    return (
+        state["version"],
+        zlib.compress(json.dumps(meta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")),
+        zlib.compress(bits),
+    )
+
+def decode(state_blob, pools_blob):
+    """encode 的反向：bitset 還原為唯讀的 np.uint8 陣列"""
+    meta = json.loads(zlib.decompress(state_blob))
+    bits = np.frombuffer(zlib.decompress(pools_blob), dtype=np.uint8)
+    width = len(bits) // len(recommender.STRATEGY_TYPES)
+    pools = {}
+    for k, stype in enumerate(recommender.STRATEGY_TYPES):
+        cursor, remaining = meta["pools"][stype]
+        pools[stype] = {"bits": bits[k * width:(k + 1) * width], "cursor": cursor, "remaining": remaining}
+    meta["pools"] = pools
+    return meta
+
+class SessionStore:
+    """
+    Session 狀態的存取（執行緒安全）：
+    • save()：登記 session 的最新狀態（不寫入資料庫）
+    • load()：讀取 session 的狀態，尚未寫入的優先
+    • flush()：將登記的狀態整批寫入資料庫；寫入失敗時放回（期間已有更新狀態的 session 除外）
+    • start_flushing()：背景執行緒每 interval 秒 flush 一次；行程結束時也會 flush
+    """
+
+    def __init__(self, db_path=SESSION_DB_PATH, retention_days=SESSION_RETENTION_DAYS):
+        self.db_path = db_path
+        self.retention_seconds = retention_days * 86400
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._conn = connect(db_path)
+        self._flusher = None
+        atexit.register(self.flush)
+
+    def save(self, sid, state):
+        """登記 session 的最新狀態（state 由 snapshot() 取得）"""
+        with self._lock:
+            self._pending[sid] = (time.time(), state)
+        METRICS.inc("recommender_session_saves_total")
+
+    def load(self, sid):
+        """回傳 session 的狀態（與 snapshot() 相同的結構），沒有紀錄時回傳 None"""
+        with self._lock:
+            pending = self._pending.get(sid)
+        if pending is not None:
+            return pending[1]
+        with self._write_lock:
+            row = self._conn.execute("SELECT state, pools FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        if row is None:
+            return None
+        return decode(*row)
+
+    def flush(self):
+        """將登記的狀態以單一交易寫入資料庫，並刪除過期的紀錄；回傳寫入的 session 數（寫入失敗時回傳 0）"""
+        # 取出與寫入都在 _write_lock 內：load() 不會在兩者之間讀到舊的紀錄
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+            start = time.perf_counter()
+            rows = []
+            for sid, (updated, state) in pending.items():
+                version, state_blob, pools_blob = encode(state)
+                rows.append((sid, version, updated, state_blob, pools_blob))
+            try:
+                self._write(rows)
+            except sqlite3.Error as e:
+                self._requeue(pending)
+                logger.error(f"寫入 session 狀態失敗，{len(rows)} 個 session 的狀態保留到下一次寫入：{str(e)}")
+                return 0
+        METRICS.observe("recommender_session_flush_seconds", time.perf_counter() - start)
+        logger.debug(f"已寫入 {len(rows)} 個 session 的狀態")
+        return len(rows)
+
+    def _write(self, rows):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (sid) DO UPDATE SET version = excluded.version, updated = excluded.updated, "
+                "state = excluded.state, pools = excluded.pools "
+                "WHERE excluded.updated >= sessions.updated",
+                rows,
+            )
+            self._conn.execute("DELETE FROM sessions WHERE updated < ?", (time.time() - self.retention_seconds,))
+
+    def _requeue(self, pending):
+        """寫入失敗時把取出的狀態放回；期間又呼叫過 save() 的 session 保留較新的狀態"""
+        with self._lock:
+            for sid, entry in pending.items():
+                current = self._pending.get(sid)
+                if current is None or current[0] < entry[0]:
+                    self._pending[sid] = entry
+
+    def start_flushing(self, interval=SESSION_FLUSH_SECONDS):
+        """啟動背景寫入執行緒"""
+        if self._flusher is not None:
+            return
+        self._flusher = threading.Thread(target=self._flush_loop, args=(interval,), name="session-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            self.flush()
@@ -0,0 +1,392 @@
+"""
+共享記憶體資料集：同一台主機上的多個伺服器行程共用一份已解析的資料集。
+
+發布端（每台主機一個）解析 programs.csv，將數值陣列（門檻矩陣、點陣索引、搜尋索引）與字串表
+寫入一塊 multiprocessing.shared_memory，並把區塊名稱寫入指標檔（programs.csv.shm）；
+CSV 變動時發布新區塊、更新指標檔，舊區塊在寬限時間後移除。
+
+工作行程設定 RECOMMENDER_SHARED_CATALOG=<指標檔路徑> 後改以 SharedCatalogStore 附加（attach）：
+陣列為直接指向共享記憶體的唯讀 numpy 檢視，科系紀錄（Program）在取用時才由字串表組出，
+不複製資料，因此每個工作行程的 RSS 幾乎不隨資料集大小與工作行程數增加。
+
+用法：
+  python shared_catalog.py publish                 # 發布並持續監看 programs.csv
+  RECOMMENDER_SHARED_CATALOG=programs.csv.shm streamlit run app.py
+"""
+import os
+import sys
+import json
+import time
+import signal
+import struct
+import logging
+import argparse
+import operator
+import itertools
+import tempfile
+from collections.abc import Sequence
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import recommender
+
+logger = logging.getLogger(__name__)
+
+# 工作行程附加的指標檔；未設定時各行程自行載入資料集
+SHARED_CATALOG_POINTER = os.environ.get("RECOMMENDER_SHARED_CATALOG", "")
+
+POINTER_SUFFIX = ".shm"
+
+# 共享記憶體區塊名稱前綴（後接資料集版本）
+SEGMENT_PREFIX = "recommender-catalog"
+
+# 發布新版本後，舊區塊保留的秒數（需大於工作行程的監看間隔，讓它們有時間改附加新區塊）
+RETIRE_GRACE_SECONDS = 60
+
+# 陣列在區塊中的對齊位元組數
+ALIGNMENT = 64
+
+# 標頭長度欄位的格式（區塊開頭的 8 位元組，其後為 JSON 標頭）
+HEADER_LENGTH = struct.Struct("<Q")
+
+# 同一發布行程內的區塊序號（版本改回舊內容時，新區塊名稱也不會與寬限期中的舊區塊相同）
+_segment_counter = itertools.count()
+
+# 本行程發布的區塊名稱（附加自己發布的區塊時不取消登錄，見 _open_segment）
+_published = set()
+
+def _to_number(value):
+    """門檻與總分在矩陣中為 float64，還原為與 parse_programs 相同的 int（非整數時保留 float）"""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+def _encode_strings(strings):
+    """字串欄位 → (UTF-8 位元組陣列, 起訖位移陣列)"""
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _codes(values):
+    """重複度高的字串 → (代碼陣列, 不重複值清單)"""
+    table = {}
+    codes = np.array([table.setdefault(v, len(table)) for v in values], dtype=np.int32)
+    return codes, list(table)
+
+def _flatten(catalog):
+    """將 catalog 拆成 (陣列 dict, 可 JSON 序列化的中繼資料)"""
+    programs = catalog["programs"]
+    matrix = catalog["matrix"]
+    index = catalog["index"]
+    groups = sorted(index["group"])
+    schools = sorted(index["school"])
+    school_codes, school_table = _codes(p.school for p in programs)
+    group_codes, group_table = _codes(p.group for p in programs)
+    subject_codes, subject_table = _codes(p.raw_subjects for p in programs)
+    name_blob, name_offsets = _encode_strings(p.program_name for p in programs)
+    dept_blob, dept_offsets = _encode_strings(p.dept for p in programs)
+    requirement_blob, requirement_offsets = _encode_strings(catalog["reasons"]["requirement_str"])
+    search = catalog["search"]
+    search_text_blob, search_text_offsets = _encode_strings(search["text"])
+
+    nbytes = len(index["all"])
+    arrays = {
+        "thresholds": matrix["thresholds"],
+        "required": matrix["required"],
+        "score": matrix["score"],
+        "n_required": matrix["n_required"],
+        "order": index["order"],
+        "all": index["all"],
+        "required_bits": index["required"],
+        "meets": index["meets"],
+        "group_bits": np.stack([index["group"][g] for g in groups]) if groups else np.zeros((0, nbytes), np.uint8),
+        "school_bits": np.stack([index["school"][s] for s in schools]) if schools else np.zeros((0, nbytes), np.uint8),
+        "school_codes": school_codes,
+        "group_codes": group_codes,
+        "subject_codes": subject_codes,
+        "name_blob": name_blob,
+        "name_offsets": name_offsets,
+        "dept_blob": dept_blob,
+        "dept_offsets": dept_offsets,
+        "requirement_blob": requirement_blob,
+        "requirement_offsets": requirement_offsets,
+        "search_keys": search["keys"],
+        "search_offsets": search["offsets"],
+        "search_postings": search["postings"],
+        "search_text_blob": search_text_blob,
+        "search_text_offsets": search_text_offsets,
+        "search_prefix": search["prefix"],
+        "search_name_length": search["name_length"],
+        "search_rank": search["rank"],
+    }
+    meta = {
+        "version": catalog["version"],
+        "n": index["n"],
+        "school_list": catalog["school_list"],
+        "group_options": catalog["group_options"],
+        "index_groups": groups,
+        "index_schools": schools,
+        "school_table": school_table,
+        "group_table": group_table,
+        "subject_table": [list(raw) for raw in subject_table],
+    }
+    return arrays, meta
+
+def publish(catalog, name=None):
+    """
+    將 catalog 寫入新的共享記憶體區塊，回傳 SharedMemory（呼叫端為擁有者，負責 close / unlink）。
+    區塊內容：8 位元組標頭長度、JSON 標頭（中繼資料與各陣列的位移、型別、形狀）、對齊後的陣列資料
+    """
+    arrays, meta = _flatten(catalog)
+    layout = {}
+    offset = 0
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[key] = array
+        layout[key] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+    header = json.dumps({"meta": meta, "arrays": layout}, ensure_ascii=False).encode("utf-8")
+    data_start = -(-(HEADER_LENGTH.size + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    name = name or f"{SEGMENT_PREFIX}-{catalog['version'][:16]}-{os.getpid()}-{next(_segment_counter)}"
+    shm = SharedMemory(name=name, create=True, size=max(data_start + offset, 1))
+    _published.add(shm.name)
+    HEADER_LENGTH.pack_into(shm.buf, 0, len(header))
+    shm.buf[HEADER_LENGTH.size:HEADER_LENGTH.size + len(header)] = header
+    for key, array in arrays.items():
+        start = data_start + layout[key]["offset"]
+        shm.buf[start:start + array.nbytes] = array.reshape(-1).view(np.uint8)
+    logger.info(f"已發布共享資料集 {name}（{shm.size / 1024 / 1024:.1f} MB，{meta['n']} 個科系）")
+    return shm
+
+def _open_segment(name):
+    """附加既有區塊，不交給 resource_tracker 管理（否則工作行程結束時會把共用的區塊刪除）"""
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.13 以前沒有 track 參數：附加後立即取消登錄（不替換模組層級的函式，其他執行緒不受影響）。
+        # resource_tracker 以名稱登錄，同一行程附加自己發布的區塊時登錄屬於發布端，不可取消
+        shm = SharedMemory(name=name)
+        if shm.name not in _published:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class _StringColumn(Sequence):
+    """共享記憶體中的字串欄位（取用時才解碼）"""
+
+    def __init__(self, blob, offsets):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        i = operator.index(i)
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+class _SubjectColumns(Sequence):
+    """各科系必填科目在門檻矩陣中的欄位（對應 reasons["subject_cols"]）"""
+
+    def __init__(self, codes, subject_sets):
+        self._codes = codes
+        self._cols = [cols for _, _, cols in subject_sets]
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __getitem__(self, i):
+        return self._cols[self._codes[operator.index(i)]]
+
+class SharedProgramTable(Sequence):
+    """
+    共享記憶體中的科系清單：行為與 catalog["programs"]（tuple of Program）相同，
+    取用時才由字串表與門檻矩陣組出 Program，不在每個行程常駐 Python 物件
+    """
+
+    def __init__(self, arrays, meta):
+        self._n = meta["n"]
+        self._names = _StringColumn(arrays["name_blob"], arrays["name_offsets"])
+        self._depts = _StringColumn(arrays["dept_blob"], arrays["dept_offsets"])
+        self._school_codes = arrays["school_codes"]
+        self._group_codes = arrays["group_codes"]
+        self._subject_codes = arrays["subject_codes"]
+        self._thresholds = arrays["thresholds"]
+        self._score = arrays["score"]
+        self._schools = [sys.intern(s) for s in meta["school_table"]]
+        self._groups = [sys.intern(g) for g in meta["group_table"]]
+        self.subject_sets = []
+        for raw in meta["subject_table"]:
+            raw_subjects = tuple(sys.intern(k) for k in raw)
+            required_subjects = tuple(sys.intern(recommender.SUBJECT_MAPPING.get(k, k)) for k in raw_subjects)
+            cols = tuple(recommender.SUBJECT_INDEX[subj] for subj in required_subjects)
+            self.subject_sets.append((raw_subjects, required_subjects, cols))
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._n))]
+        i = operator.index(i)
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError("科系 id 超出範圍")
+        raw_subjects, required_subjects, cols = self.subject_sets[self._subject_codes[i]]
+        return recommender.Program(
+            id=i,
+            program_name=self._names[i],
+            school=self._schools[self._school_codes[i]],
+            dept=self._depts[i],
+            group=self._groups[self._group_codes[i]],
+            raw_subjects=raw_subjects,
+            required_subjects=required_subjects,
+            thresholds=tuple(_to_number(self._thresholds[i, col]) for col in cols),
+            score=_to_number(self._score[i]),
+        )
+
+def attach(name):
+    """
+    附加共享資料集，回傳與 load_catalog 相同結構的 catalog（陣列皆為唯讀的零複製檢視）。
+    SharedMemory 物件保存在 catalog["shared_memory"]，catalog 存活期間區塊保持映射。
+    """
+    shm = _open_segment(name)
+    (header_length,) = HEADER_LENGTH.unpack_from(shm.buf, 0)
+    header = json.loads(bytes(shm.buf[HEADER_LENGTH.size:HEADER_LENGTH.size + header_length]).decode("utf-8"))
+    meta = header["meta"]
+    data_start = -(-(HEADER_LENGTH.size + header_length) // ALIGNMENT) * ALIGNMENT
+
+    arrays = {}
+    for key, spec in header["arrays"].items():
+        array = np.ndarray(tuple(spec["shape"]), dtype=np.dtype(spec["dtype"]), buffer=shm.buf, offset=data_start + spec["offset"])
+        array.setflags(write=False)
+        arrays[key] = array
+
+    programs = SharedProgramTable(arrays, meta)
+    groups = {program_group for program_group in meta["group_table"]}
+    return {
+        "programs": programs,
+        "school_list": meta["school_list"],
+        "group_options": meta["group_options"],
+        "matrix": {
+            "thresholds": arrays["thresholds"],
+            "required": arrays["required"],
+            "score": arrays["score"],
+            "n_required": arrays["n_required"],
+        },
+        "index": {
+            "n": meta["n"],
+            "order": arrays["order"],
+            "all": arrays["all"],
+            "group": dict(zip(meta["index_groups"], arrays["group_bits"])),
+            "school": dict(zip(meta["index_schools"], arrays["school_bits"])),
+            "required": arrays["required_bits"],
+            "meets": arrays["meets"],
+        },
+        "reasons": {
+            "requirement_str": _StringColumn(arrays["requirement_blob"], arrays["requirement_offsets"]),
+            "subject_cols": _SubjectColumns(arrays["subject_codes"], programs.subject_sets),
+            "templates": {
+                group: recommender.REASON_TEMPLATES.get(group, recommender.REASON_TEMPLATES["default"]) for group in groups
+            },
+        },
+        "search": {
+            "keys": arrays["search_keys"],
+            "offsets": arrays["search_offsets"],
+            "postings": arrays["search_postings"],
+            "text": _StringColumn(arrays["search_text_blob"], arrays["search_text_offsets"]),
+            "prefix": arrays["search_prefix"],
+            "name_length": arrays["search_name_length"],
+            "rank": arrays["search_rank"],
+        },
+        "row_cache": {},
+        "version": meta["version"],
+        "shared_memory": shm,
+    }
+
+def read_pointer(pointer_path):
+    with open(pointer_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def write_pointer(pointer_path, name, version):
+    """以暫存檔＋os.replace 原子更新指標檔"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(pointer_path)), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"name": name, "version": version}, f)
+    # mkstemp 建立的檔案權限為 0600：改為 0644，其他帳號執行的工作行程才讀得到指標檔
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, pointer_path)
+
+class SharedCatalogStore(recommender.CatalogStore):
+    """
+    工作行程端的資料集存放處：介面與 CatalogStore 相同，但監看的是指標檔，
+    發布端更新指標檔時改附加新區塊（原本的 catalog 仍可由持有者繼續使用）
+    """
+
+    def __init__(self, pointer_path=SHARED_CATALOG_POINTER):
+        super().__init__(pointer_path)
+
+    def _load(self, previous=None):
+        pointer = read_pointer(self.csv_path)
+        catalog = attach(pointer["name"])
+        logger.info(f"已附加共享資料集 {pointer['name']}（版本 {catalog['version'][:12]}）")
+        return catalog
+
+def open_store():
+    """依 RECOMMENDER_SHARED_CATALOG 決定附加共享資料集或自行載入（指標檔無法附加時退回自行載入）"""
+    if SHARED_CATALOG_POINTER:
+        try:
+            return SharedCatalogStore(SHARED_CATALOG_POINTER)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"無法附加共享資料集 {SHARED_CATALOG_POINTER}，改為自行載入：{str(e)}")
+    return recommender.CatalogStore()
+
+def run_publisher(csv_path, pointer_path, interval):
+    """發布資料集並持續監看 CSV；新版本發布後，舊區塊於 RETIRE_GRACE_SECONDS 後移除"""
+    store = recommender.CatalogStore(csv_path)
+    current = publish(store.current())
+    write_pointer(pointer_path, current.name, store.current()["version"])
+    retiring = []
+    try:
+        while True:
+            time.sleep(interval)
+            if store.refresh():
+                segment = publish(store.current())
+                write_pointer(pointer_path, segment.name, store.current()["version"])
+                retiring.append((time.monotonic() + RETIRE_GRACE_SECONDS, current))
+                current = segment
+            while retiring and retiring[0][0] <= time.monotonic():
+                _, old = retiring.pop(0)
+                old.close()
+                old.unlink()
+                logger.info(f"已移除舊的共享資料集 {old.name}")
+    finally:
+        for _, old in retiring:
+            old.close()
+            old.unlink()
+        current.close()
+        current.unlink()
+        if os.path.exists(pointer_path) and read_pointer(pointer_path)["name"] == current.name:
+            os.remove(pointer_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="將資料集發布到共享記憶體，供同主機的多個伺服器行程共用")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    publish_parser = subparsers.add_parser("publish", help="發布並持續監看 CSV")
+    publish_parser.add_argument("--catalog", default=recommender.PROGRAMS_CSV_PATH, help="校系資料 CSV")
+    publish_parser.add_argument("--pointer", help="指標檔路徑（預設為 CSV 路徑加上 .shm）")
+    publish_parser.add_argument("--interval", type=float, default=recommender.CATALOG_WATCH_INTERVAL or 5, help="監看間隔（秒）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # 由 systemd / docker 停止時（SIGTERM）同樣移除區塊與指標檔
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        run_publisher(args.catalog, args.pointer or args.catalog + POINTER_SUFFIX, args.interval)
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
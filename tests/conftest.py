@@ -0,0 +1,32 @@
+"""共用的測試資料：以 repo 內的 programs.csv 建立資料集，以及隨機學生輸入"""
+import os
+import sys
+import random
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import recommender  # noqa: E402
+
+@pytest.fixture(scope="session")
+def catalog():
+    """直接解析 programs.csv（不讀寫磁碟快照）"""
+    df = pd.read_csv(os.path.join(ROOT, recommender.PROGRAMS_CSV_PATH), encoding="utf-8-sig")
+    return recommender.parse_programs(df, version="test")
+
+def random_user_input(catalog, rng):
+    """隨機學生輸入（科目、級分、學群、學校），志願分配固定為 2/2/2"""
+    subjects = [subj for subj in recommender.SUBJECT_COLUMNS if rng.random() < 0.7] or ["英文"]
+    return {
+        "scores": {subj: rng.randint(0, 15) for subj in subjects},
+        "selected_subjects": subjects,
+        "interests": rng.sample(catalog["group_options"], rng.randint(0, 3)),
+        "school": rng.choice(catalog["school_list"]) if rng.random() < 0.2 else "全部學校",
+        "strategy_allocation": {"保守型": 2, "務實型": 2, "夢幻型": 2},
+    }
+
+@pytest.fixture
+def rng():
+    return random.Random(0)
@@ -0,0 +1,33 @@
+"""batch_recommend 的學生資料驗證與 JSON API（api_server.parse_user_input）一致，資料有誤的學生輸出錯誤列"""
+import pytest
+import api_server
+import batch_recommend
+
+def test_valid_row(catalog):
+    row = {"國": "13", "英文": "12.0", "interests": "資訊、醫藥衛生", "保守型": "1", "務實型": "2", "夢幻型": "3"}
+    user_input = batch_recommend.build_user_input(row, catalog)
+    assert user_input["scores"] == {"國文": 13, "英文": 12}
+    assert user_input["interests"] == ["資訊", "醫藥衛生"]
+    assert user_input["school"] == "全部學校"
+    assert user_input["strategy_allocation"] == {"保守型": 1, "務實型": 2, "夢幻型": 3}
+
+@pytest.mark.parametrize("row", [
+    {"國文": "12.5"},
+    {"國文": "16"},
+    {"國文": "-1"},
+    {"國文": "abc"},
+    {"國文": "12", "school": "不存在的大學"},
+    {"國文": "12", "保守型": "1.5", "務實型": "2", "夢幻型": "2"},
+    {"國文": "12", "保守型": "-1", "務實型": "4", "夢幻型": "3"},
+    {"國文": "12", "保守型": "3"},
+    {"國文": "12", "保守型": "x"},
+])
+def test_invalid_row(catalog, row):
+    with pytest.raises(api_server.BadRequest):
+        batch_recommend.build_user_input(row, catalog)
+
+def test_invalid_row_reports_error(catalog, monkeypatch):
+    monkeypatch.setattr(batch_recommend, "_worker_catalog", catalog)
+    assert batch_recommend.recommend_row(("s1", {"國文": "12.5"})) == [{"id": "s1", "error": "國文 的級分必須是 0–15 的整數"}]
+    rows = batch_recommend.recommend_row(("s2", {"國文": "12", "英文": "13"}))
+    assert rows and all(row["id"] == "s2" and "error" not in row for row in rows)
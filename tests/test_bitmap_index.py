@@ -0,0 +1,71 @@
+"""點陣索引（query_bitmap_index / take_from_pool）與逐科系直接判斷的結果一致"""
+import numpy as np
+import recommender
+from conftest import random_user_input
+
+def brute_force_pools(catalog, user_input):
+    """逐科系判斷三個候選池（依推薦排序）與缺科統計"""
+    scores = user_input["scores"]
+    groups = user_input["interests"]
+    school = user_input["school"]
+    pools = {stype: [] for stype in recommender.STRATEGY_TYPES}
+    missing_log = {}
+    ranked = sorted(catalog["programs"], key=lambda p: (-p.score, -len(p.required_subjects), p.id))
+    for program in ranked:
+        if groups and program.group not in groups:
+            continue
+        if school != "全部學校" and program.school != school:
+            continue
+        missing = [subj for subj in program.required_subjects if subj not in scores]
+        for subj in missing:
+            missing_log[subj] = missing_log.get(subj, 0) + 1
+        if missing:
+            continue
+        margins = [scores[subj] - threshold for subj, threshold in zip(program.required_subjects, program.thresholds)]
+        if min(margins, default=0) < 0:
+            pools["夢幻型"].append(program.id)
+        elif min(margins, default=2) >= 2:
+            pools["保守型"].append(program.id)
+        else:
+            pools["務實型"].append(program.id)
+    return pools, missing_log
+
+def test_pools_match_brute_force(catalog, rng):
+    index = catalog["index"]
+    for _ in range(300):
+        user_input = random_user_input(catalog, rng)
+        *bits, missing_log = recommender.query_bitmap_index(
+            index, user_input["interests"], user_input["school"], user_input["scores"]
+        )
+        expected, expected_missing = brute_force_pools(catalog, user_input)
+        for stype, pool_bits in zip(recommender.STRATEGY_TYPES, bits):
+            ids, cursor = recommender.take_from_pool(index, pool_bits, 0)
+            assert ids.tolist() == expected[stype], (stype, user_input)
+            assert cursor == index["n"]
+        assert missing_log == expected_missing
+
+def test_take_from_pool_in_steps_matches_full_scan(catalog, rng):
+    index = catalog["index"]
+    for _ in range(50):
+        user_input = random_user_input(catalog, rng)
+        for pool_bits in recommender.query_bitmap_index(index, [], "全部學校", user_input["scores"])[:3]:
+            full, _ = recommender.take_from_pool(index, pool_bits, 0)
+            taken = []
+            cursor = 0
+            while True:
+                ids, cursor = recommender.take_from_pool(index, pool_bits, cursor, rng.randint(1, 7))
+                if not len(ids):
+                    break
+                taken.extend(ids.tolist())
+            assert taken == full.tolist()
+            assert recommender._popcount(pool_bits) == len(full)
+
+def test_generate_recommendations_takes_pool_heads(catalog, rng):
+    for _ in range(50):
+        user_input = random_user_input(catalog, rng)
+        result = recommender.generate_recommendations(catalog, user_input)
+        expected, _ = brute_force_pools(catalog, user_input)
+        for stype in recommender.STRATEGY_TYPES:
+            count = user_input["strategy_allocation"][stype]
+            assert [item["id"] for item in result["recommendations"][stype]] == expected[stype][:count]
+            assert result["pools"][stype]["size"] == len(expected[stype])
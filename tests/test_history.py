@@ -0,0 +1,47 @@
+"""歷年門檻：原始格式與正規化格式的年度檔案解析結果相同，無法讀取的年度略過；畫面端的載入不阻擋重跑"""
+import os
+import sys
+import threading
+import pandas as pd
+import history
+import warmup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import convert_catalog  # noqa: E402
+
+def test_wide_and_raw_years_match(catalog, tmp_path):
+    df = pd.read_csv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "programs.csv"), encoding="utf-8-sig")
+    df.to_csv(tmp_path / "programs_110.csv", index=False)
+    convert_catalog.convert(df).to_csv(tmp_path / "programs_111.csv", index=False)
+    bad = convert_catalog.convert(df).astype(object)
+    bad.loc[3, "國"] = "abc"
+    bad.loc[4, "英"] = 12.5
+    bad.to_csv(tmp_path / "programs_112.csv", index=False)
+    pd.DataFrame({"foo": [1]}).to_csv(tmp_path / "programs_113.csv", index=False)
+    (tmp_path / "programs_114.csv").write_bytes(b"program_name,expanded_score_dict\n\xff\xfe,x\n")
+
+    for chunk_rows in (50, history.HISTORY_CHUNK_ROWS):
+        result = history.load_history(catalog["programs"], str(tmp_path), workers=1, chunk_rows=chunk_rows)
+        assert result["years"] == (110, 111, 112)
+        raw, wide, broken = result["thresholds"]
+        assert (raw == wide).all()
+        # 含無法轉為數字或非整數儲存格的列整列無效，其餘列不受影響
+        name_to_id = {program.program_name: program.id for program in catalog["programs"]}
+        expected = sorted(name_to_id[bad.loc[i, "program_name"]] for i in (3, 4))
+        assert (wide != broken).any(axis=1).nonzero()[0].tolist() == expected
+        assert (broken[expected] == history.MISSING_THRESHOLD).all()
+
+def test_program_history_does_not_block(catalog, monkeypatch):
+    release = threading.Event()
+
+    def slow_load(programs):
+        release.wait(10)
+        raise OSError("disk error")
+
+    monkeypatch.setattr(history, "load_history", slow_load)
+    monkeypatch.setattr(warmup, "_history_by_version", type(warmup._history_by_version)())
+    assert warmup.program_history(catalog) is None
+    release.set()
+    # 載入失敗時以 None 完成，不重試、不拋出例外
+    assert warmup.program_history(catalog, wait=True) is None
+    assert warmup.program_history(catalog) is None
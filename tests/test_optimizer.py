@@ -0,0 +1,85 @@
+"""optimize_portfolio 的動態規劃與小型候選池上的窮舉結果一致"""
+import itertools
+import numpy as np
+import pytest
+import recommender
+from conftest import random_user_input
+
+def expected_best_value(values, probabilities):
+    """窮舉所有錄取結果，計算「錄取者中最大價值」的期望值（各科系獨立）"""
+    expected = 0.0
+    for admitted in itertools.product((False, True), repeat=len(values)):
+        chance = 1.0
+        best = 0.0
+        for value, probability, hit in zip(values, probabilities, admitted):
+            chance *= probability if hit else 1 - probability
+            if hit:
+                best = max(best, value)
+        expected += chance * best
+    return expected
+
+def program_stats(catalog, program_id, scores):
+    program = catalog["programs"][program_id]
+    margin = min(scores[subj] - threshold for subj, threshold in zip(program.required_subjects, program.thresholds))
+    return program.score, float(recommender.admission_probability(margin))
+
+def small_pools(catalog, user_input, rng):
+    """從學生的三個候選池各隨機取至多 5 個科系，組成小型候選池的 bitset"""
+    index = catalog["index"]
+    pools = recommender.query_bitmap_index(index, [], "全部學校", user_input["scores"])[:3]
+    pool_bits = {}
+    for stype, bits in zip(recommender.STRATEGY_TYPES, pools):
+        positions = np.flatnonzero(np.unpackbits(bits, count=index["n"]))
+        chosen = rng.sample(positions.tolist(), min(len(positions), rng.randint(0, 5)))
+        mask = np.zeros(index["n"], dtype=bool)
+        mask[chosen] = True
+        pool_bits[stype] = np.packbits(mask)
+    return pool_bits
+
+def test_matches_exhaustive_search(catalog, rng):
+    index = catalog["index"]
+    checked = 0
+    while checked < 300:
+        user_input = random_user_input(catalog, rng)
+        scores = user_input["scores"]
+        allocation = {stype: rng.randint(0, 2) for stype in recommender.STRATEGY_TYPES}
+        pool_bits = small_pools(catalog, user_input, rng)
+        pools = {stype: recommender.take_from_pool(index, bits, 0)[0].tolist() for stype, bits in pool_bits.items()}
+        targets = {stype: min(allocation[stype], len(pools[stype])) for stype in recommender.STRATEGY_TYPES}
+        if not any(targets.values()):
+            continue
+        checked += 1
+
+        best = max(
+            expected_best_value(*zip(*[program_stats(catalog, pid, scores) for pid in itertools.chain(*combo)]))
+            for combo in itertools.product(*(
+                itertools.combinations(pools[stype], targets[stype]) for stype in recommender.STRATEGY_TYPES
+            ))
+        )
+        result = recommender.optimize_portfolio(catalog, pool_bits, scores, allocation)
+        assert result["expected_utility"] == pytest.approx(best, rel=1e-9, abs=1e-9)
+
+        chosen = []
+        for stype in recommender.STRATEGY_TYPES:
+            ids = result["ids"][stype].tolist()
+            assert len(ids) == targets[stype]
+            assert set(ids) <= set(pools[stype])
+            chosen.extend(ids)
+            # 選中的科系從遞補用的 bitset 移除，其餘依原排序保留
+            remaining, _ = recommender.take_from_pool(index, result["remaining_bits"][stype], 0)
+            assert remaining.tolist() == [pid for pid in pools[stype] if pid not in ids]
+        assert expected_best_value(*zip(*[program_stats(catalog, pid, scores) for pid in chosen])) == pytest.approx(best)
+
+def test_engine_optimize_mode_refills_without_duplicates(catalog, rng):
+    index = catalog["index"]
+    for _ in range(30):
+        user_input = {**random_user_input(catalog, rng), "optimize": True}
+        result = recommender.generate_recommendations(catalog, user_input)
+        for stype in recommender.STRATEGY_TYPES:
+            items = result["recommendations"][stype]
+            pool = result["pools"][stype]
+            assert len(items) == min(user_input["strategy_allocation"][stype], pool["size"])
+            assert all(0 < item["probability"] < 1 for item in items)
+            refill, _ = recommender.take_from_pool(index, pool["bits"], pool["cursor"])
+            assert not {item["id"] for item in items} & set(refill.tolist())
+            assert len(refill) + len(items) == pool["size"]
@@ -0,0 +1,52 @@
+"""search_programs（n-gram 索引）與逐科系子字串比對加完整排序的結果一致；classify_programs 與候選池一致"""
+import recommender
+from conftest import random_user_input
+
+def brute_force_search(catalog, query, limit=recommender.SEARCH_LIMIT):
+    terms = [term for term in (recommender.normalize_search_text(part) for part in query.split()) if term]
+    if not terms:
+        return []
+    rank = catalog["search"]["rank"]
+    ranked = []
+    for program in catalog["programs"]:
+        fields = [recommender.normalize_search_text(f) for f in (program.program_name, program.school, program.dept)]
+        if not all(any(term in field for field in fields) for term in terms):
+            continue
+        tier = 0 if fields[2].startswith(terms[0]) else 1 if fields[1].startswith(terms[0]) else 2
+        ranked.append(((tier, len(program.program_name), int(rank[program.id])), program.id))
+    return [pid for _, pid in sorted(ranked)[:limit]]
+
+def random_queries(catalog, rng, count):
+    """由實際校系名稱取子字串組成查詢：1–4 字、一或兩個詞，並混入「臺/台」與全形變體"""
+    programs = catalog["programs"]
+    queries = []
+    for _ in range(count):
+        parts = []
+        for _ in range(rng.choice((1, 1, 2))):
+            text = rng.choice((rng.choice(programs).program_name, rng.choice(programs).school, rng.choice(programs).dept))
+            length = rng.randint(1, 4)
+            start = rng.randint(0, max(len(text) - length, 0))
+            parts.append(text[start:start + length])
+        query = " ".join(parts)
+        if rng.random() < 0.2:
+            query = query.replace("臺", "台")
+        queries.append(query)
+    return queries + ["臺灣大學 外國語文", "ＡＩ", "不存在的校系名稱", "   ", "台"]
+
+def test_search_matches_brute_force(catalog, rng):
+    for query in random_queries(catalog, rng, 300):
+        for limit in (1, 5, recommender.SEARCH_LIMIT):
+            assert recommender.search_programs(catalog, query, limit) == brute_force_search(catalog, query, limit), query
+
+def test_classify_matches_pools(catalog, rng):
+    index = catalog["index"]
+    all_ids = list(range(index["n"]))
+    for _ in range(30):
+        scores = random_user_input(catalog, rng)["scores"]
+        labels = recommender.classify_programs(catalog, all_ids, scores)
+        pools = recommender.query_bitmap_index(index, [], "全部學校", scores)[:3]
+        expected = ["缺少科目"] * index["n"]
+        for stype, bits in zip(recommender.STRATEGY_TYPES, pools):
+            for pid in recommender.take_from_pool(index, bits, 0)[0]:
+                expected[pid] = stype
+        assert labels == expected
@@ -0,0 +1,53 @@
+"""sweep_score_variants 的直方圖累加與逐一變動級分後重新查詢的結果一致"""
+import itertools
+import numpy as np
+import recommender
+from conftest import random_user_input
+
+def pool_sizes(catalog, user_input, scores):
+    pools = recommender.query_bitmap_index(catalog["index"], user_input["interests"], user_input["school"], scores)[:3]
+    return {stype: recommender._popcount(bits) for stype, bits in zip(recommender.STRATEGY_TYPES, pools)}
+
+def reachable_ids(catalog, user_input, scores):
+    """達到門檻（保守型 + 務實型）的科系，依推薦排序"""
+    index = catalog["index"]
+    conservative, realistic = recommender.query_bitmap_index(
+        index, user_input["interests"], user_input["school"], scores
+    )[:2]
+    return recommender.take_from_pool(index, conservative | realistic, 0)[0].tolist()
+
+def test_pool_sizes_match_requery(catalog, rng):
+    for _ in range(40):
+        user_input = random_user_input(catalog, rng)
+        sweep = recommender.sweep_score_variants(catalog, user_input)
+        deltas = sweep["deltas"]
+        subjects = sweep["subjects"]
+        assert sweep["eligible"] == sum(pool_sizes(catalog, user_input, user_input["scores"]).values())
+
+        combos = list(itertools.product(range(len(deltas)), repeat=len(subjects)))
+        for combo in rng.sample(combos, min(len(combos), 25)):
+            variant = {subj: user_input["scores"][subj] + deltas[j] for subj, j in zip(subjects, combo)}
+            in_range = all(0 <= score <= 15 for score in variant.values())
+            assert bool(sweep["valid"][combo]) == in_range
+            if not in_range:
+                continue
+            expected = pool_sizes(catalog, user_input, variant)
+            for stype in recommender.STRATEGY_TYPES:
+                assert int(sweep["pools"][stype][combo]) == expected[stype], (stype, variant, user_input)
+
+def test_unlocked_programs_match_requery(catalog, rng):
+    for _ in range(40):
+        user_input = random_user_input(catalog, rng)
+        sweep = recommender.sweep_score_variants(catalog, user_input)
+        base = set(reachable_ids(catalog, user_input, user_input["scores"]))
+        for subj, by_delta in sweep["unlocked"].items():
+            for delta, (count, top_id) in by_delta.items():
+                if user_input["scores"][subj] + delta > 15:
+                    continue
+                variant = {**user_input["scores"], subj: user_input["scores"][subj] + delta}
+                newly = [pid for pid in reachable_ids(catalog, user_input, variant) if pid not in base]
+                assert count == len(newly)
+                assert top_id == (newly[0] if newly else None)
+
+def test_no_scores_returns_none(catalog):
+    assert recommender.sweep_score_variants(catalog, {"scores": {}}) is None
@@ -0,0 +1,219 @@
+"""
+行程層級資源與啟動預熱。
+
+資料集存放處、推薦結果快取、session 用量紀錄、session 狀態存放處與歷年門檻在每個伺服器行程只建立一份，
+由本模組保存（不依賴 Streamlit 的 runtime），因此可以在 Streamlit 開始接受連線之前就建立。
+
+serve.py 啟動伺服器時先呼叫 start()：背景執行緒載入資料集與各項索引、快取，並以幾組學生輸入
+實際跑過推薦、理由、敏感度分析與校系搜尋（首次呼叫的 numpy 路徑與延遲匯入）；完成前指標伺服器的
+GET /ready 回應 503，完成後回應 200，負載平衡器據此決定何時開始導入流量。
+直接以 streamlit run app.py 啟動時，預熱會在第一個 session 開啟時才開始。
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+import recommender
+import history
+import demand
+import session_store
+import session_metrics
+import shared_catalog
+from instrumentation import METRICS, set_readiness_check, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+# 跨 session 推薦結果快取的筆數上限
+RECOMMENDATION_CACHE_SIZE = 1024
+
+# 歷年門檻保留的資料集版本數（資料集更新期間新舊版本的 session 並存）
+HISTORY_VERSIONS = 2
+
+def process_resource(factory):
+    """每個行程只建立一次的資源（執行緒安全；同時有多個呼叫時，其餘呼叫等待第一個建立完成）"""
+    lock = threading.Lock()
+    instance = []
+
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    get.__name__ = factory.__name__
+    get.__doc__ = factory.__doc__
+    return get
+
+@process_resource
+def catalog_store():
+    """
+    資料集存放處（所有 session 共用，跨行程由磁碟快照加速），並在背景監看 programs.csv，變動時增量重新載入。
+    設定 RECOMMENDER_SHARED_CATALOG 時改為附加發布端放在共享記憶體的資料集（同主機多個伺服器行程共用一份）
+    """
+    store = shared_catalog.open_store()
+    store.start_watching()
+    return store
+
+@process_resource
+def recommendation_cache():
+    """所有 session 共用的推薦結果快取"""
+    return recommender.RecommendationCache(maxsize=RECOMMENDATION_CACHE_SIZE)
+
+@process_resource
+def footprint_registry():
+    """所有 session 共用的記憶體用量紀錄；設定 RECOMMENDER_FOOTPRINT_LOG 時背景定期批次寫入紀錄檔"""
+    registry = session_metrics.SessionFootprintRegistry()
+    registry.start_flushing()
+    return registry
+
+@process_resource
+def demand_counters():
+    """需求統計（RECOMMENDER_DEMAND_ANALYTICS=1 時啟用，否則為 None），背景定期批次寫入"""
+    if not demand.DEMAND_ANALYTICS:
+        return None
+    counters = demand.DemandCounters()
+    counters.start_flushing()
+    return counters
+
+@process_resource
+def session_state_store():
+    """Session 狀態持久化（需設定 RECOMMENDER_SESSION_PERSISTENCE=1，否則為 None），背景定期批次寫入"""
+    if not session_store.SESSION_PERSISTENCE:
+        return None
+    store = session_store.SessionStore()
+    store.start_flushing()
+    return store
+
+_history_lock = threading.Lock()
+_history_by_version = OrderedDict()
+
+def _load_history(programs, future):
+    """背景執行緒：載入歷年門檻；失敗時記錄錯誤並以 None 完成（該版本不再重試，畫面不顯示歷年門檻）"""
+    try:
+        result = history.load_history(programs)
+    except Exception as e:
+        logger.error(f"載入歷年門檻失敗，不顯示歷年門檻：{str(e)}")
+        result = None
+    future.set_result(result)
+
+def program_history(catalog, wait=False):
+    """
+    歷年門檻（對齊該版本資料集的科系 id）；資料集更新後依新版本重新對齊，只保留最近 HISTORY_VERSIONS 個版本。
+    每個版本第一次呼叫時以背景執行緒載入，不在畫面重跑中等待：載入完成前回傳 None（先不顯示歷年門檻）。
+    wait=True 時等待載入完成（預熱用）
+    """
+    version = catalog["version"]
+    with _history_lock:
+        future = _history_by_version.get(version)
+        if future is None:
+            future = _history_by_version[version] = Future()
+            threading.Thread(
+                target=_load_history, args=(catalog["programs"], future), name="history-loader", daemon=True
+            ).start()
+            while len(_history_by_version) > HISTORY_VERSIONS:
+                _history_by_version.popitem(last=False)
+        else:
+            _history_by_version.move_to_end(version)
+    if wait or future.done():
+        return future.result()
+    return None
+
+def sample_inputs(catalog):
+    """預熱用的學生輸入：涵蓋全部/部分科目、有無學群與學校篩選、一般與最佳化模式"""
+    subjects = list(recommender.SUBJECT_COLUMNS)
+    allocation = {"保守型": 2, "務實型": 2, "夢幻型": 2}
+    inputs = []
+    for i, selected in enumerate((subjects, subjects[:2], subjects[:4])):
+        inputs.append({
+            "scores": {subject: 10 + i for subject in selected},
+            "selected_subjects": selected,
+            "interests": catalog["group_options"][i:i + 2],
+            "school": catalog["school_list"][0] if i == 2 and catalog["school_list"] else "全部學校",
+            "strategy_allocation": allocation,
+            "optimize": i == 1,
+        })
+    return inputs
+
+class Warmup:
+    """
+    背景預熱的狀態：state 為 pending → warming → ready 或 failed。
+    預熱失敗時不阻擋服務（資源會在第一個 session 使用時再建立），但就緒檢查維持 503 並回報錯誤
+    """
+
+    def __init__(self):
+        self.state = "pending"
+        self.error = None
+        self.seconds = None
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """啟動背景預熱執行緒（重複呼叫無作用）"""
+        with self._lock:
+            if self.state != "pending":
+                return
+            self.state = "warming"
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            with METRICS.span("warmup"):
+                catalog = catalog_store().current()
+                recommendation_cache()
+                footprint_registry()
+                demand_counters()
+                session_state_store()
+                program_history(catalog, wait=True)
+                # 直接呼叫引擎而非透過共用快取，避免預熱用的輸入占用快取
+                for user_input in sample_inputs(catalog):
+                    result = recommender.generate_recommendations(catalog, user_input)
+                    ids = [item["id"] for items in result["recommendations"].values() for item in items]
+                    recommender.generate_reasons(catalog, ids, user_input)
+                    recommender.sweep_score_variants(catalog, user_input)
+                    recommender.classify_programs(catalog, ids, user_input["scores"])
+                if catalog["programs"]:
+                    recommender.search_programs(catalog, catalog["programs"][0].program_name)
+        except Exception as e:
+            self.error = str(e)
+            self.state = "failed"
+            logger.exception("預熱失敗，資源將在第一個 session 使用時建立")
+            return
+        self.seconds = time.perf_counter() - start
+        self.state = "ready"
+        self.ready.set()
+        logger.info(f"預熱完成，耗時 {self.seconds:.2f} 秒（{len(catalog['programs'])} 個科系，版本 {catalog['version'][:12]}）")
+
+    def status(self):
+        """就緒檢查的回應內容：(是否就緒, JSON 物件)"""
+        payload = {"status": self.state}
+        if self.seconds is not None:
+            payload["warmup_seconds"] = round(self.seconds, 3)
+        if self.error is not None:
+            payload["error"] = self.error
+        return self.ready.is_set(), payload
+
+# 全域預熱狀態
+WARMUP = Warmup()
+
+@process_resource
+def start():
+    """
+    每個行程一次：登錄推薦快取與 session 用量的 gauge 與就緒檢查、啟動指標伺服器，並開始背景預熱。
+    回傳指標伺服器（未啟動時為 None）；指標埠號設為必要（serve.py）但無法綁定時拋出 RuntimeError
+    """
+    cache = recommendation_cache()
+    footprints = footprint_registry()
+    METRICS.register_collector(
+        lambda: {f"recommender_cache_{key}": value for key, value in cache.stats().items()}
+    )
+    METRICS.register_collector(
+        lambda: {f"recommender_session_{key}": value for key, value in footprints.aggregate().items()}
+    )
+    METRICS.register_collector(lambda: {"recommender_ready": int(WARMUP.ready.is_set())})
+    set_readiness_check(WARMUP.status)
+    server = start_metrics_server()
+    WARMUP.start()
+    return server